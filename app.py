@@ -236,11 +236,217 @@ def init_db(drop):
 
 @app.cli.command()
 def check_alerts():
-    """Vérifie et génère les alertes de stock"""
-    from app.utils import generate_stock_alerts
-    alerts = generate_stock_alerts()
+    """Vérifie et génère les alertes de stock (analyse complète)"""
+    from app.alerts import create_stock_alerts
+    alerts = create_stock_alerts()
+    db.session.commit()
     click.echo(f'{alerts} alertes générées.')
 
+@app.cli.command()
+@click.option('--project', 'project_ids', multiple=True, type=int, help='Projet à recalculer (répétable, tous par défaut)')
+def recompute_costs(project_ids):
+    """Recalcule les coûts consolidés des projets (rattrapage en masse)"""
+    from app.projects.costs import refresh_project_costs
+    updated = refresh_project_costs(project_ids or None)
+    db.session.commit()
+    click.echo(f'{updated} projet(s) mis à jour.')
+
+@app.cli.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Valider le fichier sans rien écrire')
+@click.option('--no-update', is_flag=True, help='Refuser les références déjà existantes')
+@click.option('--chunk-size', default=500, help='Lignes par transaction')
+def import_stock(path, dry_run, no_update, chunk_size):
+    """Importe des éléments de stock depuis un fichier CSV ou XLSX"""
+    from app.stock.bulk import StockImportError, iter_file_rows, import_stock_items
+    try:
+        with open(path, 'rb') as stream:
+            report = import_stock_items(iter_file_rows(stream, os.path.basename(path)),
+                                        dry_run=dry_run, update_existing=not no_update,
+                                        chunk_size=chunk_size)
+    except StockImportError as e:
+        raise click.ClickException(str(e))
+    
+    click.echo(f"{'Simulation' if dry_run else 'Import'} : {report.rows} ligne(s), "
+               f"{report.created} création(s), {report.updated} mise(s) à jour, {report.error_count} erreur(s)")
+    for error in report.errors:
+        click.echo(f"  ligne {error['line']}: {error['message']}")
+    if report.aborted:
+        raise click.ClickException(report.aborted)
+
+@app.cli.command()
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+def export_stock(path):
+    """Exporte le stock en CSV ou XLSX (selon l'extension du fichier)"""
+    from app.stock.bulk import StockImportError, export_csv, export_xlsx
+    if path.lower().endswith('.xlsx'):
+        try:
+            export_xlsx(path)
+        except StockImportError as e:
+            raise click.ClickException(str(e))
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as target:
+            for chunk in export_csv():
+                target.write(chunk)
+    click.echo(f'Stock exporté dans {path}')
+
+@app.cli.command()
+@click.option('--type', 'entity_type', type=click.Choice(['stock', 'project', 'task', 'personnel']),
+              help='Ne réindexer qu\'un type d\'entité')
+def reindex_search(entity_type):
+    """Reconstruit l'index de la recherche globale"""
+    from app.search import reindex
+    tokens = reindex(entity_type)
+    db.session.commit()
+    click.echo(f'{tokens} jetons indexés.')
+
+@app.cli.command()
+def snapshot_stock():
+    """Clôture journalière : photographie le niveau de tous les articles"""
+    from app.stock.history import take_snapshot
+    count = take_snapshot()
+    click.echo(f'{count} article(s) photographié(s).')
+
+@app.cli.command()
+def rebuild_mrp():
+    """Recalcule entièrement l'allocation du stock aux tâches ouvertes"""
+    from app.stock.mrp import refresh_material_plan
+    rows = refresh_material_plan()
+    db.session.commit()
+    click.echo(f'{rows} ligne(s) d\'allocation calculée(s).')
+
+@app.cli.command()
+@click.option('--days', default=7, help='Ancienneté minimale des clés supprimées (jours)')
+def purge_stock_requests(days):
+    """Supprime les anciennes clés d'idempotence des mouvements de stock"""
+    from app.stock.ledger import purge_requests
+    deleted = purge_requests(days)
+    click.echo(f'{deleted} clé(s) supprimée(s).')
+
+@app.cli.command()
+@click.option('--once', is_flag=True, help='Traiter les tâches dues puis s\'arrêter')
+@click.option('--batch-size', default=50, help='Tâches réservées à la fois')
+@click.option('--interval', default=5.0, help='Attente entre deux scrutations de la file (secondes)')
+def run_jobs(once, batch_size, interval):
+    """Worker : exécute les tâches de fond (notifications, emails, alertes)"""
+    import time
+    from app.jobs import run_jobs as run_job_batch, worker_name
+    worker = worker_name()
+    click.echo(f'Worker {worker} démarré.')
+    while True:
+        stats = run_job_batch(batch_size, worker)
+        if stats['claimed']:
+            click.echo(f"{stats['done']} tâche(s) terminée(s), {stats['failed']} en échec.")
+        elif once:
+            break
+        else:
+            time.sleep(interval)
+
+@app.cli.command()
+@click.option('--days', default=7, help='Ancienneté minimale des tâches terminées supprimées (jours)')
+def purge_jobs(days):
+    """Supprime les tâches de fond terminées"""
+    from app.jobs import purge_jobs as purge
+    deleted = purge(days)
+    click.echo(f'{deleted} tâche(s) supprimée(s).')
+
+@app.cli.command()
+@click.option('--days', default=None, type=int, help='Ancienneté (jours) des notifications lues à archiver')
+def archive_notifications(days):
+    """Archive par lots les notifications lues anciennes"""
+    from app.notifications import archive_notifications as archive
+    archived = archive(days)
+    click.echo(f'{archived} notification(s) archivée(s).')
+
+@app.cli.command()
+def precompile_templates():
+    """Compile tous les templates et remplit le cache de bytecode (déploiement)"""
+    from jinja2 import TemplateSyntaxError
+    env = app.jinja_env
+    if env.bytecode_cache is None:
+        click.echo('Cache de bytecode désactivé (TEMPLATE_BYTECODE_CACHE) : compilation seule.')
+    
+    errors = 0
+    names = env.list_templates(extensions=['html', 'txt', 'xml'])
+    for name in names:
+        try:
+            env.get_template(name)
+        except TemplateSyntaxError as e:
+            errors += 1
+            click.echo(f'✗ {name}:{e.lineno} : {e.message}', err=True)
+    
+    click.echo(f'{len(names) - errors}/{len(names)} template(s) compilé(s).')
+    if errors:
+        sys.exit(1)
+
+@app.cli.command()
+@click.option('--user', 'username', default=None, help='Utilisateur pour le rejeu (premier administrateur par défaut)')
+@click.option('--path', 'paths', multiple=True, help='Chemin rejoué en plus des pages fréquentes (répétable)')
+@click.option('--min-rows', default=1000, help='Ignorer les parcours estimés sous ce nombre de lignes (MySQL)')
+@click.option('--write-migration', is_flag=True, help='Écrire une révision Alembic pour les index manquants')
+@click.option('--strict', is_flag=True, help='Code de sortie 1 si un parcours complet de table est détecté')
+def index_advisor(username, paths, min_rows, write_migration, strict):
+    """Rejoue les requêtes fréquentes, signale les parcours complets (EXPLAIN) et les index manquants"""
+    from app.index_advisor import ADVISOR_PATHS, analyze, missing_indexes, write_migration as write_revision
+    
+    if username:
+        user = User.query.filter_by(username=username).first()
+    else:
+        user = User.query.join(Role, User.role_id == Role.id).filter(Role.name == 'admin').order_by(User.id).first()
+    if user is None:
+        click.echo('Utilisateur introuvable (option --user).', err=True)
+        sys.exit(1)
+    
+    report = analyze(user, ADVISOR_PATHS + tuple(paths), min_rows=min_rows)
+    failed = [path for path, status in report['statuses'].items() if status >= 400]
+    click.echo(f"{len(report['statuses'])} chemin(s) rejoué(s), {report['queries']} requête(s) distincte(s).")
+    if failed:
+        click.echo(f"Réponses en erreur (non analysées) : {', '.join(failed)}")
+    
+    full_scans = 0
+    for entry in report['findings']:
+        click.echo('')
+        click.echo(f"[{entry['count']}x] {' '.join(entry['statement'].split())[:200]}")
+        click.echo(f"    émise par : {', '.join(entry['paths'])}")
+        for finding in entry['findings']:
+            full_scans += finding['access'] == 'full_scan'
+            click.echo(f"    {finding['access']:<10} {finding['table'] or '-':<22} {finding['detail']}")
+    for error in report['errors']:
+        click.echo(f"EXPLAIN impossible : {error['error']}", err=True)
+    
+    missing, absent_tables = missing_indexes()
+    click.echo('')
+    if absent_tables:
+        click.echo(f"Tables absentes de la base (flask db upgrade) : {', '.join(absent_tables)}")
+    if not missing:
+        click.echo('Tous les index déclarés dans les modèles existent.')
+    for table, name, columns, unique in missing:
+        click.echo(f"Index manquant : {name} sur {table} ({', '.join(columns)}){' unique' if unique else ''}")
+    
+    if write_migration and missing:
+        click.echo(f'Révision écrite : {write_revision(missing)}')
+    if strict and full_scans:
+        sys.exit(1)
+
+@app.cli.command()
+@click.option('--rows', default=200, help='Volume de données injecté dans la base de test')
+@click.option('--max-queries', default=None, type=int,
+              help='Nombre maximal de requêtes par graphique (par défaut : budget déclaré par la source)')
+def bench_charts(rows, max_queries):
+    """Mesure le nombre de requêtes de chaque source de graphique (SQLite en mémoire)"""
+    from app.dashboard.benchmark import run_chart_benchmark
+    results = run_chart_benchmark(rows=rows, max_queries=max_queries)
+    
+    for result in results:
+        status = 'OK' if result['ok'] else 'ÉCHEC'
+        click.echo(f"{result['source']:<20} {result['queries']:>3}/{result['budget']} requête(s) "
+                   f"{result['ms']:>8} ms  {status}")
+    
+    failures = [f"{r['source']} ({r['queries']}/{r['budget']})" for r in results if not r['ok']]
+    if failures:
+        click.echo(f'Sources au-delà de leur budget de requêtes: {", ".join(failures)}')
+        raise SystemExit(1)
+
 @app.cli.command()
 @click.option('--email', prompt=True, help='Email de l\'administrateur')
 @click.password_option(help='Mot de passe de l\'administrateur')
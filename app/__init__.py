@@ -38,16 +38,16 @@ def create_app(config_name='default'):
     from config import config
     app.config.from_object(config[config_name])
     
-    # FORCER le rechargement des templates
-    app.config['TEMPLATES_AUTO_RELOAD'] = True
-    app.jinja_env.auto_reload = True
-    app.jinja_env.cache = None
+    # Chargement des templates (rechargement à chaud en développement seulement)
+    configure_templates(app)
     
     # Initialisation des extensions
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
     csrf.init_app(app)
+    from app.mail import mail
+    mail.init_app(app)
     
     # Configuration de Flask-Login
     login_manager.login_view = 'auth.login'
@@ -71,6 +71,33 @@ def create_app(config_name='default'):
     
     return app
 
+def configure_templates(app):
+    """
+    Mode de chargement des templates
+
+    Hors développement, les templates compilés restent en mémoire (LRU de
+    TEMPLATE_CACHE_SIZE entrées) sans vérification de date, et leur bytecode
+    est conservé sur disque : un worker redémarré ne recompile pas les
+    templates (`flask precompile-templates` le remplit au déploiement).
+    """
+    from jinja2 import FileSystemBytecodeCache
+    from jinja2.utils import LRUCache
+    
+    env = app.jinja_env
+    env.auto_reload = bool(app.config.get('TEMPLATES_AUTO_RELOAD'))
+    env.cache = LRUCache(app.config.get('TEMPLATE_CACHE_SIZE', 400))
+    
+    if not app.config.get('TEMPLATE_BYTECODE_CACHE'):
+        return
+    directory = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    try:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Sans répertoire : dossier temporaire propre à l'utilisateur (Jinja)
+        env.bytecode_cache = FileSystemBytecodeCache(directory)
+    except (OSError, RuntimeError) as e:
+        app.logger.warning(f"Cache de bytecode des templates désactivé : {e}")
+
 def create_folders(app):
     """Crée les dossiers nécessaires s'ils n'existent pas"""
     upload_folder = app.config.get('UPLOAD_FOLDER')
@@ -131,6 +158,9 @@ def register_template_filters(app):
 
 def register_context_processors(app):
     """Enregistre les context processors"""
+    # Importé ici pour enregistrer les écouteurs d'invalidation des compteurs
+    from app.counters import get_navbar_counters
+    
     app.context_processor(inject_today)
     @app.context_processor
     def inject_user():
@@ -142,7 +172,6 @@ def register_context_processors(app):
         """Injecte des variables globales dans tous les templates"""
         from flask_login import current_user
         from datetime import datetime
-        from app.models import Notification, StockItem
         
         data = {
             'current_year': datetime.now().year,
@@ -153,45 +182,30 @@ def register_context_processors(app):
         if current_user.is_authenticated:
             data['current_user'] = current_user
             
-            # Compter les notifications non lues
-            unread_count = Notification.query.filter_by(
-                user_id=current_user.id, 
-                is_read=False
-            ).count()
-            data['unread_notifications'] = unread_count
+            # Notifications non lues et alertes de stock (une requête, en cache)
+            data.update(get_navbar_counters(current_user.id))
             
-            # Compter les alertes de stock
-            stock_alerts = StockItem.query.filter(
-                StockItem.quantity <= StockItem.min_quantity,
-                StockItem.min_quantity > 0
-            ).count()
-            data['stock_alerts_count'] = stock_alerts
+            # Permissions compilées une fois par requête et partagées avec
+            # le décorateur permission_required
+            compiled = current_user.get_compiled_permissions()
             
-            # Déterminer les permissions
-            # Créer un objet simple pour les permissions
             class Permissions:
-                def __init__(self, user):
-                    self.user = user
+                def __init__(self, compiled):
+                    self.compiled = compiled
                 
                 def __getattr__(self, module):
                     # Retourne un objet qui peut être utilisé comme current_permissions.stock.read
-                    return PermissionModule(self.user, module)
+                    return PermissionModule(self.compiled, module)
             
             class PermissionModule:
-                def __init__(self, user, module):
-                    self.user = user
+                def __init__(self, compiled, module):
+                    self.compiled = compiled
                     self.module = module
                 
                 def __getattr__(self, action):
-                    # Vérifie si l'utilisateur a la permission
-                    if hasattr(self.user, 'has_permission'):
-                        return self.user.has_permission(self.module, action)
-                    # Si pas de méthode has_permission, donner tous les droits à l'admin
-                    if hasattr(self.user, 'role') and self.user.role and self.user.role.name == 'admin':
-                        return True
-                    return False
+                    return self.compiled.allows(self.module, action)
             
-            data['current_permissions'] = Permissions(current_user)
+            data['current_permissions'] = Permissions(compiled)
         else:
             # Pour les utilisateurs non connectés
             data['current_user'] = None
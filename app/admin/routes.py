@@ -1,4 +1,4 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from app.admin import bp
 from app.admin.forms import RoleForm
@@ -6,6 +6,9 @@ from app.auth.forms import RegistrationForm, PasswordResetForm
 from app.models import User, Role, Notification
 from app import db
 from app.decorators import admin_required
+from app.permissions import invalidate_role_permissions
+from app.notifications import list_notifications, notification_counts, mark_read, delete_notifications
+from app.pagination import parse_limit
 from app.utils import sanitize_input
 import json
 
@@ -164,6 +167,7 @@ def role_permissions(role_id):
             permissions = json.loads(request.form.get('permissions', '{}'))
             role.set_permissions(permissions)
             db.session.commit()
+            invalidate_role_permissions(role.id)
             
             flash(f'Permissions du rôle {role.name} mises à jour avec succès.', 'success')
             return jsonify({'success': True})
@@ -260,54 +264,123 @@ def delete_role(role_id):
     return redirect(url_for('admin.roles'))
 
 @bp.route('/notifications')
-@admin_required
+@login_required
 def notifications():
-    """Gestion des notifications"""
-    notifications = Notification.query.order_by(Notification.created_at.desc()).all()
+    """Centre de notifications de l'utilisateur (pages par clé)"""
+    unread_only = request.args.get('unread') == '1'
+    try:
+        notifications, next_cursor = list_notifications(
+            current_user.id, unread_only=unread_only, cursor=request.args.get('cursor'),
+            limit=current_app.config.get('ITEMS_PER_PAGE', 20)
+        )
+    except ValueError:
+        return redirect(url_for('admin.notifications', unread=int(unread_only) or None))
+    
     return render_template('admin/notifications.html',
                          title='Notifications',
-                         notifications=notifications)
+                         notifications=notifications,
+                         next_cursor=next_cursor,
+                         unread_only=unread_only,
+                         is_first_page=not request.args.get('cursor'),
+                         counts=notification_counts(current_user.id))
+
+@bp.route('/api/notifications')
+@login_required
+def notifications_api():
+    """API: notifications de l'utilisateur (unread=1, cursor, limit)"""
+    try:
+        notifications, next_cursor = list_notifications(
+            current_user.id, unread_only=request.args.get('unread') == '1',
+            cursor=request.args.get('cursor'), limit=parse_limit(request.args.get('limit'), 20)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'items': [{
+            'id': notification.id,
+            'title': notification.title,
+            'message': notification.message,
+            'notification_type': notification.notification_type,
+            'is_read': notification.is_read,
+            'created_at': notification.created_at.isoformat() if notification.created_at else None,
+            'stock_item_id': notification.stock_item_id,
+            'task_id': notification.task_id
+        } for notification in notifications],
+        'next_cursor': next_cursor,
+        'counts': notification_counts(current_user.id)
+    })
+
+def _notification_ids(data, allow_all=False):
+    """
+    Identifiants visés par une action groupée
+
+    Une liste explicite est exigée ; None (toutes) seulement si la requête
+    le demande (`allow_all`, par ex. {"all": true}).
+    """
+    ids = data.get('ids', request.form.getlist('ids', type=int) or None)
+    if ids is None:
+        if allow_all:
+            return None
+        raise ValueError('Notifications à traiter non précisées')
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ValueError('Liste de notifications invalide')
+    return ids
 
 @bp.route('/notifications/mark-read/<int:notification_id>', methods=['POST'])
 @login_required
 def mark_notification_read(notification_id):
     """Marquer une notification comme lue"""
-    notification = Notification.query.get_or_404(notification_id)
-    
-    # Vérifier que la notification appartient à l'utilisateur
-    if notification.user_id != current_user.id:
-        return jsonify({'success': False, 'message': 'Accès non autorisé.'})
-    
-    notification.is_read = True
-    db.session.commit()
+    if not mark_read(current_user.id, [notification_id]):
+        notification = Notification.query.get_or_404(notification_id)
+        # Vérifier que la notification appartient à l'utilisateur
+        if notification.user_id != current_user.id:
+            return jsonify({'success': False, 'message': 'Accès non autorisé.'})
     
     return jsonify({'success': True})
 
+@bp.route('/notifications/mark-read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    """Marquer comme lues plusieurs notifications (JSON {"ids": [...]} ou {"all": true})"""
+    data = request.get_json(silent=True) or {}
+    try:
+        updated = mark_read(current_user.id, _notification_ids(data, allow_all=data.get('all') is True))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'updated': updated})
+
 @bp.route('/notifications/mark-all-read', methods=['POST'])
 @login_required
 def mark_all_notifications_read():
     """Marquer toutes les notifications comme lues"""
-    Notification.query.filter_by(user_id=current_user.id, is_read=False).update(
-        {'is_read': True}
-    )
-    db.session.commit()
+    mark_read(current_user.id)
     
     flash('Toutes les notifications ont été marquées comme lues.', 'success')
     return redirect(url_for('admin.notifications'))
 
+@bp.route('/notifications/delete', methods=['POST'])
+@login_required
+def delete_notifications_bulk():
+    """Supprimer plusieurs notifications (JSON {"ids": [...]}, {"read": true} ou {"all": true})"""
+    data = request.get_json(silent=True) or {}
+    read_only = data.get('read') is True
+    try:
+        ids = _notification_ids(data, allow_all=read_only or data.get('all') is True)
+        deleted = delete_notifications(current_user.id, ids, read_only=read_only)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'deleted': deleted})
+
 @bp.route('/notifications/<int:notification_id>/delete', methods=['POST'])
 @login_required
 def delete_notification(notification_id):
     """Supprimer une notification"""
-    notification = Notification.query.get_or_404(notification_id)
-    
-    # Vérifier que la notification appartient à l'utilisateur
-    if notification.user_id != current_user.id:
+    # Seules les notifications de l'utilisateur sont visées par le DELETE
+    if not delete_notifications(current_user.id, [notification_id]):
+        Notification.query.get_or_404(notification_id)
         flash('Accès non autorisé.', 'danger')
         return redirect(url_for('admin.notifications'))
     
-    db.session.delete(notification)
-    db.session.commit()
-    
     flash('Notification supprimée avec succès.', 'success')
     return redirect(url_for('admin.notifications'))
\ No newline at end of file
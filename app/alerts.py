@@ -0,0 +1,118 @@
+"""
+Moteur d'alertes de stock
+
+Les alertes sont vérifiées uniquement pour les articles dont la quantité vient
+de changer. La vérification est mise en file (app/jobs.py) : la requête qui
+modifie le stock n'attend ni la diffusion aux administrateurs ni les emails.
+Le worker regroupe les vérifications en attente, récupère les alertes non
+lues existantes en une requête ensembliste, puis insère les nouvelles
+notifications en masse.
+"""
+from sqlalchemy import select
+
+from app import db
+from app.jobs import enqueue, job_handler
+
+ALERTS_JOB = 'stock.alerts'
+
+
+def _admin_ids():
+    from app.models import User, Role
+    return db.session.execute(
+        select(User.id).join(Role, User.role_id == Role.id).where(Role.name == 'admin')
+    ).scalars().all()
+
+
+def check_stock_alerts(item_ids=None, commit=True):
+    """
+    Met en file la vérification des alertes de stock
+
+    Args:
+        item_ids: Identifiants des articles à vérifier ; None pour vérifier
+            tout le stock
+        commit: Valider la transaction après la mise en file
+
+    Returns:
+        int: Nombre de vérifications mises en file
+    """
+    if item_ids is not None:
+        item_ids = sorted({i for i in item_ids if i})
+        if not item_ids:
+            return 0
+    queued = enqueue(ALERTS_JOB, {'item_ids': item_ids})
+    if commit:
+        db.session.commit()
+    return queued
+
+
+@job_handler(ALERTS_JOB, batch=True)
+def _check_queued_alerts(payloads):
+    item_ids = set()
+    for payload in payloads:
+        if payload.get('item_ids') is None:
+            item_ids = None
+            break
+        item_ids.update(payload['item_ids'])
+    create_stock_alerts(item_ids)
+
+
+def create_stock_alerts(item_ids=None):
+    """
+    Crée les notifications d'alerte pour les articles en stock bas (sans commit)
+
+    Args:
+        item_ids: Identifiants des articles à vérifier ; None pour vérifier
+            tout le stock (utilisé par `flask check-alerts`)
+
+    Returns:
+        int: Nombre de notifications créées
+    """
+    from app.models import StockItem, Notification
+    from app.counters import stock_alert_condition
+    from app.notifications import insert_notifications
+
+    if item_ids is not None:
+        item_ids = {i for i in item_ids if i}
+        if not item_ids:
+            return 0
+
+    # Articles en alerte (colonnes utiles uniquement)
+    query = select(
+        StockItem.id, StockItem.reference, StockItem.libelle,
+        StockItem.quantity, StockItem.min_quantity
+    ).where(stock_alert_condition())
+    if item_ids is not None:
+        query = query.where(StockItem.id.in_(item_ids))
+    alert_items = db.session.execute(query).all()
+    if not alert_items:
+        return 0
+
+    admin_ids = _admin_ids()
+    if not admin_ids:
+        return 0
+
+    # Alertes non lues déjà présentes, en une seule requête
+    alert_item_ids = [item.id for item in alert_items]
+    existing = set(db.session.execute(
+        select(Notification.user_id, Notification.stock_item_id).where(
+            Notification.is_read == False,
+            Notification.stock_item_id.in_(alert_item_ids),
+            Notification.user_id.in_(admin_ids)
+        )
+    ).all())
+
+    rows = [
+        {
+            'user_id': admin_id,
+            'stock_item_id': item.id,
+            'title': 'Alerte Stock Bas',
+            'message': f'La quantité de {item.libelle} ({item.reference}) est basse: {item.quantity}/{item.min_quantity}',
+            'notification_type': 'stock_alert',
+            'is_read': False
+        }
+        for item in alert_items
+        for admin_id in admin_ids
+        if (admin_id, item.id) not in existing
+    ]
+
+    return insert_notifications(rows)
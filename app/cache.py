@@ -0,0 +1,135 @@
+"""
+Cache mémoire à durée de vie limitée (TTL) et versions de données par table
+
+Cache local au processus : chaque worker gunicorn possède le sien. Les
+valeurs mises en cache doivent donc tolérer un léger décalage (au plus le TTL)
+entre workers ; les invalidations explicites ne s'appliquent qu'au worker
+qui a effectué l'écriture.
+"""
+import threading
+import time
+from itertools import chain
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class TTLCache:
+    """Dictionnaire thread-safe dont les entrées expirent après `ttl` secondes"""
+
+    def __init__(self, ttl=30, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Retourne la valeur associée à la clé si elle n'a pas expiré"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            with self._lock:
+                self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Enregistre une valeur avec le TTL par défaut ou celui fourni"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                self._evict()
+            self._data[key] = (expires_at, value)
+        return value
+
+    def delete(self, key):
+        """Supprime une entrée"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_matching(self, predicate):
+        """Supprime toutes les entrées dont la clé vérifie `predicate`"""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        """Vide le cache"""
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self):
+        """Supprime les entrées expirées, sinon la plus proche de l'expiration"""
+        now = time.monotonic()
+        expired = [k for k, (exp, _) in self._data.items() if exp < now]
+        for key in expired:
+            del self._data[key]
+        if not expired and self._data:
+            oldest = min(self._data, key=lambda k: self._data[k][0])
+            del self._data[oldest]
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+# ==================== VERSIONS DE DONNÉES ====================
+# Chaque table possède un compteur incrémenté à chaque commit qui la modifie.
+# Les caches de résultats incluent ces versions dans leur clé : une écriture
+# rend immédiatement obsolètes les entrées qui en dépendent.
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def get_data_version(*tables):
+    """Retourne le tuple des versions courantes des tables demandées"""
+    return tuple(_versions.get(table, 0) for table in tables)
+
+
+def bump_data_version(*tables):
+    """Incrémente la version des tables (écritures hors ORM)"""
+    with _versions_lock:
+        for table in tables:
+            _versions[table] = _versions.get(table, 0) + 1
+
+
+def _pending_tables(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flushed_tables(session, flush_context):
+    tables = _pending_tables(session)
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            tables.add(table)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_statements(orm_execute_state):
+    # INSERT/UPDATE/DELETE en masse (session.execute(insert(Model), ...))
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _pending_tables(orm_execute_state.session).add(mapper.local_table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed_tables(session):
+    tables = session.info.pop('changed_tables', None)
+    if tables:
+        bump_data_version(*tables)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_tables(session):
+    session.info.pop('changed_tables', None)
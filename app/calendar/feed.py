@@ -0,0 +1,176 @@
+"""
+Flux d'événements du calendrier
+
+Le flux ne charge que les colonnes affichées par FullCalendar, filtrées sur
+l'index (start_date, end_date) de `task` : une requête pour les tâches (avec
+les noms de projet et de type) et une pour les personnels affectés.
+
+La réponse est colonnaire : une liste par champ, et des tables de
+correspondance (projets, personnels, types, styles) au lieu de répéter les
+noms dans chaque événement. Les descriptions ne sont pas incluses ; la
+fenêtre de détail les charge à l'ouverture (/calendar/task/<id>).
+
+Le JSON sérialisé et son ETag sont mis en cache par plage et filtres,
+invalidés par la version des tables lues : une re-navigation FullCalendar
+sur une période inchangée est servie en 304 sans requête SQL. Ces versions
+sont propres au processus : avec plusieurs workers, une écriture faite
+ailleurs n'apparaît qu'à l'expiration de l'entrée (CALENDAR_FEED_TTL,
+30 s), d'où un TTL court.
+"""
+import json
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.cache import TTLCache, get_data_version
+from app.dashboard.charts import compute_etag
+
+FEED_TABLES = ('task', 'project', 'personnel', 'task_type')
+MAX_RANGE_DAYS = 400
+
+_cache = TTLCache(ttl=30, maxsize=256)
+
+
+def parse_range(start, end):
+    """
+    Plage demandée par FullCalendar (dates ISO, éventuellement avec heure)
+
+    Returns:
+        tuple: (date de début, date de fin exclue)
+
+    Raises:
+        ValueError: Date absente ou invalide, plage inversée ou trop longue
+    """
+    if not start or not end:
+        raise ValueError('Paramètres start et end requis')
+    try:
+        start_date = date.fromisoformat(start[:10])
+        end_date = date.fromisoformat(end[:10])
+    except ValueError:
+        raise ValueError('Format de date invalide (AAAA-MM-JJ attendu)')
+    if end_date <= start_date:
+        raise ValueError('La date de fin doit suivre la date de début')
+    if (end_date - start_date).days > MAX_RANGE_DAYS:
+        raise ValueError(f'Plage limitée à {MAX_RANGE_DAYS} jours')
+    return start_date, end_date
+
+
+@lru_cache(maxsize=None)
+def task_style(status, priority):
+    """Couleur et classes CSS d'un événement selon statut et priorité"""
+    if status == 'completed':
+        color = '#28a745'
+    elif status == 'cancelled':
+        color = '#6c757d'
+    elif status == 'in_progress':
+        color = {'high': '#dc3545', 'medium': '#fd7e14'}.get(priority, '#17a2b8')
+    else:  # pending
+        color = {'high': '#e83e8c', 'medium': '#ffc107'}.get(priority, '#007bff')
+
+    classes = ['fc-event-task']
+    if priority:
+        classes.append(f'fc-event-{priority}')
+    if status:
+        classes.append(f'fc-event-{status}')
+    return {'color': color, 'classNames': classes}
+
+
+def _range_conditions(start_date, end_date):
+    from app.models import Task
+
+    # Chevauchement de [start_date, end_date[ : parcours de l'index sur start_date
+    return (Task.start_date < end_date, Task.end_date >= start_date)
+
+
+def build_feed(start_date, end_date, project_id=None, status=None):
+    """
+    Construit le flux colonnaire des tâches qui chevauchent la plage
+
+    Returns:
+        dict: columns (id, title, start, end, project, type, status,
+        priority, style, personnel), projects, task_types, personnel,
+        styles ({clé: {color, classNames}})
+    """
+    from app.models import Task, Project, TaskType, Personnel, task_personnel
+
+    conditions = list(_range_conditions(start_date, end_date))
+    if project_id is not None:
+        conditions.append(Task.project_id == project_id)
+    if status:
+        conditions.append(Task.status == status)
+
+    rows = db.session.execute(
+        select(Task.id, Task.name, Task.start_date, Task.end_date, Task.status, Task.priority,
+               Task.project_id, Project.name.label('project_name'),
+               Task.task_type_id, TaskType.name.label('task_type_name'))
+        .outerjoin(Project, Project.id == Task.project_id)
+        .outerjoin(TaskType, TaskType.id == Task.task_type_id)
+        .where(*conditions)
+        .order_by(Task.start_date, Task.id)
+    ).all()
+
+    assigned, personnel = {}, {}
+    if rows:
+        for task_id, personnel_id, first_name, last_name in db.session.execute(
+            select(task_personnel.c.task_id, Personnel.id, Personnel.first_name, Personnel.last_name)
+            .join(Personnel, Personnel.id == task_personnel.c.personnel_id)
+            .join(Task, Task.id == task_personnel.c.task_id)
+            .where(*conditions)
+            .order_by(task_personnel.c.task_id, Personnel.id)
+        ):
+            assigned.setdefault(task_id, []).append(personnel_id)
+            personnel[personnel_id] = f'{first_name} {last_name}'
+
+    columns = {name: [] for name in ('id', 'title', 'start', 'end', 'project', 'type',
+                                     'status', 'priority', 'style', 'personnel')}
+    projects, task_types, styles = {}, {}, {}
+    for row in rows:
+        style = f'{row.status}:{row.priority}'
+        if style not in styles:
+            styles[style] = task_style(row.status, row.priority)
+        if row.project_id is not None:
+            projects[row.project_id] = row.project_name
+        if row.task_type_id is not None:
+            task_types[row.task_type_id] = row.task_type_name
+
+        columns['id'].append(row.id)
+        columns['title'].append(row.name)
+        columns['start'].append(row.start_date.isoformat())
+        # Fin exclue pour les événements « journée entière »
+        columns['end'].append((row.end_date + timedelta(days=1)).isoformat())
+        columns['project'].append(row.project_id)
+        columns['type'].append(row.task_type_id)
+        columns['status'].append(row.status)
+        columns['priority'].append(row.priority)
+        columns['style'].append(style)
+        columns['personnel'].append(assigned.get(row.id, []))
+
+    return {
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'count': len(rows),
+        'columns': columns,
+        'projects': projects,
+        'task_types': task_types,
+        'personnel': personnel,
+        'styles': styles
+    }
+
+
+def get_feed(start_date, end_date, project_id=None, status=None):
+    """
+    Retourne (JSON sérialisé, etag, date de construction), depuis le cache si
+    aucune table lue n'a été modifiée depuis (par ce processus) et que
+    l'entrée n'a pas expiré
+    """
+    key = (start_date, end_date, project_id, status, get_data_version(*FEED_TABLES))
+    entry = _cache.get(key)
+    if entry is None:
+        feed = build_feed(start_date, end_date, project_id=project_id, status=status)
+        body = json.dumps(feed, separators=(',', ':'))
+        entry = _cache.set(key, (body, compute_etag(body), datetime.utcnow().replace(microsecond=0)),
+                           current_app.config.get('CALENDAR_FEED_TTL', 30))
+    return entry
@@ -1,6 +1,7 @@
-from flask import render_template, jsonify, request
+from flask import render_template, jsonify, request, current_app
 from flask_login import login_required, current_user
 from app.calendar import bp
+from app.calendar.feed import parse_range, get_feed
 from app.models import Task, Project, Personnel, Group
 from app.decorators import permission_required
 from app import db
@@ -27,95 +28,17 @@ def index():
 @bp.route('/events')
 @login_required
 def events():
-    """API pour les événements du calendrier (FullCalendar)"""
+    """Flux colonnaire des tâches d'une plage pour FullCalendar (ETag / 304)"""
     try:
-        start = request.args.get('start')
-        end = request.args.get('end')
-        project_filter = request.args.get('project', 'all')
-        status_filter = request.args.get('status', 'all')
-        
-        print(f"Chargement événements: start={start}, end={end}, project={project_filter}, status={status_filter}")
-        
-        # Requête de base
-        query = Task.query.options(
-            db.joinedload(Task.project),
-            db.joinedload(Task.assigned_personnel),
-            db.joinedload(Task.task_type_ref)
-        )
-        
-        # Filtrer par période
-        if start and end:
-            try:
-                start_date = datetime.strptime(start, '%Y-%m-%d').date()
-                end_date = datetime.strptime(end, '%Y-%m-%d').date()
-                query = query.filter(
-                    db.or_(
-                        db.and_(Task.start_date <= end_date, Task.end_date >= start_date),
-                        db.and_(Task.start_date >= start_date, Task.start_date <= end_date)
-                    )
-                )
-            except ValueError as ve:
-                print(f"Erreur de format de date: {ve}")
-        
-        # Filtrer par projet
-        if project_filter and project_filter != 'all':
-            try:
-                query = query.filter(Task.project_id == int(project_filter))
-            except ValueError:
-                pass
-        
-        # Filtrer par statut
-        if status_filter and status_filter != 'all':
-            query = query.filter(Task.status == status_filter)
-        
-        tasks = query.all()
-        print(f"Nombre de tâches trouvées: {len(tasks)}")
-        
-        # Formater les événements
-        events = []
-        for task in tasks:
-            try:
-                color = get_task_color(task)
-                
-                event = {
-                    'id': str(task.id),
-                    'title': task.name,
-                    'start': task.start_date.isoformat(),
-                    'end': (task.end_date + timedelta(days=1)).isoformat() if task.end_date else (task.start_date + timedelta(days=1)).isoformat(),
-                    'allDay': True,
-                    'backgroundColor': color,
-                    'borderColor': color,
-                    'textColor': '#ffffff',
-                    'classNames': get_task_classes(task),
-                    'extendedProps': {
-                        'type': 'task',
-                        'project_id': task.project_id,
-                        'project_name': task.project.name,
-                        'status': task.status,
-                        'status_text': get_status_text(task.status),
-                        'priority': task.priority,
-                        'priority_text': get_priority_text(task.priority),
-                        'description': task.description or '',
-                        'task_type': task.task_type_ref.name if task.task_type_ref else '',
-                        'assigned_personnel': [
-                            {'id': p.id, 'name': p.get_full_name()} 
-                            for p in task.assigned_personnel
-                        ]
-                    }
-                }
-                events.append(event)
-            except Exception as e:
-                print(f"Erreur formatage tâche {task.id}: {str(e)}")
-                continue
-        
-        print(f"Événements formatés: {len(events)}")
-        return jsonify(events)
-        
-    except Exception as e:
-        print(f"Erreur dans /calendar/events: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify([])
+        start_date, end_date = parse_range(request.args.get('start'), request.args.get('end'))
+        project_id = request.args.get('project', 'all')
+        project_id = None if project_id in ('', 'all') else int(project_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    status = request.args.get('status', 'all')
+    return _feed_response(start_date, end_date, project_id,
+                          None if status in ('', 'all') else status)
 
 
 @bp.route('/task/<int:task_id>')
@@ -166,82 +89,26 @@ def task_details(task_id):
 @bp.route('/api/events-by-range')
 @login_required
 def events_by_range():
-    """API pour les événements par plage de dates (pour les vues semaine/jour)"""
+    """Flux des événements par plage de dates (pour les vues semaine/jour)"""
     try:
-        start = request.args.get('start')
-        end = request.args.get('end')
-        
-        print(f"Chargement événements par plage: start={start}, end={end}")
-        
-        if not start or not end:
-            return jsonify([])
-        
-        query = Task.query.options(
-            db.joinedload(Task.project),
-            db.joinedload(Task.assigned_personnel),
-            db.joinedload(Task.task_type_ref)
-        )
-        
-        try:
-            start_date = datetime.strptime(start, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end, '%Y-%m-%d').date()
-            query = query.filter(
-                db.or_(
-                    db.and_(Task.start_date <= end_date, Task.end_date >= start_date),
-                    db.and_(Task.start_date >= start_date, Task.start_date <= end_date)
-                )
-            )
-        except ValueError as ve:
-            print(f"Erreur de format de date: {ve}")
-            return jsonify([])
-        
-        tasks = query.order_by(Task.start_date).all()
-        
-        # Formater les événements
-        events = []
-        for task in tasks:
-            try:
-                color = get_task_color(task)
-                
-                event = {
-                    'id': str(task.id),
-                    'title': task.name,
-                    'start': task.start_date.isoformat(),
-                    'end': (task.end_date + timedelta(days=1)).isoformat() if task.end_date else (task.start_date + timedelta(days=1)).isoformat(),
-                    'allDay': True,
-                    'backgroundColor': color,
-                    'borderColor': color,
-                    'textColor': '#ffffff',
-                    'classNames': get_task_classes(task),
-                    'extendedProps': {
-                        'type': 'task',
-                        'project_id': task.project_id,
-                        'project_name': task.project.name,
-                        'status': task.status,
-                        'status_text': get_status_text(task.status),
-                        'priority': task.priority,
-                        'priority_text': get_priority_text(task.priority),
-                        'description': task.description or '',
-                        'task_type': task.task_type_ref.name if task.task_type_ref else '',
-                        'assigned_personnel': [
-                            {'id': p.id, 'name': p.get_full_name()} 
-                            for p in task.assigned_personnel
-                        ]
-                    }
-                }
-                events.append(event)
-            except Exception as e:
-                print(f"Erreur formatage tâche {task.id}: {str(e)}")
-                continue
-        
-        return jsonify(events)
-        
-    except Exception as e:
-        print(f"Erreur dans /calendar/api/events-by-range: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify([])
-        
+        start_date, end_date = parse_range(request.args.get('start'), request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return _feed_response(start_date, end_date)
+
+
+def _feed_response(start_date, end_date, project_id=None, status=None):
+    """Réponse conditionnelle (If-None-Match / If-Modified-Since) du flux"""
+    body, etag, built_at = get_feed(start_date, end_date, project_id=project_id, status=status)
+    
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = built_at
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @bp.route('/api/stats')
 @login_required
 def calendar_stats():
@@ -358,41 +225,6 @@ def search_tasks():
 
 # Fonctions utilitaires
 
-def get_task_color(task):
-    """Retourne la couleur d'une tâche selon priorité et statut"""
-    if task.status == 'completed':
-        return '#28a745'
-    elif task.status == 'cancelled':
-        return '#6c757d'
-    elif task.status == 'in_progress':
-        if task.priority == 'high':
-            return '#dc3545'
-        elif task.priority == 'medium':
-            return '#fd7e14'
-        else:
-            return '#17a2b8'
-    else:  # pending
-        if task.priority == 'high':
-            return '#e83e8c'
-        elif task.priority == 'medium':
-            return '#ffc107'
-        else:
-            return '#007bff'
-
-
-def get_task_classes(task):
-    """Retourne les classes CSS pour une tâche"""
-    classes = ['fc-event-task']
-    
-    if task.priority:
-        classes.append(f'fc-event-{task.priority}')
-    
-    if task.status:
-        classes.append(f'fc-event-{task.status}')
-    
-    return classes
-
-
 def get_status_text(status):
     """Convertit le code de statut en texte"""
     statuses = {
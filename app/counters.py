@@ -0,0 +1,130 @@
+"""
+Compteurs de la barre de navigation
+
+Les badges (notifications non lues, alertes de stock) sont affichés sur
+chaque page. Ils sont lus en une seule requête SQL puis conservés dans un
+cache court : par utilisateur pour les notifications, global pour les
+alertes de stock. Les écritures sur `Notification` invalident le cache au
+commit ; le compteur d'alertes est indexé par la version de la table
+`stock_item` (app/cache.py), qui suit aussi les UPDATE en masse du registre,
+des réceptions et de l'import.
+"""
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import TTLCache, get_data_version
+
+STOCK_ALERTS_KEY = 'stock_alerts'
+
+_cache = TTLCache(ttl=30)
+
+
+def _unread_key(user_id):
+    return ('unread', user_id)
+
+
+def _stock_alerts_key():
+    return (STOCK_ALERTS_KEY, get_data_version('stock_item'))
+
+
+def _ttl():
+    return current_app.config.get('NAVBAR_COUNTERS_TTL', 30)
+
+
+def stock_alert_condition():
+    """Condition SQL d'un article en alerte (quantité <= seuil minimum)"""
+    from app.models import StockItem
+    return db.and_(
+        StockItem.quantity <= StockItem.min_quantity,
+        StockItem.min_quantity > 0
+    )
+
+
+def get_navbar_counters(user_id):
+    """
+    Retourne {'unread_notifications': int, 'stock_alerts_count': int}
+
+    Seuls les compteurs absents du cache sont recalculés, dans un seul
+    SELECT composé de sous-requêtes scalaires.
+    """
+    from app.models import Notification, StockItem
+
+    unread = _cache.get(_unread_key(user_id))
+    stock_alerts_key = _stock_alerts_key()
+    stock_alerts = _cache.get(stock_alerts_key)
+
+    columns = []
+    if unread is None:
+        columns.append(
+            select(func.count(Notification.id))
+            .where(Notification.user_id == user_id, Notification.is_read == False)
+            .scalar_subquery()
+            .label('unread')
+        )
+    if stock_alerts is None:
+        columns.append(
+            select(func.count(StockItem.id))
+            .where(stock_alert_condition())
+            .scalar_subquery()
+            .label('stock_alerts')
+        )
+
+    if columns:
+        row = db.session.execute(select(*columns)).one()._mapping
+        ttl = _ttl()
+        if unread is None:
+            unread = _cache.set(_unread_key(user_id), row['unread'] or 0, ttl)
+        if stock_alerts is None:
+            stock_alerts = _cache.set(stock_alerts_key, row['stock_alerts'] or 0, ttl)
+
+    return {
+        'unread_notifications': unread,
+        'stock_alerts_count': stock_alerts
+    }
+
+
+def invalidate_navbar_counters(user_ids=None, stock=False):
+    """
+    Invalide les compteurs en cache
+
+    Args:
+        user_ids: Identifiant ou liste d'identifiants dont le compteur de
+            notifications doit être recalculé ('all' pour tous)
+        stock: Recalculer le compteur global d'alertes de stock
+    """
+    if user_ids == 'all':
+        _cache.delete_matching(lambda key: key[0] != STOCK_ALERTS_KEY)
+    elif user_ids is not None:
+        if isinstance(user_ids, int):
+            user_ids = [user_ids]
+        for user_id in user_ids:
+            _cache.delete(_unread_key(user_id))
+    if stock:
+        _cache.delete_matching(lambda key: key[0] == STOCK_ALERTS_KEY)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_counter_changes(session, flush_context):
+    """Note les compteurs affectés par le flush, appliqués au commit"""
+    from app.models import Notification
+
+    pending = session.info.setdefault('navbar_counters', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Notification):
+            pending.add(obj.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_counter_changes(session):
+    pending = session.info.pop('navbar_counters', None)
+    if pending:
+        invalidate_navbar_counters(pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_counter_changes(session):
+    session.info.pop('navbar_counters', None)
@@ -0,0 +1,139 @@
+"""
+Micro-benchmark des sources de graphiques
+
+Crée une application de test sur SQLite en mémoire, y insère un jeu de
+données, puis mesure pour chaque source le nombre de requêtes SQL émises et
+le temps de calcul. Chaque source est mesurée à froid (caches vidés) et
+comparée à son budget de requêtes déclaré (ChartProvider.queries). Utilisé
+par la commande `flask bench-charts` et par tests/test_chart_queries.py.
+"""
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+
+def seed_benchmark_data(db, rows=200):
+    """Insère un jeu de données représentatif (rows articles, projets, etc.)"""
+    from app.models import (StockCategory, Supplier, StockItem, Client, Project,
+                            Task, TaskStockItem, AdditionalCost, Personnel)
+
+    categories = [StockCategory(name=f'Catégorie {i}') for i in range(8)]
+    suppliers = [Supplier(name=f'Fournisseur {i}') for i in range(20)]
+    clients = [Client(name=f'Client {i}', is_active=i % 5 != 0) for i in range(20)]
+    personnel = [
+        Personnel(employee_id=f'EMP{i:04d}', first_name=f'Prénom{i}', last_name=f'Nom{i}',
+                  department=f'Département {i % 6}', is_active=i % 10 != 0)
+        for i in range(rows // 4 or 1)
+    ]
+    db.session.add_all(categories + suppliers + clients + personnel)
+    db.session.flush()
+
+    items = []
+    for i in range(rows):
+        quantity = float(i % 50)
+        items.append(StockItem(
+            reference=f'REF{i:05d}', libelle=f'Article {i}', item_type='piece',
+            quantity=quantity, min_quantity=10.0, price=1.5 + i % 7,
+            value=quantity * (1.5 + i % 7),
+            category_id=categories[i % len(categories)].id,
+            supplier_id=suppliers[i % len(suppliers)].id
+        ))
+    db.session.add_all(items)
+
+    today = date.today()
+    projects = [
+        Project(name=f'Projet {i}', start_date=today, end_date=today + timedelta(days=30),
+                estimated_budget=1000.0 * i,
+                status=['planning', 'in_progress', 'completed', 'cancelled'][i % 4],
+                client_id=clients[i % len(clients)].id)
+        for i in range(rows // 4 or 1)
+    ]
+    db.session.add_all(projects)
+    db.session.flush()
+
+    tasks = []
+    for i in range(rows):
+        task = Task(
+            name=f'Tâche {i}', start_date=today, end_date=today + timedelta(days=i % 20),
+            status=['pending', 'in_progress', 'completed', 'cancelled'][i % 4],
+            project_id=projects[i % len(projects)].id
+        )
+        task.created_at = datetime.utcnow() - timedelta(days=(i * 7) % 200)
+        task.assigned_personnel = [personnel[i % len(personnel)]]
+        tasks.append(task)
+    db.session.add_all(tasks)
+    db.session.flush()
+
+    db.session.add_all(
+        TaskStockItem(task_id=task.id, stock_item_id=items[i].id,
+                      estimated_quantity=2.0, estimated_cost=2.0 * (items[i].price or 0))
+        for i, task in enumerate(tasks)
+    )
+    db.session.add_all(
+        AdditionalCost(task_id=task.id, name='Frais', amount=50.0)
+        for task in tasks[::3]
+    )
+    db.session.commit()
+
+
+def measure_providers(db, max_queries=None):
+    """
+    Mesure chaque source enregistrée sur la base courante, caches vidés
+
+    Returns:
+        list: [{'source', 'queries', 'budget', 'ms', 'ok'}] pour chaque source
+    """
+    from app.dashboard.charts import CHART_PROVIDERS
+
+    statements = []
+    results = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count_statement)
+    try:
+        for name, provider in sorted(CHART_PROVIDERS.items()):
+            db.session.expire_all()
+            provider.clear_cache()
+            statements.clear()
+            started = time.perf_counter()
+            provider.build()
+            elapsed = (time.perf_counter() - started) * 1000
+            budget = max_queries or provider.queries
+            results.append({
+                'source': name,
+                'queries': len(statements),
+                'budget': budget,
+                'ms': round(elapsed, 2),
+                'ok': len(statements) <= budget
+            })
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+    return results
+
+
+def run_chart_benchmark(rows=200, max_queries=None):
+    """
+    Mesure chaque source de graphique sur une base SQLite en mémoire
+
+    Args:
+        max_queries: Budget imposé à toutes les sources (par défaut, celui
+            déclaré par chaque source)
+
+    Returns:
+        list: [{'source', 'queries', 'budget', 'ms', 'ok'}] pour chaque source
+    """
+    from app import create_app, db
+
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        try:
+            seed_benchmark_data(db, rows)
+            return measure_providers(db, max_queries)
+        finally:
+            db.session.remove()
+            db.drop_all()
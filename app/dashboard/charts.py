@@ -0,0 +1,369 @@
+"""
+Sources de données des graphiques du tableau de bord
+
+Chaque source est déclarée comme un ChartProvider : une requête SQL groupée
+qui renvoie des lignes (libellé, valeur), un libellé de série et un style
+Chart.js. Une source = une requête, quel que soit le volume de données
+(sauf budget déclaré par la source, voir `queries`).
+"""
+import hashlib
+import json
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import case, extract, func, select, union_all
+
+from app import db
+from app.cache import TTLCache, get_data_version
+
+PALETTE = ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe', '#00f2fe', '#43e97b', '#38f9d7']
+
+PROJECT_STATUS_LABELS = {
+    'planning': 'Planification',
+    'in_progress': 'En cours',
+    'completed': 'Terminé',
+    'cancelled': 'Annulé'
+}
+
+TASK_STATUS_LABELS = {
+    'pending': 'En attente',
+    'in_progress': 'En cours',
+    'completed': 'Terminée',
+    'cancelled': 'Annulée'
+}
+
+
+class ChartProvider:
+    """
+    Source de données déclarative d'un graphique
+
+    Args:
+        name: Identifiant de la source (DashboardChart.data_source)
+        dataset_label: Libellé de la série
+        query: Fonction retournant un select() à deux colonnes (libellé, valeur)
+        tables: Tables lues par la requête (pour l'invalidation des caches)
+        style: Propriétés Chart.js ajoutées à la série
+        format_label: Transformation appliquée à chaque libellé
+        value_type: Conversion appliquée à chaque valeur
+        transform: Post-traitement optionnel de la liste de lignes
+        queries: Nombre de requêtes SQL émises par build() (vérifié par
+            `flask bench-charts`)
+    """
+
+    def __init__(self, name, dataset_label, query, tables, style=None,
+                 format_label=None, value_type=float, transform=None, queries=1):
+        self.name = name
+        self.dataset_label = dataset_label
+        self.query = query
+        self.tables = tuple(tables)
+        self.style = style or {}
+        self.format_label = format_label or (lambda label: label)
+        self.value_type = value_type
+        self.transform = transform
+        self.queries = queries
+
+    def clear_cache(self):
+        """Oublie les données mises en cache par la source (aucune par défaut)"""
+
+    def fetch_rows(self):
+        """Lignes (libellé, valeur) de la source"""
+        return [tuple(row) for row in db.session.execute(self.query()).all()]
+
+    def build(self):
+        """Exécute la requête et retourne les données au format Chart.js"""
+        rows = self.fetch_rows()
+        if self.transform:
+            rows = self.transform(rows)
+        return {
+            'labels': [self.format_label(label) for label, _ in rows],
+            'datasets': [dict({
+                'label': self.dataset_label,
+                'data': [self.value_type(value or 0) for _, value in rows],
+            }, **self.style)]
+        }
+
+
+CHART_PROVIDERS = {}
+
+
+def register_provider(provider):
+    """Enregistre une source de données"""
+    CHART_PROVIDERS[provider.name] = provider
+    return provider
+
+
+def get_provider(name):
+    return CHART_PROVIDERS.get(name)
+
+
+EMPTY_CHART = {
+    'labels': ['Aucune donnée'],
+    'datasets': [{
+        'label': 'Pas de données',
+        'data': [0],
+        'backgroundColor': '#6c757d'
+    }]
+}
+
+
+def build_chart_data(data_source):
+    """Retourne les données d'une source (graphique vide si inconnue)"""
+    provider = get_provider(data_source)
+    if provider is None:
+        return EMPTY_CHART
+    return provider.build()
+
+
+# ==================== CACHE DES RÉSULTATS ====================
+# Les données ne dépendent que de la source (pas du type de graphique ni de
+# l'utilisateur) : la clé est (source, versions des tables lues). L'ETag est
+# dérivé du contenu, il est donc identique d'un worker à l'autre.
+
+_cache = TTLCache(ttl=300, maxsize=128)
+
+
+def compute_etag(*parts):
+    """ETag fort calculé sur la sérialisation JSON canonique des éléments"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_chart_data(data_source):
+    """
+    Retourne (données, etag) pour une source, depuis le cache si possible
+
+    Le cache est invalidé dès qu'une table lue par la source est modifiée.
+    """
+    provider = get_provider(data_source)
+    if provider is None:
+        return EMPTY_CHART, compute_etag(EMPTY_CHART)
+
+    key = (data_source, get_data_version(*provider.tables))
+    entry = _cache.get(key)
+    if entry is None:
+        data = provider.build()
+        entry = _cache.set(key, (data, compute_etag(data)),
+                           current_app.config.get('CHART_DATA_TTL', 300))
+    return entry
+
+
+def _truncate(length):
+    return lambda label: (label or '')[:length]
+
+
+# ==================== REQUÊTES ====================
+
+def _stock_quantity_query():
+    from app.models import StockItem
+    return select(StockItem.reference, StockItem.quantity) \
+        .order_by(StockItem.quantity.desc()).limit(10)
+
+
+def _stock_value_query():
+    from app.models import StockItem
+    return select(StockItem.reference, StockItem.value) \
+        .order_by(StockItem.value.desc()).limit(10)
+
+
+def _stock_by_category_query():
+    from app.models import StockItem, StockCategory
+    return select(StockCategory.name, func.count(StockItem.id)) \
+        .select_from(StockCategory) \
+        .outerjoin(StockItem, StockCategory.id == StockItem.category_id) \
+        .group_by(StockCategory.id, StockCategory.name)
+
+
+def _projects_budget_query():
+    from app.models import Project
+    return select(Project.name, Project.estimated_budget).limit(10)
+
+
+def _project_status_query():
+    from app.models import Project
+    return select(Project.status, func.count(Project.id)).group_by(Project.status)
+
+
+def _tasks_progress_query():
+    from app.models import Task
+    progress = case(
+        (Task.status == 'completed', 100),
+        (Task.status == 'in_progress', 50),
+        else_=0
+    )
+    return select(Task.name, progress).order_by(Task.created_at.desc()).limit(10)
+
+
+def _task_status_query():
+    from app.models import Task
+    return select(Task.status, func.count(Task.id)).group_by(Task.status)
+
+
+def _personnel_by_department_query():
+    from app.models import Personnel
+    department = func.coalesce(func.nullif(Personnel.department, ''), 'Non assigné')
+    return select(department, func.count(Personnel.id)) \
+        .where(Personnel.is_active == True) \
+        .group_by(department)
+
+
+def _personnel_workload_query():
+    from app.models import Personnel, Task, task_personnel
+    open_tasks = func.count(Task.id)
+    return select(
+        Personnel.first_name + ' ' + Personnel.last_name, open_tasks
+    ).select_from(Personnel) \
+        .outerjoin(task_personnel, task_personnel.c.personnel_id == Personnel.id) \
+        .outerjoin(Task, db.and_(
+            Task.id == task_personnel.c.task_id,
+            Task.status.in_(['pending', 'in_progress'])
+        )) \
+        .where(Personnel.is_active == True) \
+        .group_by(Personnel.id, Personnel.first_name, Personnel.last_name) \
+        .order_by(open_tasks.desc()) \
+        .limit(10)
+
+
+def _month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def _monthly_costs_start(today=None):
+    today = today or date.today()
+    index = _month_index(today) - 5
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _monthly_costs_query():
+    """Coût des tâches (matériaux + frais) par mois de création, 6 derniers mois"""
+    from app.models import Task, TaskStockItem, AdditionalCost
+    start = _monthly_costs_start()
+
+    materials = select(Task.created_at.label('created_at'),
+                       TaskStockItem.estimated_cost.label('amount')) \
+        .join(TaskStockItem, TaskStockItem.task_id == Task.id) \
+        .where(Task.created_at >= start)
+    additional = select(Task.created_at.label('created_at'),
+                        AdditionalCost.amount.label('amount')) \
+        .join(AdditionalCost, AdditionalCost.task_id == Task.id) \
+        .where(Task.created_at >= start)
+    costs = union_all(materials, additional).subquery('costs')
+
+    year = extract('year', costs.c.created_at)
+    month = extract('month', costs.c.created_at)
+    return select((year * 12 + month - 1).label('month_index'),
+                  func.coalesce(func.sum(costs.c.amount), 0)) \
+        .group_by(year, month)
+
+
+def _fill_months(rows):
+    """Complète les 6 derniers mois avec 0 et formate les libellés"""
+    totals = {int(index): value for index, value in rows}
+    first = _month_index(_monthly_costs_start())
+    filled = []
+    for index in range(first, first + 6):
+        month = date(index // 12, index % 12 + 1, 1)
+        filled.append((month.strftime('%b %Y'), totals.get(index, 0)))
+    return filled
+
+
+def _suppliers_query():
+    from app.models import StockItem, Supplier
+    item_count = func.count(StockItem.id)
+    return select(Supplier.name, item_count) \
+        .select_from(Supplier) \
+        .outerjoin(StockItem, StockItem.supplier_id == Supplier.id) \
+        .group_by(Supplier.id, Supplier.name) \
+        .order_by(item_count.desc()) \
+        .limit(8)
+
+
+def _clients_query():
+    from app.models import Client, Project
+    project_count = func.count(Project.id)
+    return select(Client.name, project_count) \
+        .select_from(Client) \
+        .outerjoin(Project, Project.client_id == Client.id) \
+        .where(Client.is_active == True) \
+        .group_by(Client.id, Client.name) \
+        .order_by(project_count.desc()) \
+        .limit(8)
+
+
+# ==================== REGISTRE ====================
+
+register_provider(ChartProvider(
+    'stock', 'Quantité en stock', _stock_quantity_query, ['stock_item'],
+    style={'backgroundColor': '#667eea', 'borderColor': '#667eea', 'borderWidth': 2}
+))
+
+register_provider(ChartProvider(
+    'stock_value', 'Valeur (TND)', _stock_value_query, ['stock_item'],
+    style={'backgroundColor': '#764ba2', 'borderColor': '#764ba2', 'borderWidth': 2}
+))
+
+register_provider(ChartProvider(
+    'stock_by_category', "Nombre d'éléments", _stock_by_category_query,
+    ['stock_item', 'stock_category'],
+    style={'backgroundColor': PALETTE},
+    format_label=lambda label: label or 'Non catégorisé', value_type=int
+))
+
+register_provider(ChartProvider(
+    'projects', 'Budget estimé (TND)', _projects_budget_query, ['project'],
+    style={'backgroundColor': '#f093fb', 'borderColor': '#f5576c', 'borderWidth': 2},
+    format_label=_truncate(20)
+))
+
+register_provider(ChartProvider(
+    'project_status', 'Nombre de projets', _project_status_query, ['project'],
+    style={'backgroundColor': ['#ffd89b', '#4facfe', '#43e97b', '#fa709a']},
+    format_label=lambda status: PROJECT_STATUS_LABELS.get(status, status), value_type=int
+))
+
+register_provider(ChartProvider(
+    'tasks', 'Progression (%)', _tasks_progress_query, ['task'],
+    style={'backgroundColor': '#4facfe', 'borderColor': '#00f2fe', 'borderWidth': 2},
+    format_label=_truncate(20), value_type=int
+))
+
+register_provider(ChartProvider(
+    'task_status', 'Nombre de tâches', _task_status_query, ['task'],
+    style={'backgroundColor': ['#a8edea', '#4facfe', '#43e97b', '#fa709a']},
+    format_label=lambda status: TASK_STATUS_LABELS.get(status, status), value_type=int
+))
+
+register_provider(ChartProvider(
+    'personnel', 'Personnel par département', _personnel_by_department_query, ['personnel'],
+    style={'backgroundColor': PALETTE[:6]}, value_type=int
+))
+
+register_provider(ChartProvider(
+    'personnel_workload', 'Tâches ouvertes', _personnel_workload_query,
+    ['personnel', 'task', 'task_personnel'],
+    style={'backgroundColor': '#4facfe'}, format_label=_truncate(25), value_type=int
+))
+
+register_provider(ChartProvider(
+    'monthly_costs', 'Coûts mensuels (TND)', _monthly_costs_query,
+    ['task', 'task_stock_item', 'additional_cost'],
+    style={
+        'backgroundColor': 'rgba(102, 126, 234, 0.2)',
+        'borderColor': '#667eea',
+        'borderWidth': 3,
+        'fill': True,
+        'tension': 0.4
+    },
+    transform=_fill_months
+))
+
+register_provider(ChartProvider(
+    'suppliers', 'Articles fournis', _suppliers_query, ['supplier', 'stock_item'],
+    style={'backgroundColor': '#667eea'}, format_label=_truncate(20), value_type=int
+))
+
+register_provider(ChartProvider(
+    'clients', 'Projets par client', _clients_query, ['client', 'project'],
+    style={'backgroundColor': PALETTE}, format_label=_truncate(20), value_type=int
+))
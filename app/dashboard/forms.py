@@ -22,11 +22,14 @@ class DashboardChartForm(FlaskForm):
         ('stock', 'Stock - Quantité'),
         ('stock_value', 'Stock - Valeur'),
         ('stock_by_category', 'Stock par catégorie'),
+        ('stock_abc', 'Stock - Classes ABC'),
+        ('stock_cover', 'Stock - Couverture (jours)'),
         ('projects', 'Projets - Budget'),
         ('project_status', 'Statut des projets'),
         ('tasks', 'Tâches - Progression'),
         ('task_status', 'Statut des tâches'),
         ('personnel', 'Personnel par département'),
+        ('personnel_workload', 'Charge du personnel'),
         ('monthly_costs', 'Coûts mensuels'),
         ('suppliers', 'Fournisseurs'),
         ('clients', 'Clients')
@@ -1,18 +1,20 @@
 # app/dashboard/routes.py
 
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from app.dashboard import bp
 from app.dashboard.forms import DashboardChartForm
-from app.models import (DashboardChart, StockItem, Project, Task, Personnel, User, 
-                       StockCategory, Notification, Supplier, Client, TaskType,
-                       StockMovement, PurchaseOrder, Group, AdditionalCost)
+from app.models import (DashboardChart, StockItem, Project, Task, Notification, TaskType,
+                       StockMovement, PurchaseOrder, AdditionalCost)
 from app import db
 from app.decorators import permission_required
+from app.dashboard.stats import get_dashboard_stats
+from app.dashboard.charts import build_chart_data, get_chart_data, compute_etag
+from app.counters import get_navbar_counters
 from app.utils import sanitize_input, format_date
 import json
-from datetime import datetime, timedelta
-from sqlalchemy import func, extract, case, and_, or_
+from datetime import datetime
+from sqlalchemy import func, case, and_, or_
 
 @bp.route('/')
 @login_required
@@ -36,7 +38,7 @@ def index():
     ).order_by(Project.created_at.desc()).limit(5).all()
     
     # Notifications non lues
-    unread_notifications = current_user.notifications.filter_by(is_read=False).count()
+    unread_notifications = get_navbar_counters(current_user.id)['unread_notifications']
     
     return render_template('dashboard/index.html',
                          title='Tableau de Bord',
@@ -205,317 +207,83 @@ def update_chart_order():
 @bp.route('/api/chart-data/<int:chart_id>')
 @login_required
 def chart_data(chart_id):
-    """Récupérer les données d'un graphique"""
+    """Récupérer les données d'un graphique (ETag / 304 Not Modified)"""
     chart = DashboardChart.query.get_or_404(chart_id)
     
     if chart.user_id != current_user.id:
         return jsonify({'success': False, 'message': 'Accès non autorisé.'}), 403
     
     try:
-        data = generate_chart_data(chart)
+        data, data_etag = get_chart_data(chart.data_source)
+        config = chart.get_config()
+        etag = compute_etag(data_etag, config)
         
-        return jsonify({
+        if etag in request.if_none_match:
+            return _not_modified(etag)
+        
+        return _conditional_json({
             'success': True,
             'data': data,
-            'config': chart.get_config()
-        })
+            'config': config
+        }, etag)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-def generate_chart_data(chart):
-    """Générer les données d'un graphique"""
-    
-    if chart.data_source == 'stock':
-        items = StockItem.query.order_by(StockItem.quantity.desc()).limit(10).all()
-        return {
-            'labels': [item.reference for item in items],
-            'datasets': [{
-                'label': 'Quantité en stock',
-                'data': [float(item.quantity) for item in items],
-                'backgroundColor': '#667eea',
-                'borderColor': '#667eea',
-                'borderWidth': 2
-            }]
-        }
-        
-    elif chart.data_source == 'stock_value':
-        items = StockItem.query.order_by(StockItem.value.desc()).limit(10).all()
-        return {
-            'labels': [item.reference for item in items],
-            'datasets': [{
-                'label': 'Valeur (TND)',
-                'data': [float(item.value) for item in items],
-                'backgroundColor': '#764ba2',
-                'borderColor': '#764ba2',
-                'borderWidth': 2
-            }]
-        }
-        
-    elif chart.data_source == 'projects':
-        projects = Project.query.limit(10).all()
-        return {
-            'labels': [p.name[:20] for p in projects],
-            'datasets': [{
-                'label': 'Budget estimé (TND)',
-                'data': [float(p.estimated_budget or 0) for p in projects],
-                'backgroundColor': '#f093fb',
-                'borderColor': '#f5576c',
-                'borderWidth': 2
-            }]
-        }
-        
-    elif chart.data_source == 'tasks':
-        tasks = Task.query.order_by(Task.created_at.desc()).limit(10).all()
-        return {
-            'labels': [t.name[:20] for t in tasks],
-            'datasets': [{
-                'label': 'Progression (%)',
-                'data': [100 if t.status == 'completed' else 50 if t.status == 'in_progress' else 0 for t in tasks],
-                'backgroundColor': '#4facfe',
-                'borderColor': '#00f2fe',
-                'borderWidth': 2
-            }]
-        }
-        
-    elif chart.data_source == 'personnel':
-        personnel = Personnel.query.filter_by(is_active=True).all()
-        dept_counts = {}
-        for p in personnel:
-            dept = p.department or 'Non assigné'
-            dept_counts[dept] = dept_counts.get(dept, 0) + 1
-        
-        return {
-            'labels': list(dept_counts.keys()),
-            'datasets': [{
-                'label': 'Personnel par département',
-                'data': list(dept_counts.values()),
-                'backgroundColor': ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe', '#00f2fe']
-            }]
-        }
-        
-    elif chart.data_source == 'stock_by_category':
-        categories = db.session.query(
-            StockCategory.name,
-            func.count(StockItem.id).label('count')
-        ).join(StockItem, StockCategory.id == StockItem.category_id, isouter=True) \
-         .group_by(StockCategory.id, StockCategory.name).all()
-        
-        return {
-            'labels': [cat[0] or 'Non catégorisé' for cat in categories],
-            'datasets': [{
-                'label': "Nombre d'éléments",
-                'data': [cat[1] for cat in categories],
-                'backgroundColor': ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe', '#00f2fe', '#43e97b', '#38f9d7']
-            }]
-        }
-        
-    elif chart.data_source == 'project_status':
-        status_counts = db.session.query(
-            Project.status,
-            func.count(Project.id).label('count')
-        ).group_by(Project.status).all()
-        
-        status_labels = {
-            'planning': 'Planification',
-            'in_progress': 'En cours',
-            'completed': 'Terminé',
-            'cancelled': 'Annulé'
-        }
-        
-        return {
-            'labels': [status_labels.get(status, status) for status, count in status_counts],
-            'datasets': [{
-                'label': 'Nombre de projets',
-                'data': [count for status, count in status_counts],
-                'backgroundColor': ['#ffd89b', '#4facfe', '#43e97b', '#fa709a']
-            }]
-        }
-        
-    elif chart.data_source == 'task_status':
-        status_counts = db.session.query(
-            Task.status,
-            func.count(Task.id).label('count')
-        ).group_by(Task.status).all()
-        
-        status_labels = {
-            'pending': 'En attente',
-            'in_progress': 'En cours',
-            'completed': 'Terminée',
-            'cancelled': 'Annulée'
-        }
-        
-        return {
-            'labels': [status_labels.get(status, status) for status, count in status_counts],
-            'datasets': [{
-                'label': 'Nombre de tâches',
-                'data': [count for status, count in status_counts],
-                'backgroundColor': ['#a8edea', '#4facfe', '#43e97b', '#fa709a']
-            }]
-        }
-        
-    elif chart.data_source == 'monthly_costs':
-        today = datetime.now()
-        months = []
-        costs = []
-        
-        for i in range(6, 0, -1):
-            month = today - timedelta(days=30*i)
-            month_start = month.replace(day=1)
-            
-            if i > 1:
-                next_month = (month_start + timedelta(days=32)).replace(day=1)
-            else:
-                next_month = today
-            
-            cost = db.session.query(func.sum(Task.actual_cost)).filter(
-                Task.created_at >= month_start,
-                Task.created_at < next_month
-            ).scalar() or 0
-            
-            months.append(month_start.strftime('%b %Y'))
-            costs.append(float(cost))
-        
-        return {
-            'labels': months,
-            'datasets': [{
-                'label': 'Coûts mensuels (TND)',
-                'data': costs,
-                'backgroundColor': 'rgba(102, 126, 234, 0.2)',
-                'borderColor': '#667eea',
-                'borderWidth': 3,
-                'fill': True,
-                'tension': 0.4
-            }]
-        }
-    
-    elif chart.data_source == 'suppliers':
-        suppliers = Supplier.query.limit(10).all()
-        supplier_counts = []
-        
-        for supplier in suppliers:
-            count = StockItem.query.filter_by(supplier_id=supplier.id).count()
-            supplier_counts.append({
-                'name': supplier.name,
-                'count': count
-            })
-        
-        supplier_counts.sort(key=lambda x: x['count'], reverse=True)
-        
-        return {
-            'labels': [s['name'][:20] for s in supplier_counts[:8]],
-            'datasets': [{
-                'label': 'Articles fournis',
-                'data': [s['count'] for s in supplier_counts[:8]],
-                'backgroundColor': '#667eea'
-            }]
-        }
+@bp.route('/api/charts-data')
+@login_required
+def charts_data():
+    """Récupérer en une seule réponse les données de tous les graphiques actifs"""
+    charts = DashboardChart.query.filter_by(
+        user_id=current_user.id, is_active=True
+    ).order_by(DashboardChart.position).all()
     
-    elif chart.data_source == 'clients':
-        clients = Client.query.filter_by(is_active=True).limit(10).all()
-        client_projects = []
-        
-        for client in clients:
-            count = Project.query.filter_by(client_id=client.id).count()
-            client_projects.append({
-                'name': client.name,
-                'count': count
+    try:
+        results = []
+        etag_parts = []
+        for chart in charts:
+            data, data_etag = get_chart_data(chart.data_source)
+            config = chart.get_config()
+            results.append({
+                'id': chart.id,
+                'title': chart.title,
+                'chart_type': chart.chart_type,
+                'data_source': chart.data_source,
+                'data': data,
+                'config': config
             })
+            etag_parts.append([chart.id, chart.chart_type, chart.title, data_etag, config])
         
-        client_projects.sort(key=lambda x: x['count'], reverse=True)
+        etag = compute_etag(etag_parts)
+        if etag in request.if_none_match:
+            return _not_modified(etag)
         
-        return {
-            'labels': [c['name'][:20] for c in client_projects[:8]],
-            'datasets': [{
-                'label': 'Projets par client',
-                'data': [c['count'] for c in client_projects[:8]],
-                'backgroundColor': ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe', '#00f2fe', '#43e97b', '#38f9d7']
-            }]
-        }
-    
-    else:
-        return {
-            'labels': ['Aucune donnée'],
-            'datasets': [{
-                'label': 'Pas de données',
-                'data': [0],
-                'backgroundColor': '#6c757d'
-            }]
-        }
+        return _conditional_json({'success': True, 'charts': results}, etag)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+def _conditional_json(payload, etag):
+    """Réponse JSON avec ETag fort, à revalider à chaque utilisation"""
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def _not_modified(etag):
+    """Réponse 304 vide pour un ETag inchangé"""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def generate_chart_data(chart):
+    """Générer les données d'un graphique (une requête SQL groupée par source)"""
+    return build_chart_data(chart.data_source)
 
 def get_comprehensive_stats():
-    """Récupérer toutes les statistiques complètes"""
-    today = datetime.now().date()
-    
-    # Stats de base
-    stats = {
-        # Stock
-        'total_stock_items': StockItem.query.count(),
-        'stock_alerts': StockItem.query.filter(
-            StockItem.quantity <= StockItem.min_quantity,
-            StockItem.min_quantity > 0
-        ).count(),
-        'total_stock_value': float(db.session.query(func.sum(StockItem.value)).scalar() or 0),
-        'stock_categories': StockCategory.query.count(),
-        
-        # Projets
-        'total_projects': Project.query.count(),
-        'active_projects': Project.query.filter_by(status='in_progress').count(),
-        'completed_projects': Project.query.filter_by(status='completed').count(),
-        'planning_projects': Project.query.filter_by(status='planning').count(),
-        'total_project_budget': float(db.session.query(func.sum(Project.estimated_budget)).scalar() or 0),
-        'total_project_cost': float(db.session.query(func.sum(Project.actual_cost)).scalar() or 0),
-        
-        # Tâches
-        'total_tasks': Task.query.count(),
-        'pending_tasks': Task.query.filter_by(status='pending').count(),
-        'in_progress_tasks': Task.query.filter_by(status='in_progress').count(),
-        'completed_tasks': Task.query.filter_by(status='completed').count(),
-        'overdue_tasks': Task.query.filter(
-            Task.end_date < today,
-            Task.status.in_(['pending', 'in_progress'])
-        ).count(),
-        
-        # Personnel
-        'total_personnel': Personnel.query.filter_by(is_active=True).count(),
-        'total_groups': Group.query.count(),
-        
-        # Utilisateurs
-        'total_users': User.query.filter_by(is_active=True).count(),
-        
-        # Fournisseurs et Clients
-        'total_suppliers': Supplier.query.count(),
-        'total_clients': Client.query.filter_by(is_active=True).count(),
-        
-        # Stats du jour
-        'tasks_completed_today': Task.query.filter(
-            Task.actual_end_date == today,
-            Task.status == 'completed'
-        ).count(),
-        
-        # Stats du mois
-        'monthly_tasks': Task.query.filter(
-            extract('month', Task.created_at) == today.month,
-            extract('year', Task.created_at) == today.year
-        ).count(),
-        'monthly_projects': Project.query.filter(
-            extract('month', Project.created_at) == today.month,
-            extract('year', Project.created_at) == today.year
-        ).count(),
-    }
-    
-    # Calcul du taux de complétion des projets
-    if stats['total_projects'] > 0:
-        stats['project_completion_rate'] = round((stats['completed_projects'] / stats['total_projects']) * 100, 1)
-    else:
-        stats['project_completion_rate'] = 0
-    
-    # Calcul du taux de complétion des tâches
-    if stats['total_tasks'] > 0:
-        stats['task_completion_rate'] = round((stats['completed_tasks'] / stats['total_tasks']) * 100, 1)
-    else:
-        stats['task_completion_rate'] = 0
-    
-    return stats
+    """Récupérer toutes les statistiques complètes (une requête, en cache)"""
+    return get_dashboard_stats()
 
 def get_recent_activities():
     """Récupérer les activités récentes (optimisé)"""
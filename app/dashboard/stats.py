@@ -0,0 +1,144 @@
+"""
+Moteur de statistiques du tableau de bord
+
+Chaque table est agrégée une seule fois par une requête à agrégats
+conditionnels (SUM(CASE ...)). Les sous-requêtes d'une ligne sont ensuite
+combinées dans un unique SELECT : un seul aller-retour vers la base pour
+l'ensemble des indicateurs. Le résultat est mis en cache, indexé par la
+version des tables sources et la date du jour.
+"""
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, select, true
+
+from app import db
+from app.cache import TTLCache, get_data_version
+
+_cache = TTLCache(ttl=60, maxsize=32)
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _month_bounds(today):
+    month_start = datetime(today.year, today.month, 1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    return month_start, next_month
+
+
+def _stat_definitions(today):
+    """Retourne {modèle: {nom_stat: expression d'agrégat}}"""
+    from app.models import (StockItem, StockCategory, Project, Task, Personnel,
+                            Group, User, Supplier, Client)
+    from app.counters import stock_alert_condition
+
+    month_start, next_month = _month_bounds(today)
+
+    return {
+        StockItem: {
+            'total_stock_items': func.count(StockItem.id),
+            'stock_alerts': _count_if(stock_alert_condition()),
+            'total_stock_value': func.coalesce(func.sum(StockItem.value), 0),
+        },
+        StockCategory: {
+            'stock_categories': func.count(StockCategory.id),
+        },
+        Project: {
+            'total_projects': func.count(Project.id),
+            'active_projects': _count_if(Project.status == 'in_progress'),
+            'completed_projects': _count_if(Project.status == 'completed'),
+            'planning_projects': _count_if(Project.status == 'planning'),
+            'total_project_budget': func.coalesce(func.sum(Project.estimated_budget), 0),
+            'total_project_cost': func.coalesce(func.sum(Project.actual_cost), 0),
+            'monthly_projects': _count_if(db.and_(
+                Project.created_at >= month_start, Project.created_at < next_month
+            )),
+        },
+        Task: {
+            'total_tasks': func.count(Task.id),
+            'pending_tasks': _count_if(Task.status == 'pending'),
+            'in_progress_tasks': _count_if(Task.status == 'in_progress'),
+            'completed_tasks': _count_if(Task.status == 'completed'),
+            'overdue_tasks': _count_if(db.and_(
+                Task.end_date < today, Task.status.in_(['pending', 'in_progress'])
+            )),
+            'tasks_completed_today': _count_if(db.and_(
+                Task.actual_end_date == today, Task.status == 'completed'
+            )),
+            'monthly_tasks': _count_if(db.and_(
+                Task.created_at >= month_start, Task.created_at < next_month
+            )),
+        },
+        Personnel: {
+            'total_personnel': _count_if(Personnel.is_active == True),
+        },
+        Group: {
+            'total_groups': func.count(Group.id),
+        },
+        User: {
+            'total_users': _count_if(User.is_active == True),
+        },
+        Supplier: {
+            'total_suppliers': func.count(Supplier.id),
+        },
+        Client: {
+            'total_clients': _count_if(Client.is_active == True),
+        },
+    }
+
+
+FLOAT_STATS = ('total_stock_value', 'total_project_budget', 'total_project_cost')
+
+
+def compute_stats(today=None):
+    """Calcule toutes les statistiques en une seule requête SQL"""
+    today = today or date.today()
+    definitions = _stat_definitions(today)
+
+    # Une sous-requête d'une ligne par table, combinées dans un seul SELECT
+    columns = []
+    from_clause = None
+    for model, stats in definitions.items():
+        subquery = select(
+            *[expression.label(name) for name, expression in stats.items()]
+        ).select_from(model).subquery(f'stats_{model.__tablename__}')
+        columns.extend(subquery.c[name] for name in stats)
+        # Produit cartésien volontaire de sous-requêtes d'une seule ligne
+        from_clause = subquery if from_clause is None else from_clause.join(subquery, true())
+
+    row = db.session.execute(select(*columns).select_from(from_clause)).one()._mapping
+
+    stats = {}
+    for name in row.keys():
+        value = row[name] or 0
+        stats[name] = float(value) if name in FLOAT_STATS else int(value)
+
+    # Taux de complétion
+    stats['project_completion_rate'] = (
+        round((stats['completed_projects'] / stats['total_projects']) * 100, 1)
+        if stats['total_projects'] > 0 else 0
+    )
+    stats['task_completion_rate'] = (
+        round((stats['completed_tasks'] / stats['total_tasks']) * 100, 1)
+        if stats['total_tasks'] > 0 else 0
+    )
+
+    return stats
+
+
+STATS_TABLES = ('stock_item', 'stock_category', 'project', 'task', 'personnel',
+                'group', 'user', 'supplier', 'client')
+
+
+def get_dashboard_stats():
+    """Retourne les statistiques du tableau de bord depuis le cache si possible"""
+    today = date.today()
+    key = (today, get_data_version(*STATS_TABLES))
+
+    stats = _cache.get(key)
+    if stats is None:
+        stats = _cache.set(key, compute_stats(today),
+                           current_app.config.get('DASHBOARD_STATS_TTL', 60))
+    return dict(stats)
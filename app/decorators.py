@@ -17,7 +17,7 @@ def permission_required(module, action):
                 flash('Veuillez vous connecter pour accéder à cette page.', 'warning')
                 return redirect(url_for('auth.login'))
             
-            if not current_user.has_permission(module, action):
+            if not current_user.get_compiled_permissions().allows(module, action):
                 flash('Vous n\'avez pas les permissions nécessaires pour accéder à cette page.', 'danger')
                 return abort(403)
             
@@ -1,9 +1,10 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField, DateField, TextAreaField, SubmitField, IntegerField, \
-    FloatField, SelectField, SelectMultipleField, BooleanField
+    FloatField, SelectField, BooleanField
 from wtforms.validators import DataRequired, Length, Optional, NumberRange, ValidationError
 from app.models import Equipment, EquipmentCategory
+from app.forms import TypeaheadSelectField, TypeaheadSelectMultipleField
 from datetime import date
 
 class EquipmentCategoryForm(FlaskForm):
@@ -69,7 +70,7 @@ class EquipmentForm(FlaskForm):
     ], default=0.0)
     
     # Éléments de stock attachés
-    stock_items = SelectMultipleField('Éléments de stock associés', coerce=int, validators=[Optional()])
+    stock_items = TypeaheadSelectMultipleField('Éléments de stock associés', source='stock', validators=[Optional()])
     
     # Notes
     description = TextAreaField('Description', validators=[Optional()])
@@ -132,7 +133,7 @@ class EquipmentMaintenanceForm(FlaskForm):
 
 class EquipmentStockAssociationForm(FlaskForm):
     """Formulaire pour associer un élément de stock à un équipement"""
-    stock_item_id = SelectField('Élément de stock*', coerce=int, validators=[DataRequired()])
+    stock_item_id = TypeaheadSelectField('Élément de stock*', source='stock', validators=[DataRequired()])
     quantity_used = FloatField('Quantité utilisée*', validators=[
         DataRequired(),
         NumberRange(min=0.01, message='La quantité doit être positive')
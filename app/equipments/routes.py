@@ -12,6 +12,7 @@ from app.models import (
 from app import db
 from app.decorators import permission_required
 from app.utils import save_uploaded_file, delete_uploaded_file, sanitize_input
+from app.typeahead import remember_recent
 import os
 from datetime import datetime
 from sqlalchemy import or_
@@ -116,7 +117,6 @@ def add():
     # Remplir les choix dynamiques
     form.category_id.choices = [(0, '-- Sélectionner --')] + [(c.id, c.name) for c in EquipmentCategory.query.all()]
     form.supplier_id.choices = [(0, '-- Sélectionner --')] + [(s.id, s.name) for s in Supplier.query.all()]
-    form.stock_items.choices = [(s.id, f"{s.reference} - {s.libelle}") for s in StockItem.query.all()]
     
     if form.validate_on_submit():
         # Nettoyer les entrées
@@ -177,6 +177,7 @@ def add():
                         quantity_used=1.0
                     )
                 )
+        remember_recent(current_user.id, 'stock', form.stock_items.data or [], commit=False)
         
         db.session.commit()
         
@@ -201,7 +202,6 @@ def edit(equipment_id):
     
     # Récupérer les éléments de stock actuellement associés
     current_stock_items = [item.id for item in equipment.stock_items]
-    form.stock_items.choices = [(s.id, f"{s.reference} - {s.libelle}") for s in StockItem.query.all()]
     
     if form.validate_on_submit():
         # Nettoyer les entrées
@@ -253,6 +253,7 @@ def edit(equipment_id):
                         quantity_used=1.0
                     )
                 )
+        remember_recent(current_user.id, 'stock', form.stock_items.data or [], commit=False)
         
         db.session.commit()
         
@@ -321,11 +322,6 @@ def add_stock_item(equipment_id):
     equipment = Equipment.query.get_or_404(equipment_id)
     form = EquipmentStockAssociationForm()
     
-    # Remplir les choix dynamiques (exclure les éléments déjà associés)
-    current_stock_ids = [item.id for item in equipment.stock_items]
-    available_stock = StockItem.query.filter(~StockItem.id.in_(current_stock_ids)).all()
-    form.stock_item_id.choices = [(s.id, f"{s.reference} - {s.libelle}") for s in available_stock]
-    
     if form.validate_on_submit():
         stock_item_id = form.stock_item_id.data
         
@@ -348,6 +344,7 @@ def add_stock_item(equipment_id):
                     added_at=datetime.utcnow()
                 )
             )
+            remember_recent(current_user.id, 'stock', [stock_item_id], commit=False)
             db.session.commit()
             
             flash('Élément de stock associé avec succès!', 'success')
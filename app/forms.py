@@ -13,6 +13,56 @@ class MultiCheckboxField(SelectMultipleField):
     widget = ListWidget(prefix_label=False)
     option_widget = CheckboxInput()
 
+class TypeaheadSelectField(SelectField):
+    """
+    Liste déroulante alimentée par /api/typeahead/<source>
+    
+    Seule l'option sélectionnée est rendue ; l'identifiant soumis est
+    validé par une requête d'existence au lieu d'une liste de choix.
+    Une valeur vide (ou 0) donne None.
+    """
+    def __init__(self, label=None, validators=None, source=None, placeholder='Rechercher...', **kwargs):
+        kwargs.setdefault('coerce', int)
+        render_kw = dict(kwargs.pop('render_kw', None) or {})
+        render_kw.setdefault('data-typeahead', source)
+        render_kw.setdefault('data-placeholder', placeholder)
+        super().__init__(label, validators, choices=[], render_kw=render_kw, **kwargs)
+        self.source = source
+    
+    def process_formdata(self, valuelist):
+        if valuelist and valuelist[0] in ('', '0', 'None'):
+            self.data = None
+            return
+        super().process_formdata(valuelist)
+    
+    def _selected_ids(self):
+        return [self.data] if self.data else []
+    
+    def iter_choices(self):
+        from app.typeahead import labels_for
+        yield ('', '', not self.data)
+        for value, label in labels_for(self.source, self._selected_ids()):
+            yield (value, label, True)
+    
+    def pre_validate(self, form):
+        from app.typeahead import existing_ids
+        ids = self._selected_ids()
+        if ids and len(existing_ids(self.source, ids)) < len(set(ids)):
+            raise ValidationError('Élément introuvable.')
+
+class TypeaheadSelectMultipleField(TypeaheadSelectField, SelectMultipleField):
+    """Variante à sélection multiple de TypeaheadSelectField"""
+    def process_formdata(self, valuelist):
+        SelectMultipleField.process_formdata(self, [v for v in valuelist if v not in ('', '0')])
+    
+    def _selected_ids(self):
+        return list(self.data or [])
+    
+    def iter_choices(self):
+        from app.typeahead import labels_for
+        for value, label in labels_for(self.source, self._selected_ids()):
+            yield (value, label, True)
+
 class LoginForm(FlaskForm):
     """Formulaire de connexion"""
     username = StringField('Nom d\'utilisateur', validators=[
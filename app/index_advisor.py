@@ -0,0 +1,258 @@
+"""
+Conseiller d'index (`flask index-advisor`)
+
+Rejoue les pages et API les plus fréquentées (ADVISOR_PATHS) avec le client
+de test de Flask, en capturant les SELECT émis (événement
+before_cursor_execute du moteur), puis demande le plan d'exécution de
+chaque requête distincte :
+
+- MySQL : EXPLAIN, accès `ALL` (parcours de table) et tris hors index
+  (Using filesort) ;
+- SQLite : EXPLAIN QUERY PLAN, lignes `SCAN <table>` sans index et tris
+  par B-tree temporaire.
+
+Un parcours d'index dans l'ordre (pages triées avec LIMIT) n'est pas
+signalé : il s'arrête à la fin de la page.
+
+Le rapport compare aussi les index déclarés dans les modèles à ceux de la
+base : un index est considéré présent si un index, une contrainte unique
+ou la clé primaire commence par les mêmes colonnes (les idx_* de
+invento_db.sql comptent). Les index manquants peuvent être écrits dans une
+révision Alembic (migrations/versions), appliquée par `flask db upgrade`.
+"""
+import re
+import uuid
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import event, inspect
+
+from app import db
+
+# Pages et API rejouées ({today}, {start}, {end} remplacés à l'exécution)
+ADVISOR_PATHS = (
+    '/dashboard/',
+    '/stock/',
+    '/personnel/',
+    '/interventions/',
+    '/equipments/',
+    '/clients/',
+    '/groups/',
+    '/projects/',
+    '/projects/api/list',
+    '/admin/notifications',
+    '/admin/api/notifications',
+    '/calendar/api/events-by-range?start={start}&end={end}',
+    '/calendar/api/upcoming-events',
+    '/calendar/api/stats',
+    '/search?q=ab&format=json',
+    '/api/typeahead/stock?q=a',
+    '/api/typeahead/personnel?q=a',
+    '/api/list/stock?sort=libelle&count=approx',
+    '/api/list/personnel?sort=last_name&active=1',
+    '/api/list/interventions?status=planned',
+    '/api/list/equipments?status=available',
+    '/api/list/clients?active=1',
+    '/api/list/groups',
+)
+
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX (\w+))?')
+
+
+class CapturedQuery:
+    """Requête distincte capturée pendant le rejeu"""
+
+    def __init__(self, statement, parameters):
+        self.statement = statement
+        self.parameters = parameters
+        self.paths = []
+        self.count = 0
+
+
+class QueryCapture:
+    """SELECT distincts exécutés, avec les chemins qui les ont émis"""
+
+    def __init__(self):
+        self.queries = {}
+        self.path = None
+
+    def record(self, statement, parameters):
+        query = self.queries.get(statement)
+        if query is None:
+            query = self.queries[statement] = CapturedQuery(statement, parameters)
+        query.count += 1
+        if self.path and self.path not in query.paths:
+            query.paths.append(self.path)
+
+
+@contextmanager
+def capture_queries():
+    """Capture les SELECT exécutés sur le moteur (yield QueryCapture)"""
+    capture = QueryCapture()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            capture.record(statement, parameters)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield capture
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def replay(user, paths=ADVISOR_PATHS):
+    """
+    Rejoue les chemins en tant que `user` et retourne les requêtes capturées
+
+    Returns:
+        tuple: (liste de CapturedQuery, {chemin: code HTTP})
+    """
+    today = date.today()
+    values = {'today': today.isoformat(),
+              'start': (today - timedelta(days=30)).isoformat(),
+              'end': (today + timedelta(days=30)).isoformat()}
+
+    client = current_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+    statuses = {}
+    with capture_queries() as capture:
+        for path in paths:
+            capture.path = path.format(**values)
+            statuses[capture.path] = client.get(capture.path).status_code
+    return list(capture.queries.values()), statuses
+
+
+def explain(query):
+    """
+    Plan d'exécution d'une requête capturée
+
+    Returns:
+        list: dicts table, access (full_scan, filesort, temp_sort),
+        detail, rows (estimation MySQL, sinon None)
+    """
+    dialect = db.engine.dialect.name
+    with db.engine.connect() as connection:
+        if dialect == 'mysql':
+            rows = connection.exec_driver_sql('EXPLAIN ' + query.statement, query.parameters).mappings().all()
+            return _mysql_findings(rows)
+        if dialect == 'sqlite':
+            rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + query.statement, query.parameters).all()
+            return _sqlite_findings(row[-1] for row in rows)
+    raise ValueError(f'EXPLAIN non pris en charge pour {dialect}')
+
+
+def _mysql_findings(rows):
+    findings = []
+    for row in rows:
+        row = {key.lower(): value for key, value in row.items()}
+        table = row.get('table')
+        extra = row.get('extra') or ''
+        if not table or table.startswith('<'):
+            continue  # tables dérivées ou unions
+        detail = f"type={row.get('type')} key={row.get('key')} rows={row.get('rows')} {extra}".strip()
+        if row.get('type') == 'ALL':
+            findings.append({'table': table, 'access': 'full_scan', 'detail': detail, 'rows': row.get('rows')})
+        if 'Using filesort' in extra:
+            findings.append({'table': table, 'access': 'filesort', 'detail': detail, 'rows': row.get('rows')})
+    return findings
+
+
+def _sqlite_findings(details):
+    findings = []
+    for detail in details:
+        match = _SQLITE_SCAN.match(detail)
+        if match:
+            table, index = match.groups()
+            if index is None and table in db.metadata.tables:  # pas les sous-requêtes
+                findings.append({'table': table, 'access': 'full_scan', 'detail': detail, 'rows': None})
+        elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            findings.append({'table': None, 'access': 'temp_sort', 'detail': detail, 'rows': None})
+    return findings
+
+
+def missing_indexes():
+    """
+    Index déclarés dans les modèles et absents de la base
+
+    Returns:
+        tuple: (liste de (table, nom, colonnes, unique), tables absentes)
+    """
+    inspector = inspect(db.engine)
+    live_tables = set(inspector.get_table_names())
+
+    missing, absent_tables = [], []
+    for table in db.metadata.sorted_tables:
+        if table.name not in live_tables:
+            absent_tables.append(table.name)
+            continue
+        existing = [index['column_names'] for index in inspector.get_indexes(table.name)]
+        existing += [unique['column_names'] for unique in inspector.get_unique_constraints(table.name)]
+        existing.append(inspector.get_pk_constraint(table.name)['constrained_columns'])
+        # Les composites d'abord : ils couvrent les index sur leur première colonne
+        for index in sorted(table.indexes, key=lambda i: -len(i.columns)):
+            columns = [column.name for column in index.columns]
+            if any(found[:len(columns)] == columns for found in existing):
+                continue
+            missing.append((table.name, index.name, columns, bool(index.unique)))
+            existing.append(columns)
+    return missing, absent_tables
+
+
+def write_migration(indexes, message='Index manquants (index-advisor)'):
+    """
+    Écrit une révision Alembic qui crée les index donnés, à la suite de la
+    révision de tête
+
+    Returns:
+        str: Chemin du fichier créé
+    """
+    from alembic.script import ScriptDirectory
+
+    config = current_app.extensions['migrate'].migrate.get_config()
+    script = ScriptDirectory.from_config(config)
+
+    upgrades = [f'op.create_index({name!r}, {table!r}, {columns!r}, unique={unique!r})'
+                for table, name, columns, unique in indexes]
+    downgrades = [f'op.drop_index({name!r}, table_name={table!r})'
+                  for table, name, columns, unique in reversed(indexes)]
+    revision = script.generate_revision(
+        uuid.uuid4().hex[-12:], message, head='head',
+        upgrades='\n    '.join(upgrades), downgrades='\n    '.join(downgrades)
+    )
+    return revision.path
+
+
+def analyze(user, paths=ADVISOR_PATHS, min_rows=0):
+    """
+    Rejoue les chemins et retourne les requêtes dont le plan comporte un
+    parcours complet ou un tri hors index
+
+    Args:
+        min_rows: Parcours ignorés sous cette estimation de lignes (MySQL ;
+            SQLite ne fournit pas d'estimation)
+
+    Returns:
+        dict: statuses ({chemin: code HTTP}), queries (nombre de requêtes
+        distinctes), findings (liste de dicts statement, paths, count,
+        findings), errors (requêtes dont l'EXPLAIN a échoué)
+    """
+    queries, statuses = replay(user, paths)
+    report = {'statuses': statuses, 'queries': len(queries), 'findings': [], 'errors': []}
+    for query in queries:
+        try:
+            findings = [finding for finding in explain(query)
+                        if finding['rows'] is None or finding['rows'] >= min_rows]
+        except Exception as e:
+            report['errors'].append({'statement': query.statement, 'error': str(getattr(e, 'orig', e))})
+            continue
+        if findings:
+            report['findings'].append({'statement': query.statement, 'paths': query.paths,
+                                       'count': query.count, 'findings': findings})
+    report['findings'].sort(key=lambda f: (-sum(x['access'] == 'full_scan' for x in f['findings']),
+                                           -f['count']))
+    return report
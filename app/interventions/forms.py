@@ -4,6 +4,8 @@ from wtforms import StringField, SelectMultipleField, TextAreaField, SelectField
 from wtforms.validators import DataRequired, Optional, Length, NumberRange, ValidationError
 from datetime import datetime
 
+from app.forms import TypeaheadSelectField
+
 from flask_wtf.file import FileField, FileAllowed, FileRequired
 
 class InterventionFileForm(FlaskForm):
@@ -49,7 +51,7 @@ class InterventionEntityForm(FlaskForm):
 
 class InterventionStockForm(FlaskForm):
     """Formulaire pour les articles de stock d'une intervention"""
-    stock_item_id = SelectField('Article', coerce=int, validators=[DataRequired()])
+    stock_item_id = TypeaheadSelectField('Article', source='stock', validators=[DataRequired()])
     estimated_quantity = FloatField('Quantité prévue', validators=[
         DataRequired(),
         NumberRange(min=0)
@@ -8,9 +8,10 @@ from app.interventions.forms import (
 )
 from app.models import (
     Intervention, InterventionType, InterventionClass, InterventionEntity,
-    InterventionStock, InterventionCost, Personnel, Project, StockItem, InterventionFile
+    InterventionStock, InterventionCost, Personnel, Project, InterventionFile
 )
 from app.utils import save_uploaded_file, delete_uploaded_file, format_date, format_currency, format_datetime
+from app.typeahead import remember_recent
 from datetime import datetime
 import json
 import os
@@ -428,10 +429,6 @@ def manage_stock(id):
     intervention = Intervention.query.get_or_404(id)
     form = InterventionStockForm()
     
-    # Remplir la liste des articles
-    stock_items = StockItem.query.order_by('reference').all()
-    form.stock_item_id.choices = [(s.id, f"{s.reference} - {s.libelle} (Stock: {s.quantity})") for s in stock_items]
-    
     if form.validate_on_submit():
         stock_item = InterventionStock(
             intervention_id=id,
@@ -445,6 +442,7 @@ def manage_stock(id):
         )
         
         db.session.add(stock_item)
+        remember_recent(current_user.id, 'stock', [form.stock_item_id.data], commit=False)
         db.session.commit()
         
         flash('Article ajouté à l\'intervention!', 'success')
@@ -0,0 +1,255 @@
+"""
+File de tâches de fond
+
+Les traitements dont la durée dépend d'un service externe ou du nombre de
+destinataires (diffusion des notifications, envoi des emails, alertes de
+stock) ne sont plus exécutés pendant la requête : enqueue() ajoute une
+ligne `job` à la transaction en cours (la tâche n'existe que si la
+transaction est validée) et le worker `flask run-jobs` les exécute.
+
+- Lots : le worker réserve jusqu'à N tâches dues à la fois
+  (SELECT ... FOR UPDATE SKIP LOCKED puis UPDATE) ; un gestionnaire
+  déclaré avec batch=True reçoit ensemble toutes les tâches du même type.
+- Reprise : une tâche en échec est reprogrammée avec un délai exponentiel
+  (JOB_RETRY_BASE_SECONDS × 2^(tentative - 1), plafonné à
+  JOB_RETRY_MAX_SECONDS) jusqu'à max_attempts, puis passe en `failed`.
+  Une tâche réservée par un worker arrêté est libérée après
+  JOB_LOCK_TIMEOUT secondes.
+- Dédoublonnage : une clé (dedup_key) évite d'empiler plusieurs tâches
+  identiques en attente (résumés par utilisateur).
+- Une tâche terminée ne conserve pas sa charge utile (emails rendus).
+
+Avec JOB_QUEUE_EAGER (tests), les tâches sont exécutées immédiatement.
+"""
+import json
+import os
+import socket
+from datetime import datetime, timedelta
+from importlib import import_module
+
+from flask import current_app
+from sqlalchemy import delete, select, update
+
+from app import db
+
+# Modules qui déclarent des gestionnaires (importés par le worker)
+JOB_MODULES = ('app.alerts', 'app.mail', 'app.notifications')
+
+_handlers = {}
+
+
+def job_handler(kind, batch=False):
+    """
+    Déclare le gestionnaire d'un type de tâche
+
+    Args:
+        kind: Type de tâche
+        batch: Le gestionnaire reçoit la liste des charges utiles des
+            tâches réservées ensemble (sinon une charge utile par appel)
+    """
+    def decorator(func):
+        _handlers[kind] = (func, batch)
+        return func
+    return decorator
+
+
+def _load_handlers():
+    for module in JOB_MODULES:
+        import_module(module)
+
+
+def _call(kind, payloads):
+    handler, batch = _handlers[kind]
+    if batch:
+        handler(payloads)
+    else:
+        for payload in payloads:
+            handler(payload)
+
+
+# ==================== MISE EN FILE ====================
+
+def enqueue_many(kind, payloads, run_at=None, dedup_keys=None, max_attempts=None):
+    """
+    Ajoute des tâches à la transaction en cours (sans commit)
+
+    Args:
+        kind: Type de tâche (gestionnaire déclaré par job_handler)
+        payloads: Charges utiles (dicts sérialisables en JSON)
+        run_at: Date d'exécution au plus tôt (maintenant par défaut)
+        dedup_keys: Clés de dédoublonnage, une par charge utile ; une tâche
+            dont la clé est déjà en attente n'est pas ajoutée
+        max_attempts: Nombre maximal de tentatives
+
+    Returns:
+        int: Nombre de tâches ajoutées (ou exécutées en mode immédiat)
+    """
+    from app.models import Job
+
+    if kind not in _handlers:
+        raise ValueError(f'Type de tâche inconnu : {kind}')
+    payloads = list(payloads)
+    if not payloads:
+        return 0
+
+    if current_app.config.get('JOB_QUEUE_EAGER'):
+        _call(kind, payloads)
+        return len(payloads)
+
+    keys = list(dedup_keys) if dedup_keys is not None else [None] * len(payloads)
+    wanted = {key for key in keys if key is not None}
+    pending = set()
+    if wanted:
+        pending = set(db.session.execute(
+            select(Job.dedup_key).where(Job.dedup_key.in_(wanted), Job.status == 'pending')
+        ).scalars())
+
+    jobs = []
+    for payload, key in zip(payloads, keys):
+        if key is not None:
+            if key in pending:
+                continue
+            pending.add(key)
+        jobs.append(Job(
+            kind=kind,
+            payload=json.dumps(payload, default=str),
+            run_at=run_at or datetime.utcnow(),
+            dedup_key=key,
+            max_attempts=max_attempts or current_app.config.get('JOB_MAX_ATTEMPTS', 5)
+        ))
+    db.session.add_all(jobs)
+    return len(jobs)
+
+
+def enqueue(kind, payload=None, run_at=None, dedup_key=None, max_attempts=None):
+    """Ajoute une tâche à la transaction en cours (voir enqueue_many)"""
+    return enqueue_many(kind, [payload or {}], run_at=run_at,
+                        dedup_keys=None if dedup_key is None else [dedup_key],
+                        max_attempts=max_attempts)
+
+
+# ==================== WORKER ====================
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _claim(batch_size, worker):
+    """Réserve les tâches dues et retourne leurs lignes"""
+    from app.models import Job
+
+    now = datetime.utcnow()
+    timeout = current_app.config.get('JOB_LOCK_TIMEOUT', 600)
+
+    # Tâches réservées par un worker arrêté en cours de traitement
+    db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.locked_at < now - timedelta(seconds=timeout))
+        .values(status='pending', locked_by=None, locked_at=None),
+        execution_options={'synchronize_session': False}
+    )
+
+    ids = db.session.execute(
+        select(Job.id)
+        .where(Job.status == 'pending', Job.run_at <= now)
+        .order_by(Job.run_at, Job.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if ids:
+        db.session.execute(
+            update(Job)
+            .where(Job.id.in_(ids), Job.status == 'pending')
+            .values(status='running', locked_by=worker, locked_at=now, attempts=Job.attempts + 1),
+            execution_options={'synchronize_session': False}
+        )
+    db.session.commit()
+    if not ids:
+        return []
+
+    return db.session.execute(
+        select(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+        .where(Job.id.in_(ids), Job.locked_by == worker, Job.status == 'running')
+        .order_by(Job.run_at, Job.id)
+    ).all()
+
+
+def _retry(jobs, error):
+    """Reprogramme les tâches en échec (délai exponentiel) ou les abandonne"""
+    from app.models import Job
+
+    config = current_app.config
+    base = config.get('JOB_RETRY_BASE_SECONDS', 30)
+    ceiling = config.get('JOB_RETRY_MAX_SECONDS', 3600)
+    now = datetime.utcnow()
+    message = f'{type(error).__name__}: {error}'[:2000]
+
+    rows = []
+    for job in jobs:
+        if job.attempts >= job.max_attempts:
+            rows.append({'id': job.id, 'status': 'failed', 'last_error': message,
+                         'finished_at': now, 'locked_by': None, 'locked_at': None})
+        else:
+            delay = min(base * 2 ** (job.attempts - 1), ceiling)
+            rows.append({'id': job.id, 'status': 'pending', 'last_error': message,
+                         'run_at': now + timedelta(seconds=delay), 'locked_by': None, 'locked_at': None})
+    # Clés identiques par lot : un executemany par forme de ligne
+    for keys in {tuple(sorted(row)) for row in rows}:
+        db.session.execute(update(Job), [row for row in rows if tuple(sorted(row)) == keys])
+    db.session.commit()
+    current_app.logger.warning('Tâches %s en échec : %s', [job.id for job in jobs], message)
+
+
+def run_jobs(batch_size=50, worker=None):
+    """
+    Exécute un lot de tâches dues
+
+    Chaque tâche (ou chaque lot pour un gestionnaire batch) est validée dans
+    sa propre transaction, avec le passage au statut `done`.
+
+    Returns:
+        dict: claimed, done, failed (tâches réservées, terminées, en échec)
+    """
+    from app.models import Job
+
+    _load_handlers()
+    jobs = _claim(batch_size, worker or worker_name())
+    stats = {'claimed': len(jobs), 'done': 0, 'failed': 0}
+
+    by_kind = {}
+    for job in jobs:
+        by_kind.setdefault(job.kind, []).append(job)
+
+    for kind, group in by_kind.items():
+        if kind not in _handlers:
+            _retry(group, ValueError(f'Type de tâche inconnu : {kind}'))
+            stats['failed'] += len(group)
+            continue
+        units = [group] if _handlers[kind][1] else [[job] for job in group]
+        for unit in units:
+            try:
+                _call(kind, [json.loads(job.payload) for job in unit])
+                db.session.execute(
+                    update(Job)
+                    .where(Job.id.in_([job.id for job in unit]))
+                    .values(status='done', finished_at=datetime.utcnow(), last_error=None,
+                            locked_by=None, locked_at=None, payload='{}'),
+                    execution_options={'synchronize_session': False}
+                )
+                db.session.commit()
+                stats['done'] += len(unit)
+            except Exception as e:
+                db.session.rollback()
+                _retry(unit, e)
+                stats['failed'] += len(unit)
+    return stats
+
+
+def purge_jobs(days):
+    """Supprime les tâches terminées depuis plus de `days` jours (les échecs restent)"""
+    from app.models import Job
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = db.session.execute(delete(Job).where(Job.status == 'done', Job.finished_at < cutoff))
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,292 @@
+"""
+API JSON des listes (stock, personnel, interventions, équipements, clients,
+groupes)
+
+Les pages d'index paginent par OFFSET avec un COUNT séparé : chaque page
+profonde relit toutes les lignes précédentes. /api/list/<ressource> sert les
+mêmes listes paginées par clé (voir app/pagination.py) :
+
+- tris déclarés par ressource, limités aux colonnes NOT NULL indexées
+  (`sort=reference`, `sort=-intervention_date` pour l'ordre décroissant) ;
+  la clé primaire départage les ex aequo ;
+- filtres déclarés (égalité sur une colonne indexée, booléens) et recherche
+  par préfixe `q` sur les colonnes de tri ;
+- `fields=reference,libelle` : seules les colonnes demandées sont chargées
+  (load_only) et renvoyées ;
+- `count=exact` (COUNT complet) ou `count=approx` : COUNT borné à
+  LIST_COUNT_CAP lignes, ou estimation des statistiques MySQL sans filtre.
+
+Le curseur contient le tri : un curseur ne peut pas être rejoué sur un autre
+tri.
+"""
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.orm import load_only
+
+from app import db
+from app.models import StockItem, Personnel, Intervention, Equipment, Client, Group
+from app.pagination import decode_cursor, encode_cursor, keyset_condition
+from app.typeahead import prefix_pattern
+
+COUNT_MODES = ('exact', 'approx')
+
+
+def _boolean(raw):
+    value = raw.strip().lower()
+    if value in ('1', 'true', 'oui', 'yes'):
+        return True
+    if value in ('0', 'false', 'non', 'no'):
+        return False
+    raise ValueError(f'Booléen invalide : {raw}')
+
+
+class ListResource:
+    """
+    Liste exposée par l'API
+
+    Args:
+        name: Identifiant de la ressource (URL)
+        model: Modèle interrogé
+        module: Module de permissions requis en lecture
+        fields: Attributs pouvant être demandés par `fields=`
+        default_fields: Attributs renvoyés sans `fields=`
+        sorts: Attributs de tri (NOT NULL, indexés) ; le premier est le tri
+            par défaut
+        filters: {paramètre: (attribut, conversion)} filtres par égalité
+        search: Attributs comparés par préfixe à `q` (parmi les tris)
+        descending: Tri par défaut décroissant
+    """
+
+    def __init__(self, name, model, module, fields, default_fields, sorts,
+                 filters=None, search=(), descending=False):
+        self.name = name
+        self.model = model
+        self.module = module
+        self.fields = fields
+        self.default_fields = default_fields
+        self.sorts = sorts
+        self.filters = filters or {}
+        self.search = search
+        self.descending = descending
+
+    def column(self, attribute):
+        return getattr(self.model, attribute)
+
+
+LIST_RESOURCES = {
+    resource.name: resource for resource in (
+        ListResource(
+            'stock', StockItem, 'stock',
+            fields=('reference', 'libelle', 'item_type', 'quantity', 'min_quantity', 'price',
+                    'value', 'unit', 'location', 'category_id', 'supplier_id', 'created_at',
+                    'updated_at'),
+            default_fields=('reference', 'libelle', 'quantity', 'unit', 'price', 'location'),
+            sorts=('reference', 'libelle'),
+            filters={'category': ('category_id', int), 'supplier': ('supplier_id', int)},
+            search=('reference', 'libelle')
+        ),
+        ListResource(
+            'personnel', Personnel, 'personnel',
+            fields=('employee_id', 'first_name', 'last_name', 'email', 'phone', 'department',
+                    'position', 'hire_date', 'is_active', 'created_at'),
+            default_fields=('employee_id', 'first_name', 'last_name', 'department', 'position',
+                            'is_active'),
+            sorts=('last_name', 'first_name', 'employee_id'),
+            filters={'department': ('department', str), 'active': ('is_active', _boolean)},
+            search=('last_name', 'first_name', 'employee_id')
+        ),
+        ListResource(
+            'interventions', Intervention, 'interventions',
+            fields=('intervention_number', 'client_name', 'location', 'type_id', 'class_id',
+                    'entity_id', 'project_id', 'equipment_id', 'client_contact_date',
+                    'intervention_date', 'planned_end_date', 'actual_end_date', 'status',
+                    'created_at', 'updated_at'),
+            default_fields=('intervention_number', 'client_name', 'intervention_date',
+                            'planned_end_date', 'status'),
+            sorts=('intervention_date', 'intervention_number'),
+            filters={'status': ('status', str), 'type': ('type_id', int)},
+            search=('intervention_number',),
+            descending=True
+        ),
+        ListResource(
+            'equipments', Equipment, 'equipments',
+            fields=('reference', 'name', 'serial_number', 'model', 'brand', 'status', 'location',
+                    'department', 'category_id', 'supplier_id', 'purchase_date',
+                    'next_maintenance', 'is_active', 'created_at', 'updated_at'),
+            default_fields=('reference', 'name', 'brand', 'model', 'status', 'location'),
+            sorts=('reference', 'name'),
+            filters={'status': ('status', str), 'category': ('category_id', int)},
+            search=('reference', 'name')
+        ),
+        ListResource(
+            'clients', Client, 'projects',
+            fields=('name', 'company', 'contact_person', 'email', 'phone', 'city', 'country',
+                    'is_active', 'created_at', 'updated_at'),
+            default_fields=('name', 'company', 'contact_person', 'email', 'phone', 'is_active'),
+            sorts=('name',),
+            filters={'active': ('is_active', _boolean)},
+            search=('name',)
+        ),
+        ListResource(
+            'groups', Group, 'personnel',
+            fields=('name', 'description', 'created_at'),
+            default_fields=('name', 'description'),
+            sorts=('name',),
+            search=('name',)
+        ),
+    )
+}
+
+
+def get_resource(name):
+    return LIST_RESOURCES.get(name)
+
+
+def _parse_fields(resource, raw):
+    if not raw:
+        return resource.default_fields
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in resource.fields]
+    if unknown:
+        raise ValueError(f'Champs inconnus : {", ".join(unknown)}')
+    return fields
+
+
+def _parse_sort(resource, raw):
+    if not raw:
+        return resource.sorts[0], resource.descending
+    descending = raw.startswith('-')
+    attribute = raw.lstrip('-')
+    if attribute not in resource.sorts:
+        raise ValueError(f'Tri non disponible : {attribute} (possibles : {", ".join(resource.sorts)})')
+    return attribute, descending
+
+
+def _cursor_type(column):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat
+    if python_type is date:
+        return date.fromisoformat
+    return python_type
+
+
+def _conditions(resource, args):
+    conditions = []
+    for param, (attribute, convert) in resource.filters.items():
+        raw = args.get(param)
+        if raw is None or raw == '':
+            continue
+        try:
+            value = convert(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f'Filtre {param} invalide : {raw}')
+        conditions.append(resource.column(attribute) == value)
+
+    text_query = (args.get('q') or '').strip()
+    if text_query and resource.search:
+        pattern = prefix_pattern(text_query)
+        conditions.append(or_(*[resource.column(attribute).like(pattern, escape='\\')
+                                for attribute in resource.search]))
+    return conditions
+
+
+def count_items(resource, conditions, mode):
+    """
+    Nombre de lignes de la liste filtrée
+
+    Returns:
+        dict: value, approximate (True si la valeur est une estimation ou
+        un plafond atteint)
+    """
+    model = resource.model
+    if mode == 'exact':
+        value = db.session.execute(select(func.count(model.id)).where(*conditions)).scalar()
+        return {'value': value, 'approximate': False}
+
+    if not conditions and db.engine.dialect.name == 'mysql':
+        # Estimation des statistiques InnoDB, sans parcours de la table
+        estimate = db.session.execute(text(
+            'SELECT table_rows FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = :table'
+        ), {'table': model.__tablename__}).scalar()
+        if estimate is not None:
+            return {'value': int(estimate), 'approximate': True}
+
+    cap = current_app.config.get('LIST_COUNT_CAP', 10000)
+    bounded = select(model.id).where(*conditions).limit(cap + 1).subquery()
+    value = db.session.execute(select(func.count()).select_from(bounded)).scalar()
+    if value > cap:
+        return {'value': cap, 'approximate': True}
+    return {'value': value, 'approximate': False}
+
+
+def serialize(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def list_items(resource, args, limit=50):
+    """
+    Page d'une liste, paginée par clé
+
+    Args:
+        resource: ListResource
+        args: Paramètres de la requête (fields, sort, cursor, count, q et
+            filtres déclarés)
+
+    Returns:
+        dict: items, next_cursor, limit, sort, fields, et count si demandé
+
+    Raises:
+        ValueError: Champ, tri, filtre, curseur ou mode de comptage invalide
+    """
+    fields = _parse_fields(resource, args.get('fields'))
+    sort, descending = _parse_sort(resource, args.get('sort'))
+    count_mode = args.get('count') or None
+    if count_mode is not None and count_mode not in COUNT_MODES:
+        raise ValueError(f'Mode de comptage invalide : {count_mode}')
+
+    model = resource.model
+    sort_column = resource.column(sort)
+    sort_key = f'-{sort}' if descending else sort
+    conditions = _conditions(resource, args)
+
+    query = model.query.options(
+        load_only(*[resource.column(attribute) for attribute in dict.fromkeys(fields + (sort,))])
+    ).filter(*conditions)
+
+    cursor = args.get('cursor')
+    if cursor:
+        cursor_sort, value, item_id = decode_cursor(cursor, str, _cursor_type(sort_column), int)
+        if cursor_sort != sort_key:
+            raise ValueError('Curseur invalide pour ce tri')
+        query = query.filter(keyset_condition((sort_column, model.id), (value, item_id),
+                                              descending=descending))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), model.id.desc())
+    else:
+        query = query.order_by(sort_column, model.id)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([sort_key, getattr(last, sort), last.id])
+
+    result = {
+        'items': [dict({'id': row.id}, **{field: serialize(getattr(row, field)) for field in fields})
+                  for row in rows],
+        'next_cursor': next_cursor,
+        'limit': limit,
+        'sort': sort_key,
+        'fields': list(fields)
+    }
+    if count_mode:
+        result['count'] = count_items(resource, conditions, count_mode)
+    return result
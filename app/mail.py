@@ -1,57 +1,112 @@
 """
 Gestion des envois d'emails
+
+Les emails ne sont pas envoyés pendant la requête : le message est rendu
+puis mis en file (app/jobs.py) et le worker l'envoie, avec reprise en cas
+d'échec SMTP. Sans MAIL_SERVER configuré, l'envoi est ignoré.
+
+La réinitialisation de mot de passe ne met en file que l'identifiant de
+l'utilisateur : le jeton et le message sont produits par le worker, le
+lien n'est jamais stocké dans `job.payload`.
 """
 from flask import render_template, current_app
 from flask_mail import Mail, Message
 
+from app import db
+from app.jobs import enqueue, job_handler
+
 mail = Mail()
 
-def send_password_reset_email(user):
+SEND_JOB = 'mail.send'
+PASSWORD_RESET_JOB = 'mail.password_reset'
+
+
+def send_email(subject, recipients, html):
     """
-    Envoie un email de réinitialisation de mot de passe
+    Envoie un email immédiatement (utilisé par le worker)
+
+    Returns:
+        bool: False si l'envoi est désactivé (pas de MAIL_SERVER)
+
+    Raises:
+        Exception: Erreur SMTP (la tâche est reprogrammée)
     """
+    config = current_app.config
+    if not config.get('MAIL_SERVER'):
+        current_app.logger.info('Envoi désactivé (MAIL_SERVER absent) : %s', subject)
+        return False
+    mail.send(Message(
+        subject,
+        recipients=recipients,
+        html=html,
+        sender=config.get('MAIL_DEFAULT_SENDER') or config['MAIL_USERNAME']
+    ))
+    return True
+
+
+def queue_email(subject, recipients, html):
+    """Met un email en file ; il est envoyé après le commit de la transaction"""
+    return enqueue(SEND_JOB, {'subject': subject, 'recipients': list(recipients), 'html': html})
+
+
+@job_handler(SEND_JOB)
+def _send_queued(payload):
+    send_email(payload['subject'], payload['recipients'], payload['html'])
+
+
+@job_handler(PASSWORD_RESET_JOB)
+def _send_password_reset(payload):
+    from app.models import User
+
+    user = db.session.get(User, payload['user_id'])
+    if user is None or not user.email:
+        return
     token = user.get_reset_password_token()
-    
+
     # Construire le lien de réinitialisation
-    reset_url = current_app.config. get('SERVER_NAME')
+    reset_url = current_app.config.get('SERVER_NAME')
     if not reset_url:
         reset_url = 'http://localhost:5000'  # À modifier en production
-    
+
     reset_link = f"{reset_url}/auth/reset-password/{token}"
-    
-    msg = Message(
+
+    send_email(
         'Réinitialisation de votre mot de passe',
-        recipients=[user.email],
-        html=render_template(
-            'auth/email/reset_password.html',
-            user=user,
-            reset_link=reset_link
-        ),
-        sender=current_app.config['MAIL_USERNAME']
+        [user.email],
+        # Rendu hors requête : sans les context processors (utilisateur courant)
+        current_app.jinja_env.get_template('auth/email/reset_password.html').render(
+            user=user, reset_link=reset_link
+        )
     )
-    
+
+
+def send_password_reset_email(user):
+    """
+    Envoie un email de réinitialisation de mot de passe (jeton généré par le worker)
+    """
     try:
-        mail.send(msg)
+        enqueue(PASSWORD_RESET_JOB, {'user_id': user.id})
+        db.session.commit()
         return True
     except Exception as e:
-        print(f"Erreur lors de l'envoi du mail: {e}")
+        db.session.rollback()
+        current_app.logger.error(f"Erreur lors de la mise en file du mail: {e}")
         return False
 
 def send_welcome_email(user):
     """Envoie un email de bienvenue à un nouvel utilisateur"""
-    msg = Message(
-        'Bienvenue sur Invento GMAO',
-        recipients=[user.email],
-        html=render_template(
-            'auth/email/welcome.html',
-            user=user
-        ),
-        sender=current_app.config['MAIL_USERNAME']
-    )
-    
     try:
-        mail.send(msg)
+        queue_email(
+            'Bienvenue sur Invento GMAO',
+            [user.email],
+            render_template(
+                'auth/email/welcome.html',
+                user=user
+            )
+        )
+        db.session.commit()
         return True
     except Exception as e:
-        print(f"Erreur lors de l'envoi du mail:  {e}")
-        return False
\ No newline at end of file
+        db.session.rollback()
+        current_app.logger.error(f"Erreur lors de la mise en file du mail: {e}")
+        return False
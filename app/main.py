@@ -1,8 +1,89 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask_login import login_required, current_user
+
+from app.pagination import parse_limit
+from app.search import search as search_index, allowed_types, SEARCH_ENTITIES
+from app.listing import get_resource, list_items
+from app.typeahead import get_source, lookup
 
 bp = Blueprint('main', __name__)
 
 @bp.route('/')
 @bp.route('/index')
 def index():
-    return render_template('index.html')
\ No newline at end of file
+    return render_template('index.html')
+
+@bp.route('/search')
+@login_required
+def search():
+    """Recherche globale (index inversé, résultats classés et typés)"""
+    query = request.args.get('q', '').strip()
+    wants_json = request.args.get('format') == 'json'
+    
+    if len(query) < 2:
+        if wants_json:
+            return jsonify({'query': query, 'results': []})
+        flash('Veuillez entrer au moins 2 caractères pour la recherche.', 'warning')
+        return redirect(request.referrer or url_for('dashboard.index'))
+    
+    types = allowed_types(current_user)
+    requested = request.args.get('type')
+    if requested:
+        types = [t for t in types if t == requested]
+    
+    results = search_index(query, types=types, limit=parse_limit(request.args.get('limit'), 30))
+    
+    if wants_json:
+        return jsonify({'query': query, 'results': results})
+    
+    # Regroupement par type, dans l'ordre du meilleur score
+    grouped = {}
+    for result in results:
+        grouped.setdefault(result['type'], []).append(result)
+    
+    return render_template('search.html',
+                         title='Résultats de recherche',
+                         query=query,
+                         results=results,
+                         grouped=grouped,
+                         entities=SEARCH_ENTITIES,
+                         total_results=len(results))
+
+@bp.route('/api/typeahead/<source>')
+@login_required
+def typeahead(source):
+    """Autocomplétion des sélecteurs (préfixe, paginée par curseur)"""
+    typeahead_source = get_source(source)
+    if typeahead_source is None:
+        return jsonify({'error': 'Source inconnue'}), 404
+    if not current_user.has_permission(typeahead_source.module, 'read'):
+        return jsonify({'error': 'Accès refusé'}), 403
+    
+    try:
+        result = lookup(typeahead_source,
+                        request.args.get('q', ''),
+                        user_id=current_user.id,
+                        cursor=request.args.get('cursor') or None,
+                        limit=parse_limit(request.args.get('limit'), 20, maximum=50))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result)
+
+@bp.route('/api/list/<resource>')
+@login_required
+def list_api(resource):
+    """Listes paginées par clé (champs, tris et filtres déclarés par ressource)"""
+    list_resource = get_resource(resource)
+    if list_resource is None:
+        return jsonify({'error': 'Ressource inconnue'}), 404
+    if not current_user.has_permission(list_resource.module, 'read'):
+        return jsonify({'error': 'Accès refusé'}), 403
+    
+    try:
+        result = list_items(list_resource, request.args,
+                            limit=parse_limit(request.args.get('limit'), 50, maximum=200))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result)
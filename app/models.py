@@ -51,12 +51,19 @@ class Role(db.Model):
     
     def set_permissions(self, permissions_dict):
         """Définit les permissions depuis un dictionnaire"""
+        from app.permissions import invalidate_role_permissions
         self.permissions = json.dumps(permissions_dict)
+        if self.id is not None:
+            invalidate_role_permissions(self.id)
+    
+    def get_compiled_permissions(self):
+        """Retourne les permissions compilées (mises en cache) du rôle"""
+        from app.permissions import get_role_permissions
+        return get_role_permissions(self)
     
     def has_permission(self, module, action):
         """Vérifie si le rôle a une permission spécifique"""
-        perms = self.get_permissions()
-        return perms.get(module, {}).get(action, False)
+        return self.get_compiled_permissions().allows(module, action)
 
 class User(UserMixin, db.Model):
     """Modèle pour les utilisateurs"""
@@ -131,12 +138,15 @@ class User(UserMixin, db.Model):
             return self.role.get_permissions()
         return {}
     
+    def get_compiled_permissions(self):
+        """Retourne les permissions compilées de l'utilisateur pour la requête"""
+        from app.permissions import get_user_permissions
+        return get_user_permissions(self)
+    
     def has_permission(self, module, action):
         """Vérifie si l'utilisateur a une permission spécifique"""
-        # L'admin a tous les droits
-        if self.role and self.role.name == 'admin':
-            return True
-        return self.role and self.role.has_permission(module, action)
+        # L'admin a tous les droits (géré par les permissions compilées)
+        return self.get_compiled_permissions().allows(module, action)
     
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}".strip() or self.username
@@ -173,10 +183,17 @@ class Supplier(db.Model):
 class StockItem(db.Model):
     """Modèle pour les éléments du stock"""
     __tablename__ = 'stock_item'
+    __table_args__ = (
+        # Sélecteur d'articles filtré par catégorie / fournisseur, trié par libellé
+        db.Index('ix_stock_item_category_libelle', 'category_id', 'libelle'),
+        db.Index('ix_stock_item_supplier_libelle', 'supplier_id', 'libelle'),
+        # Articles sous le seuil (min_quantity > 0 puis quantity <= min_quantity, index couvrant)
+        db.Index('ix_stock_item_min_quantity', 'min_quantity', 'quantity'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     reference = db.Column(db.String(64), unique=True, nullable=False, index=True)
-    libelle = db.Column(db.String(255), nullable=False)
+    libelle = db.Column(db.String(255), nullable=False, index=True)
     item_type = db.Column(db.String(64), nullable=False)  # Type pour gérer les attributs dynamiques
     quantity = db.Column(db.Float, default=0.0)  # Changé de Integer à Float
     min_quantity = db.Column(db.Float, default=0.0)  # Changé de Integer à Float
@@ -275,15 +292,18 @@ class StockFile(db.Model):
 class StockMovement(db.Model):
     """Modèle pour les mouvements de stock (entrées/sorties)"""
     __tablename__ = 'stock_movement'
+    __table_args__ = (
+        db.Index('ix_stock_movement_item_date', 'stock_item_id', 'movement_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    movement_type = db.Column(db.String(20), nullable=False)  # 'purchase', 'sale', 'transfer', 'adjustment', 'waste', 'return'
+    movement_type = db.Column(db.String(20), nullable=False)  # 'purchase', 'sale', 'transfer', 'adjustment', 'waste', 'return', 'correction'
     quantity = db.Column(db.Float, nullable=False)
     unit_price = db.Column(db.Float)  # Prix unitaire au moment du mouvement
     total_price = db.Column(db.Float)  # Prix total (quantité * prix unitaire)
     reference = db.Column(db.String(64))  # N° facture, bon de commande, etc.
     notes = db.Column(db.Text)
-    movement_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    movement_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     recorded_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     
     # Clés étrangères
@@ -303,13 +323,50 @@ class StockMovement(db.Model):
         return f'<StockMovement {self.movement_type} - {self.quantity}>'
 
 
+class StockSnapshot(db.Model):
+    """Niveau d'un article à la clôture d'une journée (voir app/stock/history.py)"""
+    __tablename__ = 'stock_snapshot'
+    __table_args__ = (
+        db.UniqueConstraint('stock_item_id', 'snapshot_date', name='uq_stock_snapshot_item_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_item_id = db.Column(db.Integer, db.ForeignKey('stock_item.id', ondelete='CASCADE'), nullable=False)
+    snapshot_date = db.Column(db.Date, nullable=False, index=True)
+    taken_at = db.Column(db.DateTime, nullable=False, index=True)  # Instant de la photographie
+    quantity = db.Column(db.Float, nullable=False, default=0.0)
+    price = db.Column(db.Float, nullable=False, default=0.0)
+    value = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<StockSnapshot {self.stock_item_id} {self.snapshot_date}>'
+
+
+class StockRequest(db.Model):
+    """Requête de mouvements de stock déjà traitée (clé d'idempotence)"""
+    __tablename__ = 'stock_request'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_stock_request_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    idempotency_key = db.Column(db.String(64), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # SHA-256 des mouvements demandés
+    response = db.Column(db.Text, nullable=False)  # Résultat JSON renvoyé au client
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<StockRequest {self.user_id}:{self.idempotency_key}>'
+
+
 class PurchaseOrder(db.Model):
     """Modèle pour les commandes d'achat"""
     __tablename__ = 'purchase_order'
     
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(64), unique=True, nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, ordered, delivered, cancelled
+    status = db.Column(db.String(20), default='pending')  # pending, ordered, partial, delivered, cancelled
     order_date = db.Column(db.Date, nullable=False)
     delivery_date = db.Column(db.Date)
     total_amount = db.Column(db.Float, default=0.0)
@@ -360,10 +417,16 @@ class PurchaseOrderItem(db.Model):
 class Personnel(db.Model):
     """Modèle pour le personnel"""
     __tablename__ = 'personnel'
+    __table_args__ = (
+        # Liste paginée par clé, filtrée par service / statut, triée par nom
+        db.Index('ix_personnel_department_last_name', 'department', 'last_name'),
+        db.Index('ix_personnel_active_last_name', 'is_active', 'last_name'),
+        db.Index('ix_personnel_name', 'last_name', 'first_name'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.String(64), unique=True, nullable=False)
-    first_name = db.Column(db.String(64), nullable=False)
+    first_name = db.Column(db.String(64), nullable=False, index=True)
     last_name = db.Column(db.String(64), nullable=False)
     email = db.Column(db.String(120))
     phone = db.Column(db.String(20))
@@ -409,9 +472,12 @@ class Group(db.Model):
 class Client(db.Model):
     """Modèle pour les clients"""
     __tablename__ = 'client'
+    __table_args__ = (
+        db.Index('ix_client_active_name', 'is_active', 'name'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(128), nullable=False)
+    name = db.Column(db.String(128), nullable=False, index=True)
     company = db.Column(db.String(128))
     contact_person = db.Column(db.String(128))
     email = db.Column(db.String(128))
@@ -446,11 +512,15 @@ class Client(db.Model):
 class Project(db.Model):
     """Modèle pour les projets"""
     __tablename__ = 'project'
+    __table_args__ = (
+        # Projets par statut triés par date de début (listes, tableau de bord)
+        db.Index('ix_project_status_start', 'status', 'start_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(255), nullable=False, index=True)
     description = db.Column(db.Text)
-    start_date = db.Column(db.Date, nullable=False)
+    start_date = db.Column(db.Date, nullable=False, index=True)
     end_date = db.Column(db.Date, nullable=False)
     actual_end_date = db.Column(db.Date)
     estimated_budget = db.Column(db.Float, default=0.0)
@@ -459,21 +529,20 @@ class Project(db.Model):
     marge = db.Column(db.Float, default=0.0, nullable=True)
     actual_cost = db.Column(db.Float, default=0.0)
     status = db.Column(db.String(32), default='planning')  # planning, in_progress, completed, cancelled
-    priority = db.Column(db.String(32), default='medium')  # low, medium, high
+    priority = db.Column(db.String(32), default='medium', index=True)  # low, medium, high
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    client_id = db.Column(db.Integer, db.ForeignKey('client.id'))
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), index=True)
     
     # Relations
     tasks = db.relationship('Task', backref='project', lazy='dynamic', cascade='all, delete-orphan')
     files = db.relationship('ProjectFile', backref='project', lazy='dynamic', cascade='all, delete-orphan')
     
     def calculate_actual_cost(self):
-        """Calcule le coût actuel du projet"""
-        total = 0
-        for task in self.tasks:
-            total += task.calculate_cost()
+        """Calcule le coût actuel du projet (une requête groupée)"""
+        from app.projects.costs import get_project_costs
+        total = get_project_costs(self.id)['total_cost'] if self.id else 0
         self.actual_cost = total
         return total
     
@@ -507,9 +576,18 @@ class TaskType(db.Model):
 class Task(db.Model):
     """Modèle pour les tâches"""
     __tablename__ = 'task'
+    __table_args__ = (
+        # Compteurs de tâches par statut de la liste des projets
+        db.Index('ix_task_project_id_status', 'project_id', 'status'),
+        # Flux du calendrier (tâches qui chevauchent une plage)
+        db.Index('ix_task_start_end', 'start_date', 'end_date'),
+        # Tâches ouvertes par date de début (MRP, à venir) et en retard (tableau de bord)
+        db.Index('ix_task_status_start', 'status', 'start_date'),
+        db.Index('ix_task_status_end', 'status', 'end_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(255), nullable=False, index=True)
     description = db.Column(db.Text)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
@@ -533,18 +611,11 @@ class Task(db.Model):
     additional_costs = db.relationship('AdditionalCost', backref='task', lazy='dynamic', cascade='all, delete-orphan')
     
     def calculate_cost(self):
-        """Calcule le coût total de la tâche"""
-        total = 0
-        
-        # Coût des matériaux
-        for item in self.stock_items:
-            total += item.estimated_cost or 0
-        
-        # Coûts supplémentaires
-        for cost in self.additional_costs:
-            total += cost.amount
-        
-        return total
+        """Calcule le coût total de la tâche (matériaux + frais supplémentaires)"""
+        from app.projects.costs import get_task_costs
+        if not self.id:
+            return 0
+        return get_task_costs(self.id)['total_cost']
     def __init__(self, **kwargs):
         super(Task, self).__init__(**kwargs)
         # Validation des dates
@@ -561,7 +632,7 @@ class Task(db.Model):
     def check_stock_availability(self):
         """Vérifie la disponibilité des matériaux dans le stock"""
         issues = []
-        for task_item in self.stock_items:
+        for task_item in self.stock_items.options(db.joinedload(TaskStockItem.stock_item)):
             if task_item.stock_item and task_item.estimated_quantity > task_item.stock_item.quantity:
                 issues.append({
                     'item': task_item.stock_item.libelle,
@@ -573,7 +644,7 @@ class Task(db.Model):
     def calculate_material_shortage(self):
         """Calcule le manque total de matériaux"""
         shortage = 0
-        for item in self.stock_items:
+        for item in self.stock_items.options(db.joinedload(TaskStockItem.stock_item)):
             if item.stock_item:
                 item_shortage = max(0, item.estimated_quantity - item.stock_item.quantity)
                 shortage += item_shortage
@@ -598,6 +669,8 @@ class TaskStockItem(db.Model):
     unit_type = db.Column(db.String(32), default='piece')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Verrouillage optimiste : incrémenté à chaque UPDATE de la ligne
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Clés étrangères
     task_id = db.Column(db.Integer, db.ForeignKey('task.id', ondelete='CASCADE'))
@@ -608,6 +681,8 @@ class TaskStockItem(db.Model):
     stock_item = db.relationship('StockItem', back_populates='task_stock_items', foreign_keys=[stock_item_id])
     task = db.relationship('Task', back_populates='stock_items', foreign_keys=[task_id])
     
+    __mapper_args__ = {'version_id_col': version}
+    
     # Méthodes utilitaires
     def is_quantity_sufficient(self):
         """Vérifie si la quantité est suffisante dans le stock"""
@@ -629,6 +704,26 @@ class TaskStockItem(db.Model):
     def __repr__(self):
         return f'<TaskStockItem {self.id} - {self.estimated_quantity}>'
 
+
+class MaterialAllocation(db.Model):
+    """Part du stock réservée à une tâche par le calcul des besoins (voir app/stock/mrp.py)"""
+    __tablename__ = 'material_allocation'
+    __table_args__ = (
+        db.Index('ix_material_allocation_item_date', 'stock_item_id', 'need_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_item_id = db.Column(db.Integer, db.ForeignKey('stock_item.id', ondelete='CASCADE'), nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id', ondelete='CASCADE'), nullable=False, index=True)
+    need_date = db.Column(db.Date, nullable=False)  # Début de la tâche
+    required = db.Column(db.Float, nullable=False, default=0.0)
+    allocated = db.Column(db.Float, nullable=False, default=0.0)
+    shortage = db.Column(db.Float, nullable=False, default=0.0)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MaterialAllocation {self.task_id}/{self.stock_item_id}: {self.allocated}/{self.required}>'
+
 class AdditionalCost(db.Model):
     """Modèle pour les frais supplémentaires d'une tâche"""
     __tablename__ = 'additional_cost'
@@ -666,6 +761,13 @@ class ProjectFile(db.Model):
 class Notification(db.Model):
     """Modèle pour les notifications"""
     __tablename__ = 'notification'
+    __table_args__ = (
+        # Centre de notifications : pagination par clé (created_at, id)
+        db.Index('ix_notification_user_read_created', 'user_id', 'is_read', 'created_at', 'id'),
+        db.Index('ix_notification_user_created', 'user_id', 'created_at', 'id'),
+        # Archivage des notifications lues anciennes
+        db.Index('ix_notification_read_created', 'is_read', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
@@ -673,6 +775,7 @@ class Notification(db.Model):
     notification_type = db.Column(db.String(32))  # stock_alert, task_assignment, etc.
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    emailed_at = db.Column(db.DateTime)  # Envoyée dans un résumé par email
     
     # Clés étrangères
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'))
@@ -686,6 +789,49 @@ class Notification(db.Model):
     def __repr__(self):
         return f'<Notification {self.title}>'
 
+
+class NotificationArchive(db.Model):
+    """Notification lue archivée par la rétention (voir app/notifications.py)"""
+    __tablename__ = 'notification_archive'
+
+    id = db.Column(db.Integer, primary_key=True)  # Identifiant d'origine
+    title = db.Column(db.String(255), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.String(32))
+    created_at = db.Column(db.DateTime, index=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, index=True)
+    stock_item_id = db.Column(db.Integer)
+    task_id = db.Column(db.Integer)
+
+    def __repr__(self):
+        return f'<NotificationArchive {self.title}>'
+
+
+class Job(db.Model):
+    """Tâche de fond en file d'attente (voir app/jobs.py)"""
+    __tablename__ = 'job'
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Pas avant cette date
+    dedup_key = db.Column(db.String(128), index=True)  # Une seule tâche en attente par clé
+    locked_by = db.Column(db.String(64))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, index=True)
+
+    def __repr__(self):
+        return f'<Job {self.kind} {self.status}>'
+
 class DashboardChart(db.Model):
     """Modèle pour les configurations des graphiques du dashboard"""
     __tablename__ = 'dashboard_chart'
@@ -779,6 +925,11 @@ intervention_personnel = db.Table('intervention_personnel',
 class Intervention(db.Model):
     """Modèle pour les interventions"""
     __tablename__ = 'intervention'
+    __table_args__ = (
+        # Liste paginée par clé, filtrée par statut / type, triée par date
+        db.Index('ix_intervention_status_date', 'status', 'intervention_date'),
+        db.Index('ix_intervention_type_date', 'type_id', 'intervention_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     intervention_number = db.Column(db.String(50), nullable=False, unique=True)
@@ -795,7 +946,7 @@ class Intervention(db.Model):
     
     # Dates
     client_contact_date = db.Column(db.Date, nullable=False)
-    intervention_date = db.Column(db.Date, nullable=False)
+    intervention_date = db.Column(db.Date, nullable=False, index=True)
     planned_end_date = db.Column(db.Date, nullable=False)
     actual_end_date = db.Column(db.Date)
     
@@ -954,10 +1105,15 @@ class EquipmentCategory(db.Model):
 class Equipment(db.Model):
     """Modèle pour les équipements"""
     __tablename__ = 'equipment'
+    __table_args__ = (
+        # Liste paginée par clé, filtrée par statut / catégorie, triée par référence
+        db.Index('ix_equipment_status_reference', 'status', 'reference'),
+        db.Index('ix_equipment_category_reference', 'category_id', 'reference'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     reference = db.Column(db.String(64), unique=True, nullable=False, index=True)
-    name = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(255), nullable=False, index=True)
     description = db.Column(db.Text)
     serial_number = db.Column(db.String(128), unique=True)
     model = db.Column(db.String(128))
@@ -1123,3 +1279,39 @@ class TaskExternalRef(db.Model):
     def __repr__(self):
         return f'<TaskExternalRef {self.reference} ({self.item_type}) task={self.task_id}>'
 
+
+class SearchToken(db.Model):
+    """Index inversé de la recherche globale (un jeton par entité indexée)"""
+    __tablename__ = 'search_token'
+    __table_args__ = (
+        # Recherche par préfixe : token LIKE 'abc%'
+        db.Index('ix_search_token_token', 'token', 'entity_type', 'entity_id'),
+        # Réindexation d'une entité
+        db.Index('ix_search_token_entity', 'entity_type', 'entity_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(64), nullable=False)
+    entity_type = db.Column(db.String(32), nullable=False)  # stock, project, task, personnel
+    entity_id = db.Column(db.Integer, nullable=False)
+    weight = db.Column(db.Float, default=1.0, nullable=False)
+
+    def __repr__(self):
+        return f'<SearchToken {self.token} {self.entity_type}:{self.entity_id}>'
+
+class RecentItem(db.Model):
+    """Éléments récemment choisis par un utilisateur (classement de l'autocomplétion)"""
+    __tablename__ = 'recent_item'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'entity_type', 'entity_id', name='uq_recent_item_entity'),
+        db.Index('ix_recent_item_user_type_used', 'user_id', 'entity_type', 'used_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    entity_type = db.Column(db.String(32), nullable=False)  # stock, task, personnel, project
+    entity_id = db.Column(db.Integer, nullable=False)
+    used_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<RecentItem {self.user_id} {self.entity_type}:{self.entity_id}>'
@@ -0,0 +1,295 @@
+"""
+Diffusion des notifications
+
+notify() ne crée pas les notifications pendant la requête : il met en file
+une tâche de diffusion (app/jobs.py). Le worker résout les destinataires
+(utilisateurs et rôles) de toutes les diffusions en attente et insère les
+notifications en un seul INSERT.
+
+Les notifications des types listés dans NOTIFICATION_EMAIL_TYPES sont
+également envoyées par email, regroupées dans un résumé par utilisateur :
+la première notification programme un résumé à
+NOTIFICATION_DIGEST_MINUTES, les suivantes le rejoignent.
+
+Centre de notifications : pages par clé sur (user_id, is_read, created_at,
+id), marquage et suppression par UPDATE / DELETE ensemblistes. Les
+notifications lues de plus de NOTIFICATION_RETENTION_DAYS jours sont
+déplacées par lots dans `notification_archive` (`flask archive-notifications`).
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.jobs import enqueue, enqueue_many, job_handler
+from app.pagination import decode_cursor, encode_cursor, keyset_condition
+
+FANOUT_JOB = 'notifications.fanout'
+DIGEST_JOB = 'notifications.digest'
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def notify(title, message, notification_type, user_ids=(), roles=(), task_id=None, stock_item_id=None):
+    """
+    Met en file une notification pour des utilisateurs et/ou des rôles
+
+    La tâche fait partie de la transaction en cours : elle est diffusée
+    après le commit de l'appelant.
+    """
+    return enqueue(FANOUT_JOB, {
+        'title': title,
+        'message': message,
+        'notification_type': notification_type,
+        'user_ids': list(user_ids),
+        'roles': list(roles),
+        'task_id': task_id,
+        'stock_item_id': stock_item_id
+    })
+
+
+def queue_digests(user_ids):
+    """Programme un résumé par email pour chaque utilisateur (un seul en attente)"""
+    user_ids = sorted({i for i in user_ids if i})
+    if not user_ids:
+        return 0
+    delay = current_app.config.get('NOTIFICATION_DIGEST_MINUTES', 15)
+    return enqueue_many(
+        DIGEST_JOB,
+        [{'user_id': user_id} for user_id in user_ids],
+        run_at=datetime.utcnow() + timedelta(minutes=delay),
+        dedup_keys=[f'digest:{user_id}' for user_id in user_ids]
+    )
+
+
+def insert_notifications(rows):
+    """
+    Insère des notifications en masse et programme les résumés email
+
+    Args:
+        rows: dicts user_id, title, message, notification_type, et
+            optionnellement task_id, stock_item_id
+    """
+    from app.models import Notification
+    from app.counters import invalidate_navbar_counters
+
+    if not rows:
+        return 0
+    columns = ('user_id', 'title', 'message', 'notification_type', 'task_id', 'stock_item_id')
+    db.session.execute(insert(Notification), [
+        dict({column: row.get(column) for column in columns}, is_read=False) for row in rows
+    ])
+    # L'insertion en masse ne passe pas par le flush de l'ORM
+    invalidate_navbar_counters({row['user_id'] for row in rows})
+
+    email_types = current_app.config.get('NOTIFICATION_EMAIL_TYPES', ())
+    queue_digests(row['user_id'] for row in rows if row['notification_type'] in email_types)
+    return len(rows)
+
+
+@job_handler(FANOUT_JOB, batch=True)
+def _fan_out(payloads):
+    from app.models import User, Role
+
+    roles = {role for payload in payloads for role in payload.get('roles', ())}
+    members = {}
+    if roles:
+        for role, user_id in db.session.execute(
+            select(Role.name, User.id).join(User, User.role_id == Role.id)
+            .where(Role.name.in_(roles), User.is_active.isnot(False))
+        ):
+            members.setdefault(role, set()).add(user_id)
+
+    rows = []
+    for payload in payloads:
+        recipients = set(payload.get('user_ids', ()))
+        for role in payload.get('roles', ()):
+            recipients |= members.get(role, set())
+        rows.extend(dict(payload, user_id=user_id) for user_id in sorted(recipients))
+    insert_notifications(rows)
+
+
+@job_handler(DIGEST_JOB)
+def _send_digest(payload):
+    from app.models import User, Notification
+    from app.mail import send_email
+
+    user = db.session.get(User, payload['user_id'])
+    if user is None or not user.email:
+        return
+
+    email_types = current_app.config.get('NOTIFICATION_EMAIL_TYPES', ())
+    notifications = db.session.execute(
+        select(Notification.id, Notification.title, Notification.message, Notification.created_at)
+        .where(Notification.user_id == user.id,
+               Notification.is_read == False,
+               Notification.emailed_at.is_(None),
+               Notification.notification_type.in_(email_types))
+        .order_by(Notification.created_at)
+    ).all()
+    if not notifications:
+        return
+
+    sent = send_email(
+        f'{len(notifications)} nouvelle(s) notification(s)',
+        [user.email],
+        # Rendu hors requête : sans les context processors (utilisateur courant)
+        current_app.jinja_env.get_template('email/notification_digest.html').render(
+            user=user, notifications=notifications, app_name=current_app.config.get('APP_NAME', 'Invento')
+        )
+    )
+    if not sent:
+        return
+    db.session.execute(
+        update(Notification)
+        .where(Notification.id.in_([notification.id for notification in notifications]))
+        .values(emailed_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+
+
+# ==================== CENTRE DE NOTIFICATIONS ====================
+
+def list_notifications(user_id, unread_only=False, cursor=None, limit=20):
+    """
+    Page de notifications d'un utilisateur, des plus récentes aux plus anciennes
+
+    Args:
+        cursor: Jeton renvoyé par la page précédente (None pour la première)
+
+    Returns:
+        tuple: (notifications, curseur de la page suivante ou None)
+
+    Raises:
+        ValueError: Curseur invalide
+    """
+    from app.models import Notification
+
+    query = Notification.query.options(
+        joinedload(Notification.stock_item), joinedload(Notification.task)
+    ).filter(Notification.user_id == user_id)
+    if unread_only:
+        query = query.filter(Notification.is_read == False)
+    if cursor:
+        created_at, notification_id = decode_cursor(cursor, datetime.fromisoformat, int)
+        query = query.filter(keyset_condition(
+            (Notification.created_at, Notification.id), (created_at, notification_id)
+        ))
+
+    notifications = query.order_by(Notification.created_at.desc(), Notification.id.desc()) \
+        .limit(limit + 1).all()
+    next_cursor = None
+    if len(notifications) > limit:
+        notifications = notifications[:limit]
+        last = notifications[-1]
+        next_cursor = encode_cursor([last.created_at, last.id])
+    return notifications, next_cursor
+
+
+def notification_counts(user_id):
+    """{'total', 'unread'} en une requête"""
+    from app.models import Notification
+
+    total, unread = db.session.execute(
+        select(func.count(Notification.id),
+               func.coalesce(func.sum(db.case((Notification.is_read == False, 1), else_=0)), 0))
+        .where(Notification.user_id == user_id)
+    ).one()
+    return {'total': total, 'unread': unread}
+
+
+def _owned(user_id, ids):
+    from app.models import Notification
+
+    conditions = [Notification.user_id == user_id]
+    if ids is not None:
+        conditions.append(Notification.id.in_(ids))
+    return conditions
+
+
+def mark_read(user_id, ids=None):
+    """
+    Marque comme lues des notifications (toutes si ids est None) en un UPDATE
+
+    Returns:
+        int: Nombre de notifications modifiées
+    """
+    from app.models import Notification
+    from app.counters import invalidate_navbar_counters
+
+    result = db.session.execute(
+        update(Notification)
+        .where(*_owned(user_id, ids), Notification.is_read == False)
+        .values(is_read=True),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    # La mise à jour en masse ne passe pas par le flush de l'ORM
+    invalidate_navbar_counters(user_id)
+    return result.rowcount
+
+
+def delete_notifications(user_id, ids=None, read_only=False):
+    """
+    Supprime des notifications de l'utilisateur en un DELETE
+
+    Args:
+        ids: Notifications visées (toutes si None)
+        read_only: Ne supprimer que les notifications lues
+
+    Returns:
+        int: Nombre de notifications supprimées
+    """
+    from app.models import Notification
+    from app.counters import invalidate_navbar_counters
+
+    conditions = _owned(user_id, ids)
+    if read_only:
+        conditions.append(Notification.is_read == True)
+    result = db.session.execute(
+        delete(Notification).where(*conditions),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    invalidate_navbar_counters(user_id)
+    return result.rowcount
+
+
+def archive_notifications(days=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Déplace les notifications lues plus anciennes que `days` jours vers
+    notification_archive, par lots (INSERT ... SELECT puis DELETE, une
+    transaction par lot)
+
+    Returns:
+        int: Nombre de notifications archivées
+    """
+    from app.models import Notification, NotificationArchive
+
+    days = days if days is not None else current_app.config.get('NOTIFICATION_RETENTION_DAYS', 90)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    columns = ('id', 'title', 'message', 'notification_type', 'created_at',
+               'user_id', 'stock_item_id', 'task_id')
+
+    archived = 0
+    while True:
+        ids = db.session.execute(
+            select(Notification.id)
+            .where(Notification.is_read == True, Notification.created_at < cutoff)
+            .order_by(Notification.created_at)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(insert(NotificationArchive).from_select(
+            list(columns),
+            select(*[getattr(Notification, column) for column in columns]).where(Notification.id.in_(ids))
+        ))
+        db.session.execute(delete(Notification).where(Notification.id.in_(ids)),
+                           execution_options={'synchronize_session': False})
+        db.session.commit()
+        archived += len(ids)
+        if len(ids) < batch_size:
+            break
+    return archived
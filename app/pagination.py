@@ -0,0 +1,73 @@
+"""
+Pagination par clé (keyset)
+
+Au lieu d'un OFFSET, la page suivante est désignée par les valeurs des
+colonnes de tri de la dernière ligne reçue (le curseur). La base parcourt
+l'index à partir de cette position : le coût d'une page ne dépend pas de sa
+profondeur, et les insertions concurrentes ne décalent pas les pages.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+
+def _to_json(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    """Encode les valeurs de tri de la dernière ligne en jeton opaque"""
+    payload = json.dumps([_to_json(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, *types):
+    """
+    Décode un curseur produit par encode_cursor
+
+    Args:
+        token: Jeton reçu du client
+        types: Conversion appliquée à chaque valeur (ex. date.fromisoformat)
+
+    Raises:
+        ValueError: Jeton illisible ou de longueur inattendue
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError) as exc:
+        raise ValueError('Curseur invalide') from exc
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError('Curseur invalide')
+    try:
+        return [convert(value) if value is not None else None
+                for convert, value in zip(types, values)]
+    except (ValueError, TypeError) as exc:
+        raise ValueError('Curseur invalide') from exc
+
+
+def keyset_condition(columns, values, descending=True):
+    """
+    Condition « après le curseur » pour un tri lexicographique sur `columns`
+
+    (a, b) décroissant donne : a < va OR (a = va AND b < vb)
+    """
+    clauses = []
+    for position, (column, value) in enumerate(zip(columns, values)):
+        equal_prefix = [c == v for c, v in zip(columns[:position], values[:position])]
+        step = column < value if descending else column > value
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+def parse_limit(raw, default, maximum=100):
+    """Taille de page demandée, bornée à [1, maximum]"""
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
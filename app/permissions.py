@@ -0,0 +1,116 @@
+"""
+Permissions compilées des rôles
+
+Le JSON `Role.permissions` est analysé une seule fois par rôle puis conservé
+en mémoire sous forme d'un ensemble figé (module, action). La clé du cache
+contient le hash du texte JSON : un rôle modifié par un autre worker produit
+une nouvelle clé, l'ancienne entrée n'est alors jamais relue.
+"""
+import json
+import threading
+
+from flask import g, has_app_context, has_request_context
+
+
+class CompiledPermissions:
+    """Ensemble figé et hashable des permissions accordées à un rôle"""
+    __slots__ = ('grants', 'is_admin')
+
+    def __init__(self, grants=(), is_admin=False):
+        object.__setattr__(self, 'grants', frozenset(grants))
+        object.__setattr__(self, 'is_admin', bool(is_admin))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CompiledPermissions est immuable')
+
+    def allows(self, module, action):
+        """Vérifie si l'action est accordée sur le module"""
+        return self.is_admin or (module, action) in self.grants
+
+    def __hash__(self):
+        return hash((self.grants, self.is_admin))
+
+    def __eq__(self, other):
+        if not isinstance(other, CompiledPermissions):
+            return NotImplemented
+        return self.grants == other.grants and self.is_admin == other.is_admin
+
+    def __repr__(self):
+        return f'<CompiledPermissions admin={self.is_admin} grants={len(self.grants)}>'
+
+
+NO_PERMISSIONS = CompiledPermissions()
+ALL_PERMISSIONS = CompiledPermissions(is_admin=True)
+
+# (role_id, hash du JSON) -> CompiledPermissions
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def compile_permissions(permissions_dict, is_admin=False):
+    """Construit un CompiledPermissions depuis un dictionnaire de permissions"""
+    grants = []
+    for module, actions in (permissions_dict or {}).items():
+        if not isinstance(actions, dict):
+            continue
+        for action, allowed in actions.items():
+            if allowed:
+                grants.append((module, action))
+    return CompiledPermissions(grants, is_admin=is_admin)
+
+
+def get_role_permissions(role):
+    """Retourne les permissions compilées d'un rôle (cache par processus)"""
+    if role is None:
+        return NO_PERMISSIONS
+
+    raw = role.permissions or '{}'
+    key = (role.id, hash(raw))
+    compiled = _cache.get(key)
+    if compiled is None:
+        try:
+            permissions_dict = json.loads(raw)
+        except (TypeError, ValueError):
+            permissions_dict = {}
+        compiled = compile_permissions(permissions_dict)
+        # Un rôle non encore persisté n'a pas d'id : ne pas le mettre en cache
+        if role.id is not None:
+            with _cache_lock:
+                _cache[key] = compiled
+    return compiled
+
+
+def get_user_permissions(user):
+    """
+    Retourne les permissions compilées d'un utilisateur
+
+    Le résultat est mémorisé dans `g` pour la durée de la requête, afin que le
+    décorateur et les templates partagent le même objet.
+    """
+    if user is None or not getattr(user, 'is_authenticated', False):
+        return NO_PERMISSIONS
+    # L'admin a tous les droits
+    if user.role and user.role.name == 'admin':
+        return ALL_PERMISSIONS
+
+    if has_request_context():
+        memo = g.setdefault('_compiled_permissions', {})
+        compiled = memo.get(user.id)
+        if compiled is None:
+            compiled = memo[user.id] = get_role_permissions(user.role)
+        return compiled
+
+    return get_role_permissions(user.role)
+
+
+def invalidate_role_permissions(role_id=None):
+    """Supprime du cache les permissions d'un rôle (ou de tous les rôles)"""
+    with _cache_lock:
+        if role_id is None:
+            _cache.clear()
+        else:
+            for key in [k for k in _cache if k[0] == role_id]:
+                del _cache[key]
+
+    if has_app_context():
+        g.pop('_compiled_permissions', None)
@@ -0,0 +1,228 @@
+"""
+Consolidation des coûts des projets
+
+Les coûts matériaux (TaskStockItem.estimated_cost) et les frais
+supplémentaires (AdditionalCost.amount) sont agrégés en une seule requête
+groupée par tâche, puis consolidés par projet et par client. Les montants
+stockés sur `Project` (actual_cost, budget_reel, marge) sont recalculés par
+un UPDATE ensembliste au commit, uniquement pour les projets dont une ligne
+de coût a changé.
+"""
+from itertools import chain
+
+from sqlalchemy import event, func, inspect, literal, select, union_all, update
+from sqlalchemy.orm import Session
+
+from app import db
+
+
+def _empty_costs():
+    return {'material_cost': 0.0, 'additional_cost': 0.0, 'total_cost': 0.0}
+
+
+def _add_costs(totals, material, additional):
+    totals['material_cost'] += material
+    totals['additional_cost'] += additional
+    totals['total_cost'] += material + additional
+
+
+def _cost_lines(task_ids=None, project_ids=None, client_ids=None):
+    """Lignes (task_id, project_id, material, additional) des deux sources de coût"""
+    from app.models import Task, Project, TaskStockItem, AdditionalCost
+
+    def restrict(query):
+        if task_ids is not None:
+            query = query.where(Task.id.in_(task_ids))
+        if project_ids is not None:
+            query = query.where(Task.project_id.in_(project_ids))
+        if client_ids is not None:
+            query = query.where(Task.project_id.in_(
+                select(Project.id).where(Project.client_id.in_(client_ids))
+            ))
+        return query
+
+    materials = restrict(select(
+        Task.id.label('task_id'),
+        Task.project_id.label('project_id'),
+        func.coalesce(TaskStockItem.estimated_cost, 0).label('material'),
+        literal(0.0).label('additional')
+    ).join(TaskStockItem, TaskStockItem.task_id == Task.id))
+
+    additional = restrict(select(
+        Task.id.label('task_id'),
+        Task.project_id.label('project_id'),
+        literal(0.0).label('material'),
+        func.coalesce(AdditionalCost.amount, 0).label('additional')
+    ).join(AdditionalCost, AdditionalCost.task_id == Task.id))
+
+    return union_all(materials, additional).subquery('cost_lines')
+
+
+def compute_cost_rollup(task_ids=None, project_ids=None, client_ids=None):
+    """
+    Calcule les coûts par tâche, par projet et par client en une requête
+
+    Args:
+        task_ids: Restreindre aux tâches indiquées
+        project_ids: Restreindre aux projets indiqués
+        client_ids: Restreindre aux projets des clients indiqués
+
+    Returns:
+        dict: {'tasks': {...}, 'projects': {...}, 'clients': {...}}, chaque
+            entrée contenant material_cost, additional_cost et total_cost.
+            Les éléments sans aucun coût sont absents.
+    """
+    from app.models import Project
+
+    lines = _cost_lines(task_ids, project_ids, client_ids)
+    rows = db.session.execute(
+        select(
+            lines.c.task_id,
+            lines.c.project_id,
+            Project.client_id,
+            func.sum(lines.c.material).label('material'),
+            func.sum(lines.c.additional).label('additional')
+        )
+        .select_from(lines)
+        .outerjoin(Project, Project.id == lines.c.project_id)
+        .group_by(lines.c.task_id, lines.c.project_id, Project.client_id)
+    ).all()
+
+    rollup = {'tasks': {}, 'projects': {}, 'clients': {}}
+    for row in rows:
+        material = float(row.material or 0)
+        additional = float(row.additional or 0)
+        _add_costs(rollup['tasks'].setdefault(row.task_id, _empty_costs()), material, additional)
+        if row.project_id is not None:
+            _add_costs(rollup['projects'].setdefault(row.project_id, _empty_costs()), material, additional)
+        if row.client_id is not None:
+            _add_costs(rollup['clients'].setdefault(row.client_id, _empty_costs()), material, additional)
+    return rollup
+
+
+def get_task_costs(task_id):
+    """Retourne les coûts d'une tâche (une requête)"""
+    return compute_cost_rollup(task_ids=[task_id])['tasks'].get(task_id, _empty_costs())
+
+
+def get_project_costs(project_id):
+    """Retourne les coûts consolidés d'un projet (une requête)"""
+    return compute_cost_rollup(project_ids=[project_id])['projects'].get(project_id, _empty_costs())
+
+
+def _project_cost_expression():
+    """Coût total d'un projet, sous-requêtes corrélées sur project.id"""
+    from app.models import Project, Task, TaskStockItem, AdditionalCost
+
+    materials = select(func.coalesce(func.sum(TaskStockItem.estimated_cost), 0)) \
+        .join(Task, Task.id == TaskStockItem.task_id) \
+        .where(Task.project_id == Project.id) \
+        .correlate(Project).scalar_subquery()
+    additional = select(func.coalesce(func.sum(AdditionalCost.amount), 0)) \
+        .join(Task, Task.id == AdditionalCost.task_id) \
+        .where(Task.project_id == Project.id) \
+        .correlate(Project).scalar_subquery()
+    return materials + additional
+
+
+def refresh_project_costs(project_ids=None):
+    """
+    Recalcule actual_cost, budget_reel et marge en un seul UPDATE
+
+    Args:
+        project_ids: Projets à recalculer ; None pour tous les projets
+            (utilisé par `flask recompute-costs`)
+
+    Returns:
+        int: Nombre de projets mis à jour
+    """
+    from app.models import Project
+
+    if project_ids is not None:
+        project_ids = {i for i in project_ids if i}
+        if not project_ids:
+            return 0
+
+    total = _project_cost_expression()
+    statement = update(Project).values(
+        actual_cost=total,
+        budget_reel=total,
+        marge=func.coalesce(Project.prix_vente, 0) - total
+    )
+    if project_ids is not None:
+        statement = statement.where(Project.id.in_(project_ids))
+
+    result = db.session.execute(statement, execution_options={'synchronize_session': False})
+
+    # Les instances chargées relisent les montants au prochain accès
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Project) and (project_ids is None or obj.id in project_ids):
+            db.session.expire(obj, ['actual_cost', 'budget_reel', 'marge'])
+
+    return result.rowcount
+
+
+# ==================== MISE À JOUR INCRÉMENTALE ====================
+# Les projets touchés par un flush sont notés (directement ou via leurs
+# tâches), puis recalculés dans la même transaction juste avant le commit.
+
+def _pending(session):
+    return session.info.setdefault('project_costs', {'tasks': set(), 'projects': set()})
+
+
+def _history_values(obj, attribute):
+    history = inspect(obj).attrs[attribute].history
+    return [value for value in history.sum() if value is not None]
+
+
+def _cost_changed(obj, *attributes):
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_cost_changes(session, flush_context):
+    from app.models import Task, TaskStockItem, AdditionalCost
+
+    pending = None
+    for obj in chain(session.new, session.deleted):
+        if isinstance(obj, (TaskStockItem, AdditionalCost)) and obj.task_id:
+            pending = pending or _pending(session)
+            pending['tasks'].add(obj.task_id)
+        elif isinstance(obj, Task) and obj.project_id and obj in session.deleted:
+            pending = pending or _pending(session)
+            pending['projects'].add(obj.project_id)
+
+    for obj in session.dirty:
+        if isinstance(obj, TaskStockItem) and _cost_changed(obj, 'estimated_cost', 'task_id'):
+            pending = pending or _pending(session)
+            pending['tasks'].update(_history_values(obj, 'task_id'))
+        elif isinstance(obj, AdditionalCost) and _cost_changed(obj, 'amount', 'task_id'):
+            pending = pending or _pending(session)
+            pending['tasks'].update(_history_values(obj, 'task_id'))
+        elif isinstance(obj, Task) and _cost_changed(obj, 'project_id'):
+            pending = pending or _pending(session)
+            pending['projects'].update(_history_values(obj, 'project_id'))
+
+
+@event.listens_for(Session, 'before_commit')
+def _apply_cost_changes(session):
+    from app.models import Task
+
+    # Les changements encore en attente doivent être vus par after_flush
+    session.flush()
+    pending = session.info.pop('project_costs', None)
+    if not pending:
+        return
+
+    project_ids = set(pending['projects'])
+    if pending['tasks']:
+        project_ids.update(session.execute(
+            select(Task.project_id).where(Task.id.in_(pending['tasks'])).distinct()
+        ).scalars())
+    refresh_project_costs(project_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_cost_changes(session):
+    session.info.pop('project_costs', None)
@@ -5,6 +5,7 @@ from wtforms import DecimalField,HiddenField,StringField, TextAreaField, SubmitF
 from wtforms.validators import DataRequired, Length, Optional, NumberRange, ValidationError
 from datetime import date
 from wtforms.widgets import ListWidget, CheckboxInput
+from app.forms import TypeaheadSelectField, TypeaheadSelectMultipleField
 
 class MultiCheckboxField(SelectMultipleField):
     widget = ListWidget(prefix_label=False)
@@ -21,7 +22,7 @@ class ProjectForm(FlaskForm):
     start_date = DateField('Date de début*', validators=[DataRequired()], format='%Y-%m-%d')
     end_date = DateField('Date de fin prévue*', validators=[DataRequired()], format='%Y-%m-%d')
     estimated_budget = FloatField('Budget estimé (TND)', validators=[Optional(),NumberRange(min=0, message='Le budget doit être positif')], default=0.0)
-    budget_reel = FloatField('Budget réel (TND)', validators=[Optional(),NumberRange(min=0, message='Le budget réel doit être positif')], default=0.0)
+    budget_reel = FloatField('Budget réel (TND)', validators=[Optional()], default=0.0)  # Calculé : coûts des tâches
     prix_vente = FloatField('Prix de vente (TND)', validators=[Optional(),NumberRange(min=0, message='Le prix de vente doit être positif')], default=0.0)
     marge = FloatField('Marge (TND)', validators=[Optional()], default=0.0)
     status = SelectField('Statut', choices=[
@@ -85,7 +86,7 @@ class TaskForm(FlaskForm):
     notes = TextAreaField('Notes générales', validators=[Optional()])
     
     # Assignation (personnel OU groupes)
-    assigned_personnel = SelectMultipleField('Personnel assigné', coerce=int, validators=[Optional()])
+    assigned_personnel = TypeaheadSelectMultipleField('Personnel assigné', source='personnel', validators=[Optional()])
     assigned_groups = SelectMultipleField('Groupes assignés', coerce=int, validators=[Optional()])
     # Pour l'assignation exclusive (soit personnel, soit groupes)
     assignment_type = SelectField('Type d\'assignation', choices=[
@@ -103,7 +104,7 @@ class TaskForm(FlaskForm):
 
 class TaskStockItemForm(FlaskForm):
     """Formulaire pour les éléments de stock d'une tâche"""
-    stock_item_id = SelectField('Élément de stock*', coerce=int, validators=[DataRequired()])
+    stock_item_id = TypeaheadSelectField('Élément de stock*', source='stock', validators=[DataRequired()])
     estimated_quantity = DecimalField('Quantité estimée*', places=2, validators=[
         DataRequired(),
         NumberRange(min=0.01, message='La quantité doit être supérieure à 0')
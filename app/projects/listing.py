@@ -0,0 +1,164 @@
+"""
+Liste des projets calculée en SQL
+
+Nom du client, nombre de tâches par statut et progression sont obtenus par
+une seule requête (jointures externes + agrégats conditionnels groupés par
+projet), au lieu d'un chargement des tâches par projet affiché. La liste
+JSON est paginée par clé sur (start_date, id) décroissants.
+"""
+from datetime import date
+
+from sqlalchemy import case, func, select
+
+from app import db
+from app.pagination import decode_cursor, encode_cursor, keyset_condition
+
+TASK_STATUSES = ('pending', 'in_progress', 'completed', 'cancelled')
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _task_count_columns():
+    from app.models import Task
+    columns = [func.count(Task.id).label('total')]
+    columns.extend(_count_if(Task.status == status).label(status) for status in TASK_STATUSES)
+    return columns
+
+
+def _task_counts(row):
+    counts = {'total': int(row.total or 0)}
+    counts.update((status, int(getattr(row, status) or 0)) for status in TASK_STATUSES)
+    return counts
+
+
+def progress_from_counts(counts):
+    """Pourcentage de tâches terminées (même règle que Project.get_progress)"""
+    if not counts['total']:
+        return 0
+    return counts['completed'] / counts['total'] * 100
+
+
+def project_filters(status=None, priority=None, client_id=None, search=None):
+    """Conditions de filtrage de la liste des projets"""
+    from app.models import Project
+
+    conditions = []
+    if status:
+        conditions.append(Project.status == status)
+    if priority:
+        conditions.append(Project.priority == priority)
+    if client_id:
+        conditions.append(Project.client_id == client_id)
+    if search:
+        conditions.append(db.or_(
+            Project.name.ilike(f'%{search}%'),
+            Project.description.ilike(f'%{search}%')
+        ))
+    return conditions
+
+
+def get_task_counts(project_ids):
+    """
+    Nombre de tâches par statut et progression, pour plusieurs projets
+
+    Returns:
+        dict: {project_id: {'total', 'pending', ..., 'progress'}}
+    """
+    from app.models import Task
+
+    project_ids = list(project_ids)
+    result = {
+        project_id: dict({'total': 0}, **{status: 0 for status in TASK_STATUSES}, progress=0)
+        for project_id in project_ids
+    }
+    if not project_ids:
+        return result
+
+    rows = db.session.execute(
+        select(Task.project_id, *_task_count_columns())
+        .where(Task.project_id.in_(project_ids))
+        .group_by(Task.project_id)
+    ).all()
+    for row in rows:
+        counts = _task_counts(row)
+        counts['progress'] = progress_from_counts(counts)
+        result[row.project_id] = counts
+    return result
+
+
+def get_project_stats():
+    """Compteurs de la page projets, en une requête"""
+    from app.models import Project
+
+    row = db.session.execute(select(
+        _count_if(Project.status == 'in_progress').label('in_progress'),
+        _count_if(Project.status == 'completed').label('completed'),
+        _count_if(Project.priority == 'high').label('high_priority')
+    )).one()
+    return {name: int(value or 0) for name, value in row._mapping.items()}
+
+
+def list_projects(filters=(), cursor=None, limit=20):
+    """
+    Page de projets avec client, compteurs de tâches et progression
+
+    Args:
+        filters: Conditions renvoyées par project_filters()
+        cursor: Curseur de la page précédente (None pour la première page)
+        limit: Nombre de projets par page
+
+    Returns:
+        tuple: (liste de dicts, curseur suivant ou None)
+
+    Raises:
+        ValueError: Curseur invalide
+    """
+    from app.models import Project, Client, Task
+
+    query = select(
+        Project.id, Project.name, Project.status, Project.priority,
+        Project.start_date, Project.end_date, Project.estimated_budget,
+        Project.actual_cost, Project.client_id, Client.name.label('client_name'),
+        *_task_count_columns()
+    ).select_from(Project) \
+        .outerjoin(Client, Client.id == Project.client_id) \
+        .outerjoin(Task, Task.project_id == Project.id) \
+        .where(*filters) \
+        .group_by(Project.id, Client.id, Client.name) \
+        .order_by(Project.start_date.desc(), Project.id.desc()) \
+        .limit(limit + 1)
+
+    if cursor:
+        start_date, project_id = decode_cursor(cursor, date.fromisoformat, int)
+        query = query.where(keyset_condition(
+            [Project.start_date, Project.id], [start_date, project_id]
+        ))
+
+    rows = db.session.execute(query).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        counts = _task_counts(row)
+        items.append({
+            'id': row.id,
+            'name': row.name,
+            'status': row.status,
+            'priority': row.priority,
+            'start_date': row.start_date.isoformat() if row.start_date else None,
+            'end_date': row.end_date.isoformat() if row.end_date else None,
+            'estimated_budget': float(row.estimated_budget or 0),
+            'actual_cost': float(row.actual_cost or 0),
+            'client_id': row.client_id,
+            'client_name': row.client_name,
+            'task_counts': counts,
+            'progress': round(progress_from_counts(counts), 1)
+        })
+
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = encode_cursor([rows[-1].start_date, rows[-1].id])
+    return items, next_cursor
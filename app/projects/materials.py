@@ -0,0 +1,342 @@
+"""
+Espace matériaux d'une tâche
+
+Les lignes de la tâche sont lues en une requête (lignes, article et
+disponibilité, manque planifié par le calcul des besoins), au lieu d'un
+chargement de l'article par ligne affichée.
+
+Le sélecteur d'articles n'embarque plus le catalogue dans la page : il
+interroge une liste filtrée (catégorie, fournisseur, préfixe de référence
+ou de libellé) et paginée par clé sur (libelle, id). Catégories et
+fournisseurs ne sont chargés qu'à l'ouverture du sélecteur.
+
+Les quantités de la table sont modifiées par lots (apply_material_edits),
+avec contrôle de version optimiste par ligne.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, inspect, or_, select, update
+from sqlalchemy.orm import contains_eager
+
+from app import db
+from app.pagination import decode_cursor, encode_cursor, keyset_condition
+from app.typeahead import prefix_pattern
+
+
+def task_lines(task_id):
+    """
+    Lignes de matériaux d'une tâche, article chargé par la même requête
+
+    Returns:
+        list: TaskStockItem (stock_item déjà chargé)
+    """
+    from app.models import TaskStockItem, StockItem
+
+    return TaskStockItem.query \
+        .outerjoin(StockItem, StockItem.id == TaskStockItem.stock_item_id) \
+        .options(contains_eager(TaskStockItem.stock_item)) \
+        .filter(TaskStockItem.task_id == task_id) \
+        .order_by(TaskStockItem.id) \
+        .all()
+
+
+def split_lines(lines):
+    """(suffisantes, en manque, à retourner au stock)"""
+    sufficient, shortage, returns = [], [], []
+    for line in lines:
+        (sufficient if line.is_quantity_sufficient() else shortage).append(line)
+        if line.return_to_stock:
+            returns.append(line)
+    return sufficient, shortage, returns
+
+
+def workspace(task_id):
+    """
+    Lignes de la tâche avec disponibilité, en une requête de colonnes
+
+    Returns:
+        dict: lines, summary (total, sufficient, shortage, returns)
+    """
+    from app.models import TaskStockItem, StockItem, MaterialAllocation
+
+    rows = db.session.execute(
+        select(TaskStockItem.id, TaskStockItem.stock_item_id, TaskStockItem.estimated_quantity,
+               TaskStockItem.additional_quantity, TaskStockItem.actual_quantity_used,
+               TaskStockItem.remaining_quantity, TaskStockItem.return_to_stock,
+               TaskStockItem.unit_type, TaskStockItem.justification_shortage,
+               StockItem.reference, StockItem.libelle, StockItem.quantity.label('available'),
+               StockItem.unit, MaterialAllocation.shortage.label('planned_shortage'))
+        .outerjoin(StockItem, StockItem.id == TaskStockItem.stock_item_id)
+        .outerjoin(MaterialAllocation, and_(MaterialAllocation.task_id == TaskStockItem.task_id,
+                                            MaterialAllocation.stock_item_id == TaskStockItem.stock_item_id))
+        .where(TaskStockItem.task_id == task_id)
+        .order_by(TaskStockItem.id)
+    ).all()
+
+    lines = []
+    summary = {'total': len(rows), 'sufficient': 0, 'shortage': 0, 'returns': 0}
+    for row in rows:
+        estimated = row.estimated_quantity or 0.0
+        available = row.available
+        # Même règle que TaskStockItem.is_quantity_sufficient
+        sufficient = available is not None and estimated <= available
+        summary['sufficient' if sufficient else 'shortage'] += 1
+        summary['returns'] += bool(row.return_to_stock)
+        lines.append({
+            'id': row.id,
+            'stock_item_id': row.stock_item_id,
+            'reference': row.reference,
+            'libelle': row.libelle,
+            'unit': row.unit,
+            'unit_type': row.unit_type or 'piece',
+            'estimated_quantity': estimated,
+            'additional_quantity': row.additional_quantity or 0.0,
+            'actual_quantity_used': row.actual_quantity_used,
+            'remaining_quantity': row.remaining_quantity,
+            'return_to_stock': bool(row.return_to_stock),
+            'available': available,
+            'sufficient': sufficient,
+            'shortage': 0.0 if available is None else max(estimated - available, 0.0),
+            'planned_shortage': row.planned_shortage or 0.0,
+            'justified': bool(row.justification_shortage)
+        })
+    return {'lines': lines, 'summary': summary}
+
+
+def picker_filters():
+    """Catégories et fournisseurs proposés par le sélecteur (id, nom)"""
+    from app.models import StockCategory, Supplier
+
+    return {
+        'categories': [{'id': row.id, 'name': row.name} for row in db.session.execute(
+            select(StockCategory.id, StockCategory.name).order_by(StockCategory.name)
+        )],
+        'suppliers': [{'id': row.id, 'name': row.name} for row in db.session.execute(
+            select(Supplier.id, Supplier.name).order_by(Supplier.name)
+        )]
+    }
+
+
+def picker_items(text='', category_id=None, supplier_id=None, cursor=None, limit=50):
+    """
+    Page d'articles pour le sélecteur, triée par libellé
+
+    Args:
+        text: Préfixe de la référence ou du libellé
+        cursor: Curseur renvoyé par la page précédente
+
+    Returns:
+        tuple: (liste de dicts, curseur suivant ou None)
+
+    Raises:
+        ValueError: Curseur invalide
+    """
+    from app.models import StockItem
+
+    query = select(StockItem.id, StockItem.reference, StockItem.libelle,
+                   StockItem.quantity, StockItem.unit)
+    text = (text or '').strip()
+    if text:
+        pattern = prefix_pattern(text)
+        query = query.where(or_(StockItem.reference.like(pattern, escape='\\'),
+                                StockItem.libelle.like(pattern, escape='\\')))
+    if category_id is not None:
+        query = query.where(StockItem.category_id == category_id)
+    if supplier_id is not None:
+        query = query.where(StockItem.supplier_id == supplier_id)
+    if cursor:
+        libelle, item_id = decode_cursor(cursor, str, int)
+        query = query.where(keyset_condition([StockItem.libelle, StockItem.id], [libelle, item_id],
+                                             descending=False))
+
+    rows = db.session.execute(
+        query.order_by(StockItem.libelle, StockItem.id).limit(limit + 1)
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].libelle, rows[-1].id])
+
+    return [{
+        'id': row.id,
+        'reference': row.reference,
+        'libelle': row.libelle,
+        'quantity': row.quantity or 0.0,
+        'unit': row.unit
+    } for row in rows], next_cursor
+
+
+# ==================== ÉDITION GROUPÉE ====================
+# Les modifications d'une table de matériaux sont envoyées ensemble : les
+# lignes sont verrouillées (SELECT ... FOR UPDATE) et comparées à la version
+# connue du client, validées ensemble, puis écrites en un UPDATE par clé
+# primaire (executemany) qui incrémente leur version.
+
+EDITABLE_FIELDS = ('actual_quantity_used', 'remaining_quantity', 'additional_quantity')
+MAX_EDITS = 500
+
+
+class MaterialEditError(Exception):
+    """Lot refusé en entier (lot mal formé, lignes de plusieurs tâches...)"""
+
+
+class TaskCompletedError(MaterialEditError):
+    """Lot refusé : la tâche est terminée"""
+
+
+def _normalize_edits(edits):
+    """{id ligne: {'fields': {champ: valeur}, 'version': int ou None}}"""
+    if not isinstance(edits, list) or not edits:
+        raise MaterialEditError('Aucune modification')
+    if len(edits) > MAX_EDITS:
+        raise MaterialEditError(f'{MAX_EDITS} modifications maximum par lot')
+
+    items = {}
+    for position, edit in enumerate(edits, start=1):
+        try:
+            item_id = int(edit['item_id'])
+            field = edit['field']
+            value = float(edit['value'])
+            version = edit.get('version')
+            version = None if version is None else int(version)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise MaterialEditError(f'Modification {position} : ligne, champ ou valeur invalide')
+        if field not in EDITABLE_FIELDS:
+            raise MaterialEditError(f'Modification {position} : champ non modifiable ({field})')
+        if value < 0:
+            raise MaterialEditError(f'Modification {position} : la valeur ne peut pas être négative')
+
+        item = items.setdefault(item_id, {'fields': {}, 'version': version})
+        if version is not None and item['version'] not in (None, version):
+            raise MaterialEditError(f'Ligne {item_id} : versions différentes dans le même lot')
+        item['version'] = item['version'] if version is None else version
+        item['fields'][field] = value
+    return items
+
+
+def _line_values(row):
+    return {
+        'estimated_quantity': row.estimated_quantity or 0.0,
+        'actual_quantity_used': row.actual_quantity_used,
+        'remaining_quantity': row.remaining_quantity,
+        'additional_quantity': row.additional_quantity or 0.0
+    }
+
+
+def _validate(row, fields):
+    """Nouvelles valeurs de la ligne, ou message d'erreur"""
+    values = _line_values(row)
+    values.update(fields)
+    total = values['estimated_quantity'] + values['additional_quantity']
+    actual = values['actual_quantity_used']
+    if actual is not None and actual > total:
+        return None, f'La quantité utilisée ne peut pas dépasser {total:g}'
+
+    # Reste recalculé quand la quantité utilisée change (retour au stock)
+    auto = 'actual_quantity_used' in fields and 'remaining_quantity' not in fields and row.return_to_stock
+    if auto:
+        values['remaining_quantity'] = max(0.0, total - actual)
+    if (values['remaining_quantity'] or 0) > total:
+        return None, f'Le reste ne peut pas dépasser {total:g}'
+    values['auto_calculated'] = bool(auto)
+    return values, None
+
+
+def apply_material_edits(edits, task_id=None):
+    """
+    Applique un lot de modifications de lignes de matériaux
+
+    Les lignes en conflit (version modifiée depuis la lecture du client) ou
+    invalides sont rapportées sans être écrites ; les autres sont écrites
+    dans la même transaction.
+
+    Args:
+        edits: Liste de dicts {'item_id', 'field', 'value', 'version'} ;
+            sans 'version', la ligne est écrite sans contrôle
+        task_id: Tâche à laquelle toutes les lignes doivent appartenir
+            (déduite des lignes si None)
+
+    Returns:
+        dict: results (item_id, status updated/conflict/invalid/not_found,
+        version, values, error), updated, task_id, costs (coûts de la tâche)
+
+    Raises:
+        MaterialEditError: Lot mal formé ou lignes de plusieurs tâches
+        TaskCompletedError: Tâche terminée ; rien n'est enregistré
+    """
+    from app.models import Task, TaskStockItem
+    from app.projects.costs import get_task_costs
+    from app.stock.mrp import mark_stock_items
+
+    items = _normalize_edits(edits)
+    rows = {row.id: row for row in db.session.execute(
+        select(TaskStockItem.id, TaskStockItem.task_id, TaskStockItem.stock_item_id,
+               TaskStockItem.estimated_quantity, TaskStockItem.actual_quantity_used,
+               TaskStockItem.remaining_quantity, TaskStockItem.additional_quantity,
+               TaskStockItem.return_to_stock, TaskStockItem.version)
+        .where(TaskStockItem.id.in_(list(items)))
+        .order_by(TaskStockItem.id)
+        .with_for_update()
+    )}
+
+    task_ids = {row.task_id for row in rows.values()}
+    if task_id is None:
+        if not task_ids:
+            return {'task_id': None, 'updated': 0, 'costs': None, 'results': [
+                {'item_id': item_id, 'status': 'not_found', 'error': 'Ligne introuvable'} for item_id in items
+            ]}
+        task_id = min(task_ids)
+    if task_ids - {task_id}:
+        raise MaterialEditError('Les lignes modifiées doivent appartenir à la même tâche')
+    status = db.session.execute(select(Task.status).where(Task.id == task_id)).scalar()
+    if status == 'completed':
+        raise TaskCompletedError('Tâche non modifiable (terminée)')
+
+    results, updates, mrp_items = [], [], set()
+    now = datetime.utcnow()
+    for item_id, item in items.items():
+        row = rows.get(item_id)
+        if row is None:
+            results.append({'item_id': item_id, 'status': 'not_found', 'error': 'Ligne introuvable'})
+            continue
+        if item['version'] is not None and item['version'] != row.version:
+            results.append({'item_id': item_id, 'status': 'conflict', 'version': row.version,
+                            'values': _line_values(row),
+                            'error': 'Ligne modifiée entre-temps, valeurs actuelles renvoyées'})
+            continue
+        values, error = _validate(row, item['fields'])
+        if error:
+            results.append({'item_id': item_id, 'status': 'invalid', 'version': row.version, 'error': error})
+            continue
+
+        updates.append({
+            'id': item_id,
+            # Version attendue : l'UPDATE la vérifie puis l'incrémente
+            'version': row.version,
+            'actual_quantity_used': values['actual_quantity_used'],
+            'remaining_quantity': values['remaining_quantity'],
+            'additional_quantity': values['additional_quantity'],
+            'updated_at': now
+        })
+        if values['additional_quantity'] != (row.additional_quantity or 0.0) and row.stock_item_id:
+            mrp_items.add(row.stock_item_id)
+        results.append({'item_id': item_id, 'status': 'updated', 'version': row.version + 1,
+                         'values': values})
+
+    if updates:
+        db.session.execute(update(TaskStockItem), updates)
+        if mrp_items:
+            # Le besoin (estimé + supplémentaire) change : calcul des besoins
+            mark_stock_items(mrp_items)
+        # Les instances chargées relisent les quantités et la version
+        for instance in db.session.identity_map.values():
+            if isinstance(instance, TaskStockItem) and inspect(instance).identity[0] in rows:
+                db.session.expire(instance)
+    db.session.commit()
+
+    return {
+        'task_id': task_id,
+        'results': results,
+        'updated': len(updates),
+        'costs': get_task_costs(task_id)
+    }
@@ -2,14 +2,25 @@ from flask import render_template, current_app,redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app.projects import bp
 from app.projects.forms import ProjectForm, TaskForm, TaskTypeForm, TaskStockItemForm, AdditionalCostForm, ProjectFileForm
-from app.models import TaskExternalRef,Project, Task, TaskType, TaskStockItem, AdditionalCost, ProjectFile, StockItem, Personnel, Group
+from app.models import TaskExternalRef,Project, Client, Task, TaskType, TaskStockItem, AdditionalCost, ProjectFile, StockItem, Personnel, Group
 from app import db
 from app.decorators import permission_required
+from app.alerts import check_stock_alerts
+from app.pagination import parse_limit
+from app.projects.costs import refresh_project_costs
+from app.projects.listing import project_filters, get_task_counts, get_project_stats, list_projects
+from app.projects.materials import task_lines, split_lines, workspace, picker_filters, picker_items, \
+    apply_material_edits, MaterialEditError, TaskCompletedError, EDITABLE_FIELDS
 from app.utils import save_uploaded_file, delete_uploaded_file, check_stock_availability, sanitize_input
+from app.stock.ledger import InsufficientStockError, apply_movements
+from app.stock.mrp import material_shortages
+from app.notifications import notify
+from app.typeahead import existing_ids as existing_entity_ids, remember_recent
 from datetime import datetime, date
 import os
 import json
 from sqlalchemy import text
+from sqlalchemy.orm import joinedload
 
 @bp.route('/')
 @login_required
@@ -20,45 +31,56 @@ def index():
     search = request.args.get('search', '')
     status = request.args.get('status', '')
     priority = request.args.get('priority', '')
+    client_id = request.args.get('client_id', type=int)
     
     # Construire la requête avec filtres
-    query = Project.query
-    
-    if search:
-        query = query.filter(
-            db.or_(
-                Project.name.ilike(f'%{search}%'),
-                Project.description.ilike(f'%{search}%')
-            )
-        )
-    
-    if status:
-        query = query.filter_by(status=status)
-    
-    if priority:
-        query = query.filter_by(priority=priority)
+    query = Project.query.filter(*project_filters(status, priority, client_id, search))
     
     # Pagination
-    projects = query.order_by(Project.start_date.desc()).paginate(
+    projects = query.order_by(Project.start_date.desc(), Project.id.desc()).paginate(
         page=page, per_page=current_app.config['ITEMS_PER_PAGE'], error_out=False
     )
     
+    # Tâches par statut et progression de la page, en une requête groupée
+    task_counts = get_task_counts(p.id for p in projects.items)
+    
     # Calculer les statistiques pour le dashboard
-    stats = {
-        'in_progress': Project.query.filter_by(status='in_progress').count(),
-        'completed': Project.query.filter_by(status='completed').count(),
-        'high_priority': Project.query.filter_by(priority='high').count()
-    }
+    stats = get_project_stats()
+    
+    clients = Client.query.filter_by(is_active=True).order_by(Client.name).all()
     
     return render_template('projects/index.html',
                          title='Gestion des Projets',
                          projects=projects,
+                         task_counts=task_counts,
+                         clients=clients,
                          search=search,
                          selected_status=status,
                          selected_priority=priority,
+                         selected_client=client_id,
                          stats=stats,
                          Project=Project)
 
+@bp.route('/api/list')
+@login_required
+@permission_required('projects', 'read')
+def list_api():
+    """Liste JSON des projets, paginée par curseur"""
+    filters = project_filters(
+        request.args.get('status'),
+        request.args.get('priority'),
+        request.args.get('client_id', type=int),
+        request.args.get('search')
+    )
+    limit = parse_limit(request.args.get('limit'), current_app.config['ITEMS_PER_PAGE'])
+    
+    try:
+        items, next_cursor = list_projects(filters, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'items': items, 'next_cursor': next_cursor, 'limit': limit})
+
 @bp.route('/add', methods=['GET', 'POST'])
 @login_required
 @permission_required('projects', 'create')
@@ -87,15 +109,16 @@ def add():
             start_date=form.start_date.data,
             end_date=form.end_date.data,
             estimated_budget=form.estimated_budget.data,
-            budget_reel=form.budget_reel.data or 0.0,
             prix_vente=form.prix_vente.data or 0.0,
-            marge=(form.prix_vente.data or 0.0) - (form.budget_reel.data or 0.0),
             status=form.status.data,
             priority=form.priority.data,
             notes=sanitize_input(form.notes.data) if form.notes.data else None
         )
         
         db.session.add(project)
+        db.session.flush()
+        # budget_reel et marge sont dérivés des coûts des tâches
+        refresh_project_costs([project.id])
         db.session.commit()
         
         flash(f'Projet {project.name} créé avec succès!', 'success')
@@ -160,9 +183,7 @@ def edit(project_id):
         project.start_date = form.start_date.data
         project.end_date = form.end_date.data
         project.estimated_budget = form.estimated_budget.data
-        project.budget_reel = form.budget_reel.data or 0.0
         project.prix_vente = form.prix_vente.data or 0.0
-        project.marge = (form.prix_vente.data or 0.0) - (form.budget_reel.data or 0.0)
         project.status = form.status.data
         project.priority = form.priority.data
         project.notes = sanitize_input(form.notes.data) if form.notes.data else None
@@ -172,6 +193,8 @@ def edit(project_id):
         if project.status == 'completed' and not project.actual_end_date:
             project.actual_end_date = date.today()
         
+        # La marge suit le prix de vente ; budget_reel reste dérivé des coûts
+        refresh_project_costs([project.id])
         db.session.commit()
         
         flash(f'Projet {project.name} mis à jour avec succès!', 'success')
@@ -224,7 +247,6 @@ def add_task(project_id):
     
     # Remplir les choix dynamiques
     form.task_type_id.choices = [(0, '-- Sélectionner --')] + [(t.id, t.name) for t in TaskType.query.all()]
-    form.assigned_personnel.choices = [(p.id, p.get_full_name()) for p in Personnel.query.filter_by(is_active=True).all()]
     form.assigned_groups.choices = [(g.id, g.name) for g in Group.query.all()]
     
     if form.validate_on_submit():
@@ -246,6 +268,7 @@ def add_task(project_id):
         # Ajouter le personnel assigné
         selected_personnel = Personnel.query.filter(Personnel.id.in_(form.assigned_personnel.data)).all()
         task.assigned_personnel.extend(selected_personnel)
+        remember_recent(current_user.id, 'personnel', form.assigned_personnel.data, commit=False)
         
         # Ajouter les groupes assignés
         selected_groups = Group.query.filter(Group.id.in_(form.assigned_groups.data)).all()
@@ -330,7 +353,6 @@ def edit_task(task_id):
     
     # Remplir les choix dynamiques
     form.task_type_id.choices = [(0, '-- Sélectionner --')] + [(t.id, t.name) for t in TaskType.query.all()]
-    form.assigned_personnel.choices = [(p.id, p.get_full_name()) for p in Personnel.query.filter_by(is_active=True).all()]
     form.assigned_groups.choices = [(g.id, g.name) for g in Group.query.all()]
     
     if form.validate_on_submit():
@@ -356,6 +378,7 @@ def edit_task(task_id):
             if form.assigned_personnel.data:
                 selected_personnel = Personnel.query.filter(Personnel.id.in_(form.assigned_personnel.data)).all()
                 task.assigned_personnel.extend(selected_personnel)
+                remember_recent(current_user.id, 'personnel', form.assigned_personnel.data, commit=False)
             
             # Mettre à jour les groupes assignés
             task.assigned_groups.clear()
@@ -406,19 +429,24 @@ def validate_task(task_id):
             flash('Impossible de valider: stock insuffisant!', 'danger')
             return redirect(url_for('projects.view_task', task_id=task.id))
     
+    # Utiliser le stock si nécessaire (sorties atomiques)
+    movements = task_stock_movements(task, 'sale') if task.use_stock else []
+    if movements:
+        try:
+            apply_movements(movements, user_id=current_user.id, commit=False)
+        except InsufficientStockError:
+            db.session.rollback()
+            flash('Impossible de valider: stock insuffisant!', 'danger')
+            return redirect(url_for('projects.view_task', task_id=task.id))
+    
     # Mettre à jour le statut
     task.status = 'completed'
     task.actual_end_date = date.today()
     task.updated_at = datetime.utcnow()
     
-    # Utiliser le stock si nécessaire
-    if task.use_stock:
-        for task_item in task.stock_items:
-            if task_item.stock_item and task_item.actual_quantity_used:
-                task_item.stock_item.quantity -= task_item.actual_quantity_used
-                task_item.stock_item.calculate_value()
-    
     db.session.commit()
+    if movements:
+        check_stock_alerts([movement['stock_item_id'] for movement in movements])
     
     flash(f'Tâche {task.name} validée avec succès!', 'success')
     return redirect(url_for('projects.view_task', task_id=task.id))
@@ -439,10 +467,9 @@ def invalidate_task(task_id):
         
         # Restaurer le stock si nécessaire
         if task.use_stock and task.status == 'completed':
-            for task_item in task.stock_items:
-                if task_item.stock_item and task_item.actual_quantity_used:
-                    task_item.stock_item.quantity += task_item.actual_quantity_used
-                    task_item.stock_item.calculate_value()
+            movements = task_stock_movements(task, 'return')
+            if movements:
+                apply_movements(movements, user_id=current_user.id, commit=False)
         
         # Mettre à jour la tâche
         task.status = 'in_progress'
@@ -593,6 +620,13 @@ def manage_stock_items(task_id):
         try:
             data = request.get_json()
             
+            # Articles choisis par autocomplétion : vérifier leur existence en une requête
+            new_stock_ids = [item_data['stock_item_id'] for item_data in data.get('items', [])
+                             if not item_data.get('id') and item_data.get('stock_item_id')]
+            unknown = set(new_stock_ids) - existing_entity_ids('stock', new_stock_ids)
+            if unknown:
+                return jsonify({'success': False, 'error': 'Élément de stock introuvable'}), 400
+            
             # Mettre à jour ou ajouter des éléments de stock
             for item_data in data.get('items', []):
                 if item_data.get('id'):
@@ -626,6 +660,7 @@ def manage_stock_items(task_id):
                     ~TaskStockItem.id.in_(existing_ids)
                 ).delete(synchronize_session=False)
             
+            remember_recent(current_user.id, 'stock', new_stock_ids, commit=False)
             db.session.commit()
             
             # Mettre à jour le stock si nécessaire
@@ -639,8 +674,7 @@ def manage_stock_items(task_id):
             return jsonify({'success': False, 'error': str(e)})
     
     # GET: Retourner les éléments de stock de la tâche
-    stock_items = StockItem.query.all()
-    task_items = task.stock_items.all()
+    task_items = task.stock_items.options(joinedload(TaskStockItem.stock_item)).all()
     
     items_data = []
     for item in task_items:
@@ -661,24 +695,40 @@ def manage_stock_items(task_id):
     return jsonify({
         'success': True,
         'items': items_data,
-        'stock_items': [{'id': s.id, 'text': f'{s.reference} - {s.libelle}'} for s in stock_items]
+        'stock_items_url': url_for('main.typeahead', source='stock')
     })
 
+def task_stock_movements(task, movement_type, with_returns=False):
+    """
+    Mouvements de stock correspondant aux quantités utilisées d'une tâche
+    
+    Args:
+        task: Tâche
+        movement_type: 'sale' (consommation) ou 'return' (annulation)
+        with_returns: Ajouter le retour en stock des quantités restantes
+    """
+    movements = []
+    for task_item in task.stock_items:
+        if not (task_item.stock_item_id and task_item.actual_quantity_used):
+            continue
+        common = {
+            'stock_item_id': task_item.stock_item_id,
+            'task_id': task.id,
+            'project_id': task.project_id,
+            'notes': f'Tâche {task.name}'
+        }
+        movements.append(dict(common, movement_type=movement_type,
+                              quantity=task_item.actual_quantity_used))
+        if with_returns and task_item.return_to_stock and task_item.remaining_quantity:
+            movements.append(dict(common, movement_type='return',
+                                  quantity=task_item.remaining_quantity))
+    return movements
+
 def update_stock_from_task(task):
     """Mettre à jour le stock à partir des éléments d'une tâche"""
-    for task_item in task.stock_items:
-        if task_item.stock_item and task_item.actual_quantity_used:
-            # Diminuer le stock pour la quantité utilisée
-            task_item.stock_item.quantity -= task_item.actual_quantity_used
-            
-            # Ajouter la quantité retournée si applicable
-            if task_item.return_to_stock and task_item.remaining_quantity:
-                task_item.stock_item.quantity += task_item.remaining_quantity
-            
-            # Recalculer la valeur
-            task_item.stock_item.calculate_value()
-    
-    db.session.commit()
+    movements = task_stock_movements(task, 'sale', with_returns=True)
+    if movements:
+        apply_movements(movements, user_id=current_user.id)
 
 @bp.route('/tasks/<int:task_id>/additional-costs', methods=['GET', 'POST'])
 @login_required
@@ -935,7 +985,9 @@ def check_task_stock(task_id):
     
     return jsonify({
         'available': len(issues) == 0,
-        'issues': issues
+        'issues': issues,
+        # Manques prévus en tenant compte des tâches qui commencent avant
+        'planned_shortages': material_shortages(task_ids=[task.id])
     })
 
 @bp.route('/tasks/<int:task_id>/update-status', methods=['POST'])
@@ -957,7 +1009,11 @@ def update_task_status(task_id):
     
     # Mettre à jour le stock si la tâche commence
     if new_status == 'in_progress' and task.use_stock:
-        update_stock_from_task(task)
+        try:
+            update_stock_from_task(task)
+        except InsufficientStockError as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e), 'insufficient_items': e.shortages})
     
     db.session.commit()
     
@@ -972,7 +1028,6 @@ def new_task():
     
     # Remplir les choix dynamiques
     form.task_type_id.choices = [(0, '-- Sélectionner --')] + [(t.id, t.name) for t in TaskType.query.all()]
-    form.assigned_personnel.choices = [(p.id, p.get_full_name()) for p in Personnel.query.filter_by(is_active=True).all()]
     form.assigned_groups.choices = [(g.id, g.name) for g in Group.query.all()]
     
     # Récupérer les projets actifs pour le dropdown
@@ -1018,6 +1073,7 @@ def new_task():
         if form.assigned_personnel.data:
             selected_personnel = Personnel.query.filter(Personnel.id.in_(form.assigned_personnel.data)).all()
             task.assigned_personnel.extend(selected_personnel)
+            remember_recent(current_user.id, 'personnel', form.assigned_personnel.data, commit=False)
         
         # Ajouter les groupes assignés
         if form.assigned_groups.data:
@@ -1049,32 +1105,11 @@ def task_materials(task_id):
     """Gestion des matériaux d'une tâche"""
     task = Task.query.get_or_404(task_id)
     
-    # Récupérer tous les éléments de stock
-    all_stock_items = StockItem.query.order_by(StockItem.libelle).all()
-    
-    # Récupérer les catégories et fournisseurs pour les filtres
-    from app.models import StockCategory, Supplier
-    categories = StockCategory.query.all()
-    suppliers = Supplier.query.all()
-    
-    # Récupérer les items de stock de la tâche
-    stock_items = task.stock_items.all()
+    # Lignes et articles en une requête ; le catalogue est servi à la demande
+    # par le sélecteur (projects.stock_picker)
+    stock_items = task_lines(task.id)
     ext_refs = task.external_refs.order_by(TaskExternalRef.created_at.desc()).all()
-    # Calculer les listes directement dans la route
-    sufficient_items = []
-    shortage_items = []
-    return_items = []
-    
-    for item in stock_items:
-        # Vérifier si la quantité est suffisante
-        if item.stock_item and item.estimated_quantity <= item.stock_item.quantity:
-            sufficient_items.append(item)
-        else:
-            shortage_items.append(item)
-        
-        # Vérifier si l'item doit être retourné au stock
-        if item.return_to_stock:
-            return_items.append(item)
+    sufficient_items, shortage_items, return_items = split_lines(stock_items)
     
     return render_template('projects/task_materials.html',
                          title=f'Matériaux - {task.name}',
@@ -1083,12 +1118,38 @@ def task_materials(task_id):
                          sufficient_items=sufficient_items,
                          shortage_items=shortage_items,
                          return_items=return_items,
-                         all_stock_items=all_stock_items,
-                         categories=categories,
-                         suppliers=suppliers,
                          ext_refs=ext_refs,
                          text=text)
 
+@bp.route('/tasks/<int:task_id>/materials/workspace')
+@login_required
+@permission_required('tasks', 'read')
+def task_materials_workspace(task_id):
+    """API: lignes de matériaux de la tâche avec disponibilité"""
+    task = Task.query.get_or_404(task_id)
+    return jsonify(dict(workspace(task.id), success=True))
+
+@bp.route('/api/stock-picker')
+@login_required
+@permission_required('stock', 'read')
+def stock_picker():
+    """API: articles du sélecteur (q, category, supplier, cursor, limit, filters=1)"""
+    try:
+        items, next_cursor = picker_items(
+            request.args.get('q', ''),
+            category_id=request.args.get('category', type=int),
+            supplier_id=request.args.get('supplier', type=int),
+            cursor=request.args.get('cursor'),
+            limit=parse_limit(request.args.get('limit'), 50)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    result = {'success': True, 'items': items, 'next_cursor': next_cursor}
+    if request.args.get('filters') == '1':
+        result['filters'] = picker_filters()
+    return jsonify(result)
+
 @bp.route('/tasks/<int:task_id>/materials/add', methods=['POST'])
 @login_required
 @permission_required('tasks', 'update')
@@ -1201,16 +1262,15 @@ def justify_shortage(item_id):
     Date: {datetime.now().strftime('%d/%m/%Y %H:%M')}
     """
     
-    # Créer une notification pour les gestionnaires
-    notification = Notification(
+    # Notifier les gestionnaires (diffusion en tâche de fond)
+    notify(
         title=f'Manque de stock pour {task.name}',
         message=f'Le matériau {task_stock_item.stock_item.libelle} nécessite {shortage_quantity} unités supplémentaires. Justification: {justification}',
         notification_type='stock_shortage',
-        user_id=current_user.id,
+        roles=['admin'],
         task_id=task.id,
         stock_item_id=task_stock_item.stock_item_id
     )
-    db.session.add(notification)
     
     db.session.commit()
     
@@ -1221,39 +1281,17 @@ def justify_shortage(item_id):
 @login_required
 def update_actual_quantity():
     """API pour mettre à jour la quantité réellement utilisée"""
-    data = request.get_json()
-    item_id = data.get('item_id')
-    actual_quantity_used = data.get('actual_quantity_used')
-    
-    task_stock_item = TaskStockItem.query.get(item_id)
-    if not task_stock_item:
-        return jsonify({'success': False, 'error': 'Élément non trouvé'})
-    
-    task_stock_item.actual_quantity_used = float(actual_quantity_used)
-    task_stock_item.updated_at = datetime.utcnow()
-    
-    db.session.commit()
-    
-    return jsonify({'success': True})
+    data = request.get_json() or {}
+    response, status = _single_material_edit(data.get('item_id'), 'actual_quantity_used', data.get('actual_quantity_used'))
+    return jsonify(response), status
 
 @bp.route('/api/update-remaining-quantity', methods=['POST'])
 @login_required
 def update_remaining_quantity():
     """API pour mettre à jour la quantité restante"""
-    data = request.get_json()
-    item_id = data.get('item_id')
-    remaining_quantity = data.get('remaining_quantity')
-    
-    task_stock_item = TaskStockItem.query.get(item_id)
-    if not task_stock_item:
-        return jsonify({'success': False, 'error': 'Élément non trouvé'})
-    
-    task_stock_item.remaining_quantity = float(remaining_quantity)
-    task_stock_item.updated_at = datetime.utcnow()
-    
-    db.session.commit()
-    
-    return jsonify({'success': True})
+    data = request.get_json() or {}
+    response, status = _single_material_edit(data.get('item_id'), 'remaining_quantity', data.get('remaining_quantity'))
+    return jsonify(response), status
 
 @bp.route('/tasks/<int:task_id>/use-stock', methods=['POST'])
 @login_required
@@ -1265,38 +1303,19 @@ def use_stock(task_id):
     if not task.use_stock:
         return jsonify({'success': False, 'error': 'Cette tâche n\'utilise pas le stock'})
     
-    # Vérifier d'abord la disponibilité
-    insufficient_items = []
-    for item in task.stock_items:
-        if item.stock_item and item.actual_quantity_used:
-            if item.actual_quantity_used > item.stock_item.quantity:
-                insufficient_items.append({
-                    'name': item.stock_item.libelle,
-                    'needed': item.actual_quantity_used,
-                    'available': item.stock_item.quantity
-                })
-    
-    if insufficient_items:
-        return jsonify({
-            'success': False,
-            'error': 'Stock insuffisant',
-            'insufficient_items': insufficient_items
-        })
-    
-    # Diminuer le stock et retourner les restes
-    for item in task.stock_items:
-        if item.stock_item and item.actual_quantity_used:
-            # Diminuer la quantité utilisée
-            item.stock_item.quantity -= item.actual_quantity_used
-            
-            # Retourner la quantité restante si applicable
-            if item.return_to_stock and item.remaining_quantity:
-                item.stock_item.quantity += item.remaining_quantity
-            
-            # Recalculer la valeur
-            item.stock_item.calculate_value()
-    
-    db.session.commit()
+    # Diminuer le stock et retourner les restes, en une transaction :
+    # rien n'est appliqué si un article est insuffisant
+    movements = task_stock_movements(task, 'sale', with_returns=True)
+    if movements:
+        try:
+            apply_movements(movements, user_id=current_user.id,
+                            idempotency_key=request.headers.get('Idempotency-Key'))
+        except InsufficientStockError as e:
+            return jsonify({
+                'success': False,
+                'error': 'Stock insuffisant',
+                'insufficient_items': e.shortages
+            })
     
     flash('Stock mis à jour avec succès.', 'success')
     return jsonify({'success': True})
@@ -1326,13 +1345,19 @@ def add_stock_items_batch(task_id):
         data = request.get_json()
         items = data.get('items', [])
         
+        # Quantités disponibles des articles choisis en une requête
+        available = dict(db.session.execute(
+            db.select(StockItem.id, StockItem.quantity)
+            .where(StockItem.id.in_([int(item['stock_item_id']) for item in items]))
+        ).all())
+        
         for item_data in items:
-            stock_item = StockItem.query.get(item_data['stock_item_id'])
-            if not stock_item:
+            quantity = available.get(int(item_data['stock_item_id']))
+            if quantity is None:
                 continue
             
             # Vérifier la disponibilité
-            is_sufficient = float(item_data['estimated_quantity']) <= stock_item.quantity
+            is_sufficient = float(item_data['estimated_quantity']) <= (quantity or 0)
             
             task_stock_item = TaskStockItem(
                 task_id=task.id,
@@ -1368,8 +1393,8 @@ def submit_additional_request():
         
         task_stock_item = TaskStockItem.query.get_or_404(item_id)
         
-        # Créer une notification pour la demande supplémentaire
-        notification = Notification(
+        # Notifier les gestionnaires (diffusion en tâche de fond)
+        notify(
             title=f'Demande supplémentaire pour {task_stock_item.task.name}',
             message=f'''
             Matériau: {task_stock_item.stock_item.libelle} ({task_stock_item.stock_item.reference})
@@ -1379,7 +1404,7 @@ def submit_additional_request():
             Tâche: {task_stock_item.task.name}
             ''',
             notification_type='additional_request',
-            user_id=current_user.id,
+            roles=['admin'],
             task_id=task_stock_item.task_id,
             stock_item_id=task_stock_item.stock_item_id
         )
@@ -1388,7 +1413,6 @@ def submit_additional_request():
         current_notes = task_stock_item.notes or ''
         task_stock_item.notes = f"{current_notes}\n\n[DEMANDE SUPPLÉMENTAIRE - {datetime.now().strftime('%d/%m/%Y %H:%M')}]\nQuantité: +{additional_quantity}\nJustification: {justification}\nType: {request_type}"
         
-        db.session.add(notification)
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'Demande envoyée avec succès'})
@@ -1401,20 +1425,9 @@ def submit_additional_request():
 @login_required
 def update_additional_quantity():
     """API pour mettre à jour la quantité supplémentaire"""
-    data = request.get_json()
-    item_id = data.get('item_id')
-    additional_quantity = data.get('additional_quantity')
-    
-    task_stock_item = TaskStockItem.query.get(item_id)
-    if not task_stock_item:
-        return jsonify({'success': False, 'error': 'Élément non trouvé'})
-    
-    task_stock_item.additional_quantity = float(additional_quantity)
-    task_stock_item.updated_at = datetime.utcnow()
-    
-    db.session.commit()
-    
-    return jsonify({'success': True})
+    data = request.get_json() or {}
+    response, status = _single_material_edit(data.get('item_id'), 'additional_quantity', data.get('additional_quantity'))
+    return jsonify(response), status
 
 @bp.route('/tasks/<int:task_id>/materials/check-stock', methods=['GET'])
 @login_required
@@ -1544,82 +1557,56 @@ def update_material_full():
 @login_required
 @permission_required('tasks', 'update')
 def update_material_field():
-    """Mise à jour rapide d'un champ (inline editing)"""
-    try:
-        data = request.get_json()
-        item_id = data.get('item_id')
-        field = data.get('field')
-        value = data.get('value')
-        
-        if not all([item_id, field]) or value is None:
-            return jsonify({'success': False, 'error': 'Données manquantes'}), 400
-        
-        # Vérifier les champs autorisés
-        allowed_fields = ['actual_quantity_used', 'remaining_quantity', 'additional_quantity']
-        if field not in allowed_fields:
-            return jsonify({'success': False, 'error': 'Champ non autorisé'}), 403
-        
-        # Récupérer l'item
-        task_stock_item = TaskStockItem.query.get_or_404(item_id)
-        task = Task.query.get(task_stock_item.task_id)
-        
-        # Vérifier que la tâche est modifiable
-        if not task or task.status == 'completed':
-            return jsonify({'success': False, 'error': 'Tâche non modifiable (terminée)'}), 403
-        
-        # Convertir et valider la valeur
-        try:
-            float_value = float(value)
-            if float_value < 0:
-                return jsonify({'success': False, 'error': 'La valeur ne peut pas être négative'}), 400
-        except ValueError:
-            return jsonify({'success': False, 'error': 'Valeur numérique invalide'}), 400
-        
-        # Mise à jour spécifique selon le champ
-        if field == 'actual_quantity_used':
-            # Vérifier que la quantité utilisée ne dépasse pas l'estimée + additionnelle
-            max_allowed = float(task_stock_item.estimated_quantity) + float(task_stock_item.additional_quantity or 0)
-            if float_value > max_allowed:
-                return jsonify({
-                    'success': False, 
-                    'error': f'La quantité utilisée ne peut pas dépasser {max_allowed}'
-                }), 400
-            
-            task_stock_item.actual_quantity_used = float_value
-            
-            # Auto-calculer le reste si retour au stock est activé
-            if task_stock_item.return_to_stock:
-                estimated = float(task_stock_item.estimated_quantity) + float(task_stock_item.additional_quantity or 0)
-                used = float_value
-                task_stock_item.remaining_quantity = max(0, estimated - used)
-        
-        elif field == 'remaining_quantity':
-            max_remaining = float(task_stock_item.estimated_quantity) + float(task_stock_item.additional_quantity or 0)
-            if float_value > max_remaining:
-                return jsonify({
-                    'success': False,
-                    'error': f'Le reste ne peut pas dépasser {max_remaining}'
-                }), 400
-            task_stock_item.remaining_quantity = float_value
-        
-        elif field == 'additional_quantity':
-            task_stock_item.additional_quantity = float_value
-        
-        task_stock_item.updated_at = datetime.utcnow()
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': 'Mise à jour effectuée',
-            'value': float_value,
-            'remaining_quantity': float(task_stock_item.remaining_quantity) if task_stock_item.remaining_quantity else 0,
-            'auto_calculated': field == 'actual_quantity_used' and task_stock_item.return_to_stock
+    """Mise à jour rapide d'un champ (inline editing), via l'édition groupée"""
+    data = request.get_json() or {}
+    if not data.get('item_id') or not data.get('field') or data.get('value') is None:
+        return jsonify({'success': False, 'error': 'Données manquantes'}), 400
+    if data['field'] not in EDITABLE_FIELDS:
+        return jsonify({'success': False, 'error': 'Champ non autorisé'}), 403
+    
+    response, status = _single_material_edit(data['item_id'], data['field'], data['value'], data.get('version'))
+    if status == 200:
+        values = response['values']
+        response.update({
+            'value': values[data['field']],
+            'remaining_quantity': values['remaining_quantity'] or 0,
+            'auto_calculated': values['auto_calculated']
         })
-        
-    except Exception as e:
+    return jsonify(response), status
+
+@bp.route('/tasks/<int:task_id>/materials/batch', methods=['POST'])
+@login_required
+@permission_required('tasks', 'update')
+def update_materials_batch(task_id):
+    """
+    Édition groupée des quantités (JSON {"edits": [{item_id, field, value, version}]})
+    
+    Réponse : résultat par ligne (updated, conflict, invalid, not_found) et
+    coûts recalculés de la tâche.
+    """
+    task = Task.query.get_or_404(task_id)
+    data = request.get_json(silent=True) or {}
+    try:
+        result = apply_material_edits(data.get('edits'), task_id=task.id)
+    except MaterialEditError as e:
         db.session.rollback()
-        current_app.logger.error(f'Erreur update_material_field: {str(e)}')
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({'success': False, 'error': str(e)}), 403 if isinstance(e, TaskCompletedError) else 400
+    
+    return jsonify(dict(result, success=True))
+
+def _single_material_edit(item_id, field, value, version=None):
+    """(réponse, statut HTTP) pour la modification d'un seul champ"""
+    try:
+        result = apply_material_edits([{'item_id': item_id, 'field': field, 'value': value, 'version': version}])
+    except MaterialEditError as e:
+        db.session.rollback()
+        return {'success': False, 'error': str(e)}, 403 if isinstance(e, TaskCompletedError) else 400
+    
+    line = result['results'][0]
+    if line['status'] != 'updated':
+        status = {'not_found': 404, 'conflict': 409}.get(line['status'], 400)
+        return dict(line, success=False), status
+    return dict(line, success=True, costs=result['costs']), 200
 
 # ============================================================================
 # À ajouter dans app/projects/routes.py
@@ -0,0 +1,291 @@
+"""
+Recherche globale par index inversé
+
+Les champs texte des éléments du stock, projets, tâches et membres du
+personnel sont découpés en jetons (minuscules, sans accents, sans mots
+vides) stockés dans la table `search_token`. Une recherche est une lecture
+par préfixe sur l'index (token LIKE 'abc%'), groupée par entité et classée
+par score. Les tables sources ne sont lues que par clé primaire, pour
+afficher les résultats retenus.
+
+L'index est tenu à jour par les hooks after_insert / after_update /
+after_delete des modèles indexés ; `flask reindex-search` le reconstruit.
+"""
+import re
+import unicodedata
+
+from flask import url_for
+from sqlalchemy import and_, case, delete, event, func, inspect, or_, select
+
+from app import db
+from app.models import StockItem, Project, Task, Personnel, SearchToken
+from app.dashboard.charts import PROJECT_STATUS_LABELS, TASK_STATUS_LABELS
+
+STOPWORDS = frozenset("""
+    a au aux avec ce ces cet cette d dans de des du en est et l la le les leur
+    leurs ou par pour qu que qui sa se ses son sous sur un une
+""".split())
+
+_LIGATURES = str.maketrans({'œ': 'oe', 'Œ': 'oe', 'æ': 'ae', 'Æ': 'ae'})
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+MAX_TOKEN_LENGTH = 64
+MAX_QUERY_TERMS = 6
+
+
+def fold(text):
+    """Minuscules sans accents ni ligatures"""
+    text = unicodedata.normalize('NFKD', str(text or '').translate(_LIGATURES))
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    """
+    Découpe un texte en jetons indexables
+
+    « Câble électrique 2,5mm² » -> ['cable', 'electrique', '2', '5mm2']
+    """
+    return [
+        token[:MAX_TOKEN_LENGTH]
+        for token in _TOKEN_RE.findall(fold(text))
+        if token not in STOPWORDS and (len(token) > 1 or token.isdigit())
+    ]
+
+
+class SearchEntity:
+    """
+    Type d'entité indexé
+
+    Args:
+        name: Identifiant du type (search_token.entity_type)
+        label: Libellé affiché
+        model: Modèle SQLAlchemy
+        fields: {champ: poids} des colonnes indexées
+        module: Module de permissions requis en lecture
+        endpoint: Vue de détail (url_for) et nom de son argument
+        columns: Fonction retournant les colonnes chargées pour l'affichage
+        describe: Fonction (ligne) -> (titre, sous-titre)
+    """
+
+    def __init__(self, name, label, model, fields, module, endpoint, columns, describe):
+        self.name = name
+        self.label = label
+        self.model = model
+        self.fields = fields
+        self.module = module
+        self.endpoint, self.endpoint_arg = endpoint
+        self.columns = columns
+        self.describe = describe
+
+    def token_weights(self, values):
+        """{jeton: poids} pour un dict champ -> valeur (poids max des champs)"""
+        weights = {}
+        for field, weight in self.fields.items():
+            for token in tokenize(values.get(field)):
+                weights[token] = max(weights.get(token, 0), weight)
+        return weights
+
+    def token_rows(self, entity_id, values):
+        return [
+            {'token': token, 'entity_type': self.name, 'entity_id': entity_id, 'weight': weight}
+            for token, weight in self.token_weights(values).items()
+        ]
+
+    def load(self, ids):
+        """{id: (titre, sous-titre)} pour l'affichage des résultats"""
+        rows = db.session.execute(
+            select(*self.columns()).where(self.model.id.in_(ids))
+        ).all()
+        return {row.id: self.describe(row) for row in rows}
+
+
+def _task_columns():
+    return (Task.id, Task.name, Task.status,
+            select(Project.name).where(Project.id == Task.project_id)
+            .correlate(Task).scalar_subquery().label('project_name'))
+
+
+SEARCH_ENTITIES = {
+    entity.name: entity for entity in (
+        SearchEntity(
+            'stock', 'Stock', StockItem, {'reference': 3.0, 'libelle': 2.0},
+            'stock', ('stock.view', 'item_id'),
+            lambda: (StockItem.id, StockItem.reference, StockItem.libelle),
+            lambda row: (row.reference, row.libelle)
+        ),
+        SearchEntity(
+            'project', 'Projets', Project, {'name': 3.0, 'description': 1.0},
+            'projects', ('projects.view', 'project_id'),
+            lambda: (Project.id, Project.name, Project.status),
+            lambda row: (row.name, PROJECT_STATUS_LABELS.get(row.status, row.status))
+        ),
+        SearchEntity(
+            'task', 'Tâches', Task, {'name': 3.0, 'description': 1.0},
+            'projects', ('projects.view_task', 'task_id'),
+            _task_columns,
+            lambda row: (row.name, row.project_name or TASK_STATUS_LABELS.get(row.status, row.status))
+        ),
+        SearchEntity(
+            'personnel', 'Personnel', Personnel,
+            {'employee_id': 3.0, 'first_name': 3.0, 'last_name': 3.0,
+             'position': 1.0, 'department': 1.0},
+            'personnel', ('personnel.view', 'personnel_id'),
+            lambda: (Personnel.id, Personnel.first_name, Personnel.last_name, Personnel.employee_id),
+            lambda row: (f'{row.first_name} {row.last_name}', row.employee_id)
+        ),
+    )
+}
+
+_ENTITY_BY_MODEL = {entity.model: entity for entity in SEARCH_ENTITIES.values()}
+
+
+# ==================== RECHERCHE ====================
+
+def search(text, types=None, limit=30):
+    """
+    Recherche classée dans l'index
+
+    Chaque terme de la requête doit correspondre (par préfixe) à au moins un
+    jeton de l'entité. Le score additionne les poids des jetons trouvés, une
+    correspondance exacte comptant double.
+
+    Args:
+        text: Texte saisi
+        types: Types d'entités autorisés (None pour tous)
+        limit: Nombre maximal de résultats
+
+    Returns:
+        list: dicts type, label, id, title, subtitle, url, score (par score décroissant)
+    """
+    terms = list(dict.fromkeys(tokenize(text)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+
+    token = SearchToken.token
+    matches = [token.like(f'{term}%') for term in terms]
+    score = func.sum(SearchToken.weight * case((token.in_(terms), 2.0), else_=1.0))
+
+    query = select(SearchToken.entity_type, SearchToken.entity_id, score.label('score')) \
+        .where(or_(*matches)) \
+        .group_by(SearchToken.entity_type, SearchToken.entity_id) \
+        .order_by(score.desc(), SearchToken.entity_id.desc()) \
+        .limit(limit)
+    if len(terms) > 1:
+        query = query.having(and_(*[
+            func.max(case((match, 1), else_=0)) == 1 for match in matches
+        ]))
+    if types is not None:
+        query = query.where(SearchToken.entity_type.in_(list(types)))
+
+    ranked = db.session.execute(query).all()
+
+    # Affichage : une requête par type présent dans les résultats
+    ids_by_type = {}
+    for row in ranked:
+        ids_by_type.setdefault(row.entity_type, []).append(row.entity_id)
+    described = {
+        name: SEARCH_ENTITIES[name].load(ids)
+        for name, ids in ids_by_type.items() if name in SEARCH_ENTITIES
+    }
+
+    results = []
+    for row in ranked:
+        details = described.get(row.entity_type, {}).get(row.entity_id)
+        if details is None:
+            continue  # entrée obsolète
+        entity = SEARCH_ENTITIES[row.entity_type]
+        title, subtitle = details
+        results.append({
+            'type': entity.name,
+            'label': entity.label,
+            'id': row.entity_id,
+            'title': title,
+            'subtitle': subtitle,
+            'url': url_for(entity.endpoint, **{entity.endpoint_arg: row.entity_id}),
+            'score': float(row.score)
+        })
+    return results
+
+
+def allowed_types(user):
+    """Types d'entités que l'utilisateur peut consulter"""
+    permissions = user.get_compiled_permissions()
+    return [name for name, entity in SEARCH_ENTITIES.items()
+            if permissions.allows(entity.module, 'read')]
+
+
+# ==================== INDEXATION ====================
+
+def reindex(entity_type=None, ids=None, chunk_size=1000):
+    """
+    Reconstruit l'index (tout, un type, ou certaines entités d'un type)
+
+    Returns:
+        int: Nombre de jetons écrits
+    """
+    entities = [SEARCH_ENTITIES[entity_type]] if entity_type else SEARCH_ENTITIES.values()
+    table = SearchToken.__table__
+    written = 0
+
+    for entity in entities:
+        cleanup = delete(table).where(table.c.entity_type == entity.name)
+        source = select(entity.model.id, *[getattr(entity.model, f) for f in entity.fields]) \
+            .order_by(entity.model.id).limit(chunk_size)
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                continue
+            cleanup = cleanup.where(table.c.entity_id.in_(ids))
+            source = source.where(entity.model.id.in_(ids))
+        db.session.execute(cleanup)
+
+        # Parcours par paquets d'identifiants croissants (pas de curseur
+        # ouvert pendant les insertions)
+        last_id = 0
+        while True:
+            records = db.session.execute(source.where(entity.model.id > last_id)).all()
+            if not records:
+                break
+            rows = [row for record in records
+                    for row in entity.token_rows(record.id, record._mapping)]
+            if rows:
+                db.session.execute(table.insert(), rows)
+                written += len(rows)
+            last_id = records[-1].id
+
+    return written
+
+
+def _index_target(connection, entity, target):
+    table = SearchToken.__table__
+    connection.execute(delete(table).where(
+        table.c.entity_type == entity.name, table.c.entity_id == target.id
+    ))
+    rows = entity.token_rows(target.id, {field: getattr(target, field) for field in entity.fields})
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def _after_insert(mapper, connection, target):
+    _index_target(connection, _ENTITY_BY_MODEL[mapper.class_], target)
+
+
+def _after_update(mapper, connection, target):
+    entity = _ENTITY_BY_MODEL[mapper.class_]
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in entity.fields):
+        _index_target(connection, entity, target)
+
+
+def _after_delete(mapper, connection, target):
+    table = SearchToken.__table__
+    connection.execute(delete(table).where(
+        table.c.entity_type == _ENTITY_BY_MODEL[mapper.class_].name,
+        table.c.entity_id == target.id
+    ))
+
+
+for _model in _ENTITY_BY_MODEL:
+    event.listen(_model, 'after_insert', _after_insert)
+    event.listen(_model, 'after_update', _after_update)
+    event.listen(_model, 'after_delete', _after_delete)
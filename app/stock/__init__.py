@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('stock', __name__, url_prefix='/stock')
 
-from app.stock import routes
\ No newline at end of file
+from app.stock import routes, analytics, mrp
\ No newline at end of file
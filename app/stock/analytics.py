@@ -0,0 +1,218 @@
+"""
+Analyses du stock : classes ABC, rotation, couverture, points de commande
+
+Les données sont lues en trois requêtes colonnes (articles, consommation
+journalière par article sur la fenêtre d'analyse, quantité moyenne issue
+des clôtures de app/stock/history.py) puis traitées pour tout le catalogue
+en une passe vectorisée NumPy :
+
+- classe ABC : articles triés par valeur consommée, A jusqu'à 80 % du
+  cumul, B jusqu'à 95 %, C au-delà (et articles sans consommation) ;
+- rotation annualisée : consommation annuelle / quantité moyenne ;
+- couverture : quantité actuelle / consommation journalière moyenne ;
+- point de commande suggéré : demande pendant le délai de
+  réapprovisionnement + stock de sécurité (z · σ · √délai).
+
+Le résultat est mis en cache pour la journée.
+"""
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, select
+
+from app import db
+from app.cache import TTLCache
+from app.dashboard.charts import ChartProvider, register_provider
+from app.models import StockItem, StockMovement, StockSnapshot
+from app.stock.ledger import MOVEMENT_SIGNS
+
+
+ABC_THRESHOLDS = (0.80, 0.95)
+LOAD_QUERIES = 3  # requêtes émises par _load()
+OUTFLOW_TYPES = tuple(movement_type for movement_type, sign in MOVEMENT_SIGNS.items() if sign < 0)
+
+_cache = TTLCache(ttl=86400, maxsize=8)
+
+
+# ==================== CHARGEMENT ====================
+
+def _load(window_days):
+    """Colonnes des articles, de la consommation journalière et du stock moyen"""
+    since = datetime.utcnow() - timedelta(days=window_days)
+
+    items = db.session.execute(
+        select(StockItem.id, StockItem.reference, StockItem.libelle,
+               StockItem.quantity, StockItem.min_quantity, StockItem.price)
+        .order_by(StockItem.id)
+    ).all()
+
+    demand = db.session.execute(
+        select(StockMovement.stock_item_id, func.sum(StockMovement.quantity))
+        .where(StockMovement.movement_type.in_(OUTFLOW_TYPES),
+               StockMovement.movement_date >= since,
+               StockMovement.stock_item_id.isnot(None))
+        .group_by(StockMovement.stock_item_id, func.date(StockMovement.movement_date))
+    ).all()
+
+    average_stock = dict(db.session.execute(
+        select(StockSnapshot.stock_item_id, func.avg(StockSnapshot.quantity))
+        .where(StockSnapshot.snapshot_date >= since.date())
+        .group_by(StockSnapshot.stock_item_id)
+    ).all())
+
+    return items, demand, average_stock
+
+
+# ==================== CALCUL ====================
+
+def _compute(items, demand, average_stock, window_days, lead_time, z):
+    ids = np.fromiter((row.id for row in items), dtype=np.int64, count=len(items))
+    quantity = np.array([row.quantity or 0.0 for row in items], dtype=float)
+    price = np.array([row.price or 0.0 for row in items], dtype=float)
+    average = np.array([average_stock.get(row.id, row.quantity or 0.0) or 0.0 for row in items], dtype=float)
+
+    demand = [(item_id, q or 0.0) for item_id, q in demand]
+    demand_ids = np.array([item_id for item_id, _ in demand], dtype=np.int64)
+    daily = np.array([q for _, q in demand], dtype=float)
+    position = np.searchsorted(ids, demand_ids)
+    known = (position < len(ids)) & (ids[np.minimum(position, len(ids) - 1)] == demand_ids)
+    position, daily = position[known], daily[known]
+
+    # Somme et somme des carrés par article (jours sans sortie = 0)
+    used = np.bincount(position, weights=daily, minlength=len(ids))
+    used_squares = np.bincount(position, weights=daily * daily, minlength=len(ids))
+    mean = used / window_days
+    std = np.sqrt(np.maximum(used_squares / window_days - mean * mean, 0.0))
+
+    usage_value = used * price
+    order = np.argsort(-usage_value, kind='stable')
+    total_value = usage_value.sum()
+    share_before = np.empty(len(ids))
+    if total_value > 0:
+        share_before[order] = (np.cumsum(usage_value[order]) - usage_value[order]) / total_value
+    else:
+        share_before[:] = 1.0
+    classes = np.where(share_before < ABC_THRESHOLDS[0], 'A',
+                       np.where(share_before < ABC_THRESHOLDS[1], 'B', 'C'))
+    classes[usage_value <= 0] = 'C'
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turnover = np.where(average > 0, mean * 365 / average, np.nan)
+        cover = np.where(mean > 0, quantity / mean, np.nan)
+    reorder = np.ceil(mean * lead_time + z * std * math.sqrt(lead_time))
+
+    return [
+        _result(row, classes[i], usage_value[i], turnover[i], cover[i], reorder[i])
+        for i, row in enumerate(items)
+    ]
+
+
+def _optional(value, digits=1):
+    value = float(value)
+    return None if math.isnan(value) else round(value, digits)
+
+
+def _result(row, abc, usage_value, turnover, cover, reorder):
+    return {
+        'id': row.id,
+        'reference': row.reference,
+        'libelle': row.libelle,
+        'quantity': row.quantity or 0.0,
+        'min_quantity': row.min_quantity or 0.0,
+        'abc': str(abc),
+        'usage_value': round(float(usage_value), 2),
+        'turnover': _optional(turnover, 2),
+        'days_of_cover': _optional(cover),
+        'reorder_point': int(reorder)
+    }
+
+
+def compute_inventory_analytics(window_days=None, lead_time=None, z=None):
+    """
+    Analyse tout le catalogue (sans cache)
+
+    Returns:
+        dict: generated_at, window_days, lead_time_days, summary (par classe :
+        nombre d'articles et valeur consommée), items (un dict par article)
+    """
+    config = current_app.config
+    window_days = window_days or config.get('STOCK_ANALYTICS_WINDOW_DAYS', 90)
+    lead_time = lead_time or config.get('STOCK_LEAD_TIME_DAYS', 14)
+    z = config.get('STOCK_SERVICE_LEVEL_Z', 1.65) if z is None else z
+
+    items, demand, average_stock = _load(window_days)
+    results = _compute(items, demand, average_stock, window_days, lead_time, z) if items else []
+
+    summary = {abc: {'items': 0, 'usage_value': 0.0} for abc in 'ABC'}
+    for result in results:
+        summary[result['abc']]['items'] += 1
+        summary[result['abc']]['usage_value'] += result['usage_value']
+    for values in summary.values():
+        values['usage_value'] = round(values['usage_value'], 2)
+
+    return {
+        'generated_at': datetime.utcnow().isoformat(),
+        'window_days': window_days,
+        'lead_time_days': lead_time,
+        'summary': summary,
+        'items': results
+    }
+
+
+def get_inventory_analytics(refresh=False):
+    """Analyse du jour, calculée au premier appel puis servie depuis le cache"""
+    key = datetime.utcnow().date()
+    analytics = None if refresh else _cache.get(key)
+    if analytics is None:
+        now = datetime.utcnow()
+        end_of_day = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        analytics = _cache.set(key, compute_inventory_analytics(),
+                               ttl=max(60, (end_of_day - now).total_seconds()))
+    return analytics
+
+
+def clear_inventory_analytics():
+    _cache.clear()
+
+
+# ==================== GRAPHIQUES ====================
+
+class AnalyticsChartProvider(ChartProvider):
+    """
+    Source de graphique alimentée par l'analyse du jour plutôt que par une
+    requête : le calcul (LOAD_QUERIES requêtes) est partagé par les sources
+    analytiques et fait au plus une fois par jour
+    """
+
+    def __init__(self, name, dataset_label, rows, **kwargs):
+        super().__init__(name, dataset_label, query=None, tables=(), queries=LOAD_QUERIES, **kwargs)
+        self.rows = rows
+
+    def clear_cache(self):
+        clear_inventory_analytics()
+
+    def fetch_rows(self):
+        return self.rows(get_inventory_analytics())
+
+
+def _abc_rows(analytics):
+    return [(f'Classe {abc}', values['usage_value']) for abc, values in analytics['summary'].items()]
+
+
+def _cover_rows(analytics):
+    covered = [item for item in analytics['items'] if item['days_of_cover'] is not None]
+    covered.sort(key=lambda item: item['days_of_cover'])
+    return [(item['reference'], item['days_of_cover']) for item in covered[:10]]
+
+
+register_provider(AnalyticsChartProvider(
+    'stock_abc', 'Valeur consommée par classe', _abc_rows,
+    style={'backgroundColor': ['#f5576c', '#ffd89b', '#43e97b']}
+))
+
+register_provider(AnalyticsChartProvider(
+    'stock_cover', 'Couverture (jours)', _cover_rows,
+    style={'backgroundColor': '#4facfe'}
+))
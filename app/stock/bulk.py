@@ -0,0 +1,441 @@
+"""
+Import / export en masse des éléments du stock
+
+Import : le fichier (CSV ou XLSX) est lu ligne à ligne et traité par lots.
+Les références existantes, fournisseurs et catégories sont préchargés une
+fois en mémoire ; chaque lot est validé puis écrit par INSERT / UPDATE en
+executemany, validé lot par lot. La quantité d'un article existant n'est
+pas écrite directement : l'écart avec le stock actuel est enregistré comme
+correction dans le registre des mouvements (app/stock/ledger.py). En mode simulation (dry_run) rien n'est
+écrit et le rapport indique ce qui serait créé ou mis à jour.
+
+Export : les lignes sont lues par paquets (yield_per) et le CSV est produit
+au fil de l'eau ; la mémoire utilisée ne dépend pas de la taille du
+catalogue.
+"""
+import csv
+import io
+import unicodedata
+from datetime import datetime
+from itertools import islice
+from zipfile import BadZipFile
+
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from sqlalchemy import insert, select, update
+
+from app import db
+from app.utils import sanitize_input
+
+
+# Colonnes du fichier, dans l'ordre de l'export
+COLUMNS = ('reference', 'libelle', 'item_type', 'quantity', 'min_quantity', 'price',
+           'unit', 'location', 'supplier', 'category', 'notes')
+
+# En-têtes acceptés à l'import (comparés sans accents ni casse)
+HEADER_ALIASES = {
+    'ref': 'reference',
+    'designation': 'libelle',
+    'type': 'item_type',
+    'quantite': 'quantity',
+    'qte': 'quantity',
+    'quantite minimale': 'min_quantity',
+    'stock minimum': 'min_quantity',
+    'prix': 'price',
+    'prix unitaire': 'price',
+    'unite': 'unit',
+    'emplacement': 'location',
+    'fournisseur': 'supplier',
+    'categorie': 'category',
+}
+
+NUMERIC_COLUMNS = ('quantity', 'min_quantity', 'price')
+DEFAULT_ITEM_TYPE = 'general'
+DEFAULT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 200
+
+
+class StockImportError(ValueError):
+    """Fichier illisible ou format non pris en charge"""
+
+
+def fold(text):
+    """Minuscules sans accents, espaces normalisés"""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.replace('_', ' ').lower().split())
+
+
+def _column_for(header):
+    key = fold(header)
+    if key.replace(' ', '_') in COLUMNS:
+        return key.replace(' ', '_')
+    return HEADER_ALIASES.get(key)
+
+
+def _cell_text(value):
+    """Valeur de cellule en texte (1001.0 -> '1001')"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+# ==================== LECTURE ====================
+
+def _iter_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    header_line = text.readline()
+    # Export Excel français : séparateur « ; »
+    delimiter = ';' if header_line.count(';') > header_line.count(',') else ','
+    yield next(csv.reader([header_line], delimiter=delimiter), [])
+    yield from csv.reader(text, delimiter=delimiter)
+
+
+def _iter_xlsx(stream):
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+
+def iter_file_rows(stream, filename):
+    """
+    Lit un fichier d'import et produit (numéro de ligne, dict colonne -> texte)
+
+    Raises:
+        StockImportError: Format non pris en charge, fichier illisible ou
+            colonnes obligatoires absentes
+    """
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        rows = _iter_csv(stream)
+    elif extension == 'xlsx':
+        rows = _iter_xlsx(stream)
+    else:
+        raise StockImportError('Formats acceptés : CSV, XLSX')
+
+    # Les lignes sont lues à la demande : une erreur de décodage peut
+    # survenir en cours d'import, après les premiers lots (voir
+    # import_stock_items)
+    try:
+        header = next(rows, None)
+        if not header:
+            raise StockImportError('Fichier vide')
+        columns = [_column_for(name) for name in header]
+        missing = {'reference', 'libelle'} - set(columns)
+        if missing:
+            raise StockImportError('Colonnes obligatoires manquantes : ' + ', '.join(sorted(missing)))
+
+        for line, row in enumerate(rows, start=2):
+            values = {column: _cell_text(value) for column, value in zip(columns, row) if column}
+            if any(values.values()):
+                yield line, values
+    except UnicodeDecodeError:
+        raise StockImportError('Fichier illisible : encodage UTF-8 attendu')
+    except csv.Error as e:
+        raise StockImportError(f'Fichier illisible : {e}')
+    except (BadZipFile, InvalidFileException):
+        raise StockImportError('Fichier illisible : classeur XLSX invalide')
+
+
+# ==================== IMPORT ====================
+
+class ImportReport:
+    """Résultat d'un import (ou d'une simulation)"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self.aborted = None
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'message': message})
+
+    def to_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'aborted': self.aborted
+        }
+
+
+def _name_map(model):
+    return {fold(name): id_ for id_, name in db.session.execute(select(model.id, model.name))}
+
+
+def _parse_number(raw, column):
+    if raw == '':
+        return 0.0
+    try:
+        value = float(raw.replace(' ', '').replace(',', '.'))
+    except ValueError:
+        raise ValueError(f'{column} : nombre invalide ({raw})')
+    if value < 0:
+        raise ValueError(f'{column} : valeur négative')
+    return value
+
+
+def _build_row(values, suppliers, categories):
+    """
+    Convertit une ligne du fichier en colonnes StockItem (ValueError si invalide)
+
+    Seules les colonnes présentes dans le fichier sont renseignées : une mise
+    à jour ne modifie pas les champs absents de l'en-tête.
+    """
+    reference = values.get('reference', '')
+    libelle = values.get('libelle', '')
+    if not reference:
+        raise ValueError('référence manquante')
+    if len(reference) > 64:
+        raise ValueError('référence trop longue (64 caractères max.)')
+    if not libelle:
+        raise ValueError('libellé manquant')
+    if len(libelle) > 255:
+        raise ValueError('libellé trop long (255 caractères max.)')
+
+    row = {'reference': sanitize_input(reference), 'libelle': sanitize_input(libelle)}
+
+    for column, length in (('item_type', 64), ('unit', 32), ('location', 128), ('notes', None)):
+        if column in values:
+            text = sanitize_input(values[column]) if values[column] else None
+            row[column] = text[:length] if text and length else text
+    if not row.get('item_type') and values.get('category'):
+        row['item_type'] = sanitize_input(values['category'])[:64]
+    if 'unit' in row and not row['unit']:
+        row['unit'] = 'piece'
+
+    for column in NUMERIC_COLUMNS:
+        if column in values:
+            row[column] = _parse_number(values[column], column)
+
+    for column, names, target in (('supplier', suppliers, 'supplier_id'),
+                                  ('category', categories, 'category_id')):
+        if column in values:
+            name = values[column]
+            if name and fold(name) not in names:
+                raise ValueError(f'{column} inconnu : {name}')
+            row[target] = names[fold(name)] if name else None
+    return row
+
+
+def _insert_defaults(row):
+    """Complète une nouvelle ligne avec les valeurs par défaut du modèle"""
+    row.setdefault('item_type', None)
+    row['item_type'] = row['item_type'] or DEFAULT_ITEM_TYPE
+    for column in NUMERIC_COLUMNS:
+        row.setdefault(column, 0.0)
+    row['value'] = row['price'] * row['quantity']
+    return row
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _corrections(quantities, user_id):
+    """
+    Enregistre les nouvelles quantités des articles existants comme corrections
+
+    Args:
+        quantities: {id article: quantité importée}
+
+    Raises:
+        StockLedgerError: Stock modifié entre la lecture et l'écriture
+    """
+    from app.models import StockItem
+    from app.stock.ledger import MAX_BATCH_SIZE, apply_movements
+
+    current = dict(db.session.execute(
+        select(StockItem.id, StockItem.quantity).where(StockItem.id.in_(list(quantities)))
+    ).all())
+    movements = [{
+        'stock_item_id': item_id,
+        'movement_type': 'correction',
+        'quantity': quantity - (current.get(item_id) or 0.0),
+        'notes': 'Import du stock'
+    } for item_id, quantity in quantities.items() if quantity != (current.get(item_id) or 0.0)]
+    for batch in _chunks(movements, MAX_BATCH_SIZE):
+        apply_movements(batch, user_id=user_id, commit=False, internal=True)
+
+
+def import_stock_items(rows, dry_run=False, update_existing=True, chunk_size=DEFAULT_CHUNK_SIZE,
+                       user_id=None):
+    """
+    Importe des éléments de stock par lots
+
+    Args:
+        rows: Itérable de (numéro de ligne, dict) produit par iter_file_rows()
+        dry_run: Valider sans rien écrire
+        update_existing: Mettre à jour les références existantes (sinon
+            elles sont signalées en erreur)
+        chunk_size: Nombre de lignes par lot (une transaction par lot)
+        user_id: Utilisateur auquel sont attribuées les corrections de quantité
+
+    Returns:
+        ImportReport ; si le fichier devient illisible après les premiers
+        lots, les lots déjà validés sont conservés et `aborted` contient
+        le motif de l'arrêt
+
+    Raises:
+        StockImportError: Fichier illisible avant toute écriture
+    """
+    from app.models import StockItem, Supplier, StockCategory
+    from app.alerts import check_stock_alerts
+    from app.search import reindex
+    from app.stock.ledger import StockLedgerError
+    from app.stock.mrp import mark_stock_items
+
+    report = ImportReport(dry_run=dry_run)
+    existing = dict(db.session.execute(select(StockItem.reference, StockItem.id)).all())
+    suppliers = _name_map(Supplier)
+    categories = _name_map(StockCategory)
+    seen = set()
+
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            inserts, updates, accepted = [], [], []
+            now = datetime.utcnow()
+
+            for line, values in chunk:
+                report.rows += 1
+                try:
+                    row = _build_row(values, suppliers, categories)
+                except ValueError as e:
+                    report.add_error(line, str(e))
+                    continue
+
+                reference = row['reference']
+                if reference in seen:
+                    report.add_error(line, f'référence en double dans le fichier : {reference}')
+                    continue
+                seen.add(reference)
+
+                if reference in existing:
+                    if not update_existing:
+                        report.add_error(line, f'référence déjà existante : {reference}')
+                        continue
+                    row.update(id=existing[reference], updated_at=now)
+                    updates.append(row)
+                else:
+                    row.update(created_at=now, updated_at=now)
+                    inserts.append(_insert_defaults(row))
+                accepted.append(line)
+
+            if dry_run or not (inserts or updates):
+                report.created += len(inserts)
+                report.updated += len(updates)
+                continue
+
+            if inserts:
+                db.session.execute(insert(StockItem), inserts)
+                # L'insertion en masse ne déclenche pas les hooks de l'index de recherche
+                reindex('stock', db.session.execute(
+                    select(StockItem.id).where(StockItem.reference.in_([row['reference'] for row in inserts]))
+                ).scalars().all())
+            if updates:
+                quantities = {row['id']: row.pop('quantity') for row in updates if 'quantity' in row}
+                db.session.execute(update(StockItem), updates)
+                if quantities:
+                    try:
+                        _corrections(quantities, user_id)
+                    except StockLedgerError:
+                        # Stock modifié pendant l'import : le lot entier est annulé
+                        db.session.rollback()
+                        for line in accepted:
+                            report.add_error(line, "stock modifié pendant l'import, lot ignoré")
+                        continue
+                # Valeur recalculée en SQL : prix ou quantité peuvent être absents du fichier
+                db.session.execute(
+                    update(StockItem)
+                    .where(StockItem.id.in_([row['id'] for row in updates]))
+                    .values(value=StockItem.price * StockItem.quantity),
+                    execution_options={'synchronize_session': False}
+                )
+                reindex('stock', [row['id'] for row in updates])
+                mark_stock_items([row['id'] for row in updates])
+            db.session.commit()
+            report.created += len(inserts)
+            report.updated += len(updates)
+    except StockImportError as e:
+        if not report.rows:
+            raise
+        # Lots précédents déjà validés : rapport partiel
+        report.aborted = f'{e} (import interrompu après {report.rows} ligne(s))'
+
+    if not dry_run and (report.created or report.updated):
+        # Les quantités importées peuvent déclencher des alertes
+        check_stock_alerts()
+
+    return report
+
+
+# ==================== EXPORT ====================
+
+def _export_query():
+    from app.models import StockItem, Supplier, StockCategory
+    return select(
+        StockItem.reference, StockItem.libelle, StockItem.item_type,
+        StockItem.quantity, StockItem.min_quantity, StockItem.price,
+        StockItem.unit, StockItem.location,
+        Supplier.name.label('supplier'), StockCategory.name.label('category'),
+        StockItem.notes
+    ).outerjoin(Supplier, Supplier.id == StockItem.supplier_id) \
+        .outerjoin(StockCategory, StockCategory.id == StockItem.category_id) \
+        .order_by(StockItem.reference)
+
+
+def iter_export_rows(chunk_size=1000):
+    """Lignes d'export lues par paquets de `chunk_size`"""
+    result = db.session.execute(_export_query().execution_options(yield_per=chunk_size))
+    for row in result:
+        yield tuple(row)
+
+
+def export_csv(chunk_size=1000):
+    """Produit le CSV (séparateur « ; », BOM UTF-8 pour Excel) par morceaux"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+
+    buffer.write('\ufeff')
+    writer.writerow(COLUMNS)
+    for count, row in enumerate(iter_export_rows(chunk_size), start=1):
+        writer.writerow(['' if value is None else value for value in row])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_xlsx(target, chunk_size=1000):
+    """
+    Écrit l'export XLSX dans `target` (chemin ou fichier binaire)
+
+    Le classeur est ouvert en mode write_only : les lignes ne sont pas
+    conservées en mémoire.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Stock')
+    sheet.append(COLUMNS)
+    for row in iter_export_rows(chunk_size):
+        sheet.append(list(row))
+    workbook.save(target)
@@ -1,10 +1,12 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField,DateField, TextAreaField, SubmitField, IntegerField, \
-    FloatField, SelectField, FieldList, FormField
+    FloatField, SelectField, FieldList, FormField, BooleanField, HiddenField
 from wtforms.validators import DataRequired, Length, Optional, NumberRange, ValidationError
 from app.models import StockItem
+from app.forms import TypeaheadSelectField
 from datetime import date
+import uuid
 
 class SupplierForm(FlaskForm):
     """Formulaire pour les fournisseurs"""
@@ -56,8 +58,8 @@ class StockMovementForm(FlaskForm):
     ])  # N° facture, bon de livraison, etc.
     
     supplier_id = SelectField('Fournisseur', coerce=int, validators=[Optional()])
-    task_id = SelectField('Tâche', coerce=int, validators=[Optional()])
-    project_id = SelectField('Projet', coerce=int, validators=[Optional()])
+    task_id = TypeaheadSelectField('Tâche', source='task', validators=[Optional()])
+    project_id = TypeaheadSelectField('Projet', source='project', validators=[Optional()])
     
     justification = TextAreaField('Justification/Motif', validators=[
         Optional(),
@@ -65,6 +67,9 @@ class StockMovementForm(FlaskForm):
     ])
     
     notes = TextAreaField('Notes', validators=[Optional()])
+    # Clé d'idempotence générée à l'affichage : un double envoi du même
+    # formulaire n'applique le mouvement qu'une fois
+    idempotency_key = HiddenField(default=lambda: uuid.uuid4().hex)
     submit = SubmitField('Enregistrer le mouvement')
 
 
@@ -88,6 +93,7 @@ class PurchaseOrderForm(FlaskForm):
     status = SelectField('Statut', choices=[
         ('pending', 'En attente'),
         ('ordered', 'Commandée'),
+        ('partial', 'Partiellement livrée'),
         ('delivered', 'Livrée'),
         ('cancelled', 'Annulée')
     ], default='pending')
@@ -98,7 +104,7 @@ class PurchaseOrderForm(FlaskForm):
 
 class PurchaseOrderItemForm(FlaskForm):
     """Formulaire pour les éléments d'une commande"""
-    stock_item_id = SelectField('Article*', coerce=int, validators=[DataRequired()])
+    stock_item_id = TypeaheadSelectField('Article*', source='stock', validators=[DataRequired()])
     quantity_ordered = FloatField('Quantité commandée*', validators=[
         DataRequired(),
         NumberRange(min=0.01)
@@ -180,4 +186,14 @@ class StockFileForm(FlaskForm):
         FileAllowed(['pdf', 'png', 'jpg', 'jpeg'], 'Formats autorisés: PDF, PNG, JPG')
     ])
     description = StringField('Description', validators=[Optional(), Length(max=255)])
-    submit = SubmitField('Uploader')
\ No newline at end of file
+    submit = SubmitField('Uploader')
+
+class StockImportForm(FlaskForm):
+    """Formulaire d'import en masse des éléments du stock"""
+    file = FileField('Fichier CSV ou XLSX', validators=[
+        FileRequired(message='Veuillez sélectionner un fichier'),
+        FileAllowed(['csv', 'xlsx'], 'Formats autorisés: CSV, XLSX')
+    ])
+    update_existing = BooleanField('Mettre à jour les références existantes', default=True)
+    dry_run = BooleanField('Simulation (aucune écriture)', default=True)
+    submit = SubmitField('Importer')
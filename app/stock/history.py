@@ -0,0 +1,306 @@
+"""
+Historique des niveaux de stock
+
+Chaque clôture journalière (`flask snapshot-stock`) photographie quantité,
+prix et valeur de tous les articles dans `stock_snapshot`, en un seul
+INSERT ... SELECT. Le niveau à un instant T se reconstruit ensuite à partir
+de la dernière photographie antérieure à T, à laquelle on ajoute les
+mouvements enregistrés entre la photographie et T : le coût dépend du
+nombre d'articles et des mouvements d'une journée au plus, pas de tout
+l'historique.
+
+Sans photographie antérieure à T, le niveau est déduit de la quantité
+actuelle moins les mouvements postérieurs à T. Les changements de quantité
+du formulaire d'édition et de l'import sont enregistrés comme corrections
+(variation signée) et suivent le même chemin ; les ajustements saisis par
+l'utilisateur n'ont pas d'effet sur la quantité.
+
+La valeur d'un article à T est sa quantité à T au prix de la
+photographie utilisée (prix actuel à défaut).
+"""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import case, delete, func, insert, literal, select
+
+from app import db
+from app.models import StockItem, StockMovement, StockSnapshot
+from app.stock.ledger import MOVEMENT_SIGNS
+
+MAX_SERIES_DAYS = 366
+
+
+def _signed_quantity():
+    """
+    Variation de quantité d'un mouvement (positive en entrée)
+
+    Seuls les types qui modifient le stock dans le registre comptent : un
+    ajustement (y compris ceux enregistrés avant les corrections signées)
+    n'a jamais modifié la quantité et n'est pas rejoué.
+    """
+    return StockMovement.quantity * case(
+        *[(StockMovement.movement_type == movement_type, sign)
+          for movement_type, sign in MOVEMENT_SIGNS.items() if sign],
+        else_=0
+    )
+
+
+def end_of_day(day):
+    return datetime.combine(day, time.max)
+
+
+# ==================== CLÔTURE ====================
+
+def take_snapshot(snapshot_date=None, commit=True):
+    """
+    Photographie le niveau de tous les articles
+
+    Une photographie existante pour la même date est remplacée.
+
+    Returns:
+        int: Nombre d'articles photographiés
+    """
+    taken_at = datetime.utcnow()
+    snapshot_date = snapshot_date or taken_at.date()
+
+    db.session.execute(delete(StockSnapshot).where(StockSnapshot.snapshot_date == snapshot_date))
+    result = db.session.execute(insert(StockSnapshot).from_select(
+        ['stock_item_id', 'snapshot_date', 'taken_at', 'quantity', 'price', 'value'],
+        select(
+            StockItem.id, literal(snapshot_date), literal(taken_at),
+            func.coalesce(StockItem.quantity, 0.0),
+            func.coalesce(StockItem.price, 0.0),
+            func.coalesce(StockItem.quantity, 0.0) * func.coalesce(StockItem.price, 0.0)
+        )
+    ))
+    if commit:
+        db.session.commit()
+    return result.rowcount
+
+
+# ==================== RECONSTRUCTION ====================
+
+def _movement_deltas(after, until, item_ids=None):
+    """{id article: variation} des mouvements dans ]after, until]"""
+    query = select(StockMovement.stock_item_id, func.sum(_signed_quantity())) \
+        .where(StockMovement.stock_item_id.isnot(None)) \
+        .group_by(StockMovement.stock_item_id)
+    if after is not None:
+        query = query.where(StockMovement.movement_date > after)
+    if until is not None:
+        query = query.where(StockMovement.movement_date <= until)
+    if item_ids is not None:
+        query = query.where(StockMovement.stock_item_id.in_(item_ids))
+    return {item_id: delta or 0.0 for item_id, delta in db.session.execute(query)}
+
+
+def levels_at(at, item_ids=None):
+    """
+    Quantité et valeur des articles à un instant donné
+
+    Args:
+        at: datetime (UTC)
+        item_ids: Articles concernés (None pour tout le stock)
+
+    Returns:
+        dict: {id article: {'quantity', 'price', 'value'}} ; les articles
+        créés après `at` sont absents
+    """
+    if item_ids is not None:
+        item_ids = list(item_ids)
+        if not item_ids:
+            return {}
+
+    anchor = db.session.execute(
+        select(func.max(StockSnapshot.taken_at)).where(StockSnapshot.taken_at <= at)
+    ).scalar()
+
+    levels = {}
+    if anchor is not None:
+        query = select(StockSnapshot.stock_item_id, StockSnapshot.quantity, StockSnapshot.price) \
+            .where(StockSnapshot.taken_at == anchor)
+        if item_ids is not None:
+            query = query.where(StockSnapshot.stock_item_id.in_(item_ids))
+        for item_id, quantity, price in db.session.execute(query):
+            levels[item_id] = {'quantity': quantity, 'price': price}
+        for item_id, delta in _movement_deltas(anchor, at, item_ids).items():
+            if item_id in levels:
+                levels[item_id]['quantity'] += delta
+
+    # Articles absents de la photographie (ou aucune photographie) :
+    # quantité actuelle moins les mouvements postérieurs
+    query = select(StockItem.id, StockItem.quantity, StockItem.price).where(
+        db.or_(StockItem.created_at.is_(None), StockItem.created_at <= at)
+    )
+    if item_ids is not None:
+        query = query.where(StockItem.id.in_(item_ids))
+    if levels:
+        query = query.where(StockItem.id.notin_(list(levels)))
+    current = db.session.execute(query).all()
+    if current:
+        later = _movement_deltas(at, None, [row.id for row in current])
+        for row in current:
+            levels[row.id] = {'quantity': (row.quantity or 0.0) - later.get(row.id, 0.0),
+                              'price': row.price or 0.0}
+
+    for level in levels.values():
+        level['value'] = level['quantity'] * level['price']
+    return levels
+
+
+def _daily_deltas(start, end, item_id=None):
+    """{date: [variation de quantité, variation de valeur au prix actuel]} des mouvements de [start, end]"""
+    signed = _signed_quantity()
+    day = func.date(StockMovement.movement_date)
+    query = select(
+        day.label('day'),
+        func.sum(signed).label('quantity'),
+        func.sum(signed * func.coalesce(StockItem.price, 0.0)).label('value')
+    ).join(StockItem, StockItem.id == StockMovement.stock_item_id) \
+        .where(StockMovement.movement_date > end_of_day(start - timedelta(days=1)),
+               StockMovement.movement_date <= end_of_day(end)) \
+        .group_by(day)
+    if item_id is not None:
+        query = query.where(StockMovement.stock_item_id == item_id)
+    deltas = {}
+    for row in db.session.execute(query):
+        key = row.day if isinstance(row.day, date) else date.fromisoformat(str(row.day))
+        deltas[key] = [row.quantity or 0.0, row.value or 0.0]
+    return deltas
+
+
+def _openings(start, end, item_id=None):
+    """
+    Niveaux d'ouverture des articles créés dans [start, end], par jour de
+    création
+
+    Returns:
+        dict: {date: {'opening': [quantité, valeur] à la création, avant les
+        mouvements du jour, 'closing': [quantité, valeur] en fin de journée
+        des articles absents de la photographie du jour}}
+    """
+    signed = _signed_quantity()
+    created = func.date(StockItem.created_at)
+
+    def movements(condition):
+        return select(func.coalesce(func.sum(signed), 0.0)) \
+            .where(StockMovement.stock_item_id == StockItem.id, condition) \
+            .correlate(StockItem).scalar_subquery()
+
+    price = func.coalesce(StockItem.price, 0.0)
+    opening = func.coalesce(StockItem.quantity, 0.0) - movements(func.date(StockMovement.movement_date) >= created)
+    closing = func.coalesce(StockItem.quantity, 0.0) - movements(func.date(StockMovement.movement_date) > created)
+    unsnapshotted = StockSnapshot.id.is_(None)
+    query = select(
+        created.label('day'),
+        func.sum(opening).label('opening_quantity'),
+        func.sum(opening * price).label('opening_value'),
+        func.sum(case((unsnapshotted, closing), else_=0.0)).label('closing_quantity'),
+        func.sum(case((unsnapshotted, closing * price), else_=0.0)).label('closing_value')
+    ).outerjoin(StockSnapshot, db.and_(StockSnapshot.stock_item_id == StockItem.id,
+                                       StockSnapshot.snapshot_date == created)) \
+        .where(StockItem.created_at > end_of_day(start - timedelta(days=1)),
+               StockItem.created_at <= end_of_day(end)) \
+        .group_by(created)
+    if item_id is not None:
+        query = query.where(StockItem.id == item_id)
+    openings = {}
+    for row in db.session.execute(query):
+        key = row.day if isinstance(row.day, date) else date.fromisoformat(str(row.day))
+        openings[key] = {'opening': [row.opening_quantity or 0.0, row.opening_value or 0.0],
+                         'closing': [row.closing_quantity or 0.0, row.closing_value or 0.0]}
+    return openings
+
+
+def level_series(start, end, item_id=None):
+    """
+    Niveau de clôture journalier sur une période (graphiques)
+
+    Le niveau est reconstruit une seule fois, la veille de `start`
+    (levels_at), puis avancé jour par jour avec les variations des
+    mouvements et le niveau d'ouverture des articles créés ce jour-là, lus en
+    deux requêtes groupées par jour. Les jours photographiés reprennent la
+    valeur de la clôture (qui inclut les modifications directes de quantité,
+    et les articles créés après la photographie) ; aujourd'hui est lu sur
+    les quantités actuelles. Le coût ne dépend pas du nombre de jours sans
+    clôture.
+
+    Args:
+        start, end: Dates incluses (end est borné à aujourd'hui)
+        item_id: Article (None pour la valeur totale du stock)
+
+    Returns:
+        list: dicts date, quantity (article seul), value
+
+    Raises:
+        ValueError: Période invalide ou trop longue
+    """
+    today = datetime.utcnow().date()
+    end = min(end, today)
+    if start > end:
+        raise ValueError('Période invalide')
+    if (end - start).days >= MAX_SERIES_DAYS:
+        raise ValueError(f'Période limitée à {MAX_SERIES_DAYS} jours')
+
+    query = select(
+        StockSnapshot.snapshot_date,
+        func.sum(StockSnapshot.quantity).label('quantity'),
+        func.sum(StockSnapshot.value).label('value')
+    ).where(StockSnapshot.snapshot_date.between(start, end)) \
+        .group_by(StockSnapshot.snapshot_date)
+    if item_id is not None:
+        query = query.where(StockSnapshot.stock_item_id == item_id)
+    closes = {row.snapshot_date: [row.quantity or 0.0, row.value or 0.0]
+              for row in db.session.execute(query)}
+
+    # Mouvements du même jour postérieurs à la photographie
+    signed = _signed_quantity()
+    query = select(
+        StockSnapshot.snapshot_date,
+        func.sum(signed).label('quantity'),
+        func.sum(signed * StockSnapshot.price).label('value')
+    ).join(StockMovement, db.and_(
+        StockMovement.stock_item_id == StockSnapshot.stock_item_id,
+        StockMovement.movement_date > StockSnapshot.taken_at,
+        func.date(StockMovement.movement_date) == StockSnapshot.snapshot_date
+    )).where(StockSnapshot.snapshot_date.between(start, end)) \
+        .group_by(StockSnapshot.snapshot_date)
+    if item_id is not None:
+        query = query.where(StockSnapshot.stock_item_id == item_id)
+    for row in db.session.execute(query):
+        closes[row.snapshot_date][0] += row.quantity or 0.0
+        closes[row.snapshot_date][1] += row.value or 0.0
+
+    levels = levels_at(end_of_day(start - timedelta(days=1)),
+                       [item_id] if item_id is not None else None)
+    quantity = sum(level['quantity'] for level in levels.values())
+    value = sum(level['value'] for level in levels.values())
+    deltas = _daily_deltas(start, end, item_id)
+    openings = _openings(start, end, item_id)
+
+    series = []
+    day = start
+    while day <= end:
+        if day == today:
+            query = select(func.sum(func.coalesce(StockItem.quantity, 0.0)),
+                           func.sum(func.coalesce(StockItem.quantity, 0.0) * func.coalesce(StockItem.price, 0.0)))
+            if item_id is not None:
+                query = query.where(StockItem.id == item_id)
+            quantity, value = (v or 0.0 for v in db.session.execute(query).one())
+        elif day in closes:
+            quantity, value = closes[day]
+            if day in openings:
+                quantity += openings[day]['closing'][0]
+                value += openings[day]['closing'][1]
+        else:
+            delta_quantity, delta_value = deltas.get(day, (0.0, 0.0))
+            if day in openings:
+                delta_quantity += openings[day]['opening'][0]
+                delta_value += openings[day]['opening'][1]
+            quantity += delta_quantity
+            value += delta_value
+        point = {'date': day.isoformat(), 'value': round(value, 2)}
+        if item_id is not None:
+            point['quantity'] = quantity
+        series.append(point)
+        day += timedelta(days=1)
+    return series
@@ -0,0 +1,385 @@
+"""
+Registre des mouvements de stock
+
+Toute variation de StockItem.quantity passe par apply_movements() : les
+mouvements d'un lot sont cumulés par article et appliqués par un seul
+UPDATE ensembliste en SQL, jamais par une lecture-modification-écriture en
+Python. Une sortie nette est conditionnelle (quantity + variation >= 0) :
+si deux requêtes concurrentes se disputent le même article, la base
+sérialise les deux UPDATE et le second ne modifie pas l'article si le
+stock ne suffit plus ; le lot entier est alors refusé. Les lignes sont
+verrouillées dans l'ordre de la clé primaire (pas d'interblocage entre
+deux lots).
+
+Une correction (movement_type 'correction', type interne) porte une
+variation signée : négative pour une baisse. C'est ainsi que le formulaire
+d'édition d'un article et l'import en masse enregistrent une nouvelle
+quantité. L'ajustement saisi par l'utilisateur ('adjustment') reste un
+mouvement informatif, sans effet sur la quantité.
+
+Une clé d'idempotence fournie par le client (en-tête Idempotency-Key ou
+champ idempotency_key) est enregistrée dans la même transaction que les
+mouvements : une requête rejouée (retry AJAX, double clic) renvoie le
+résultat initial sans rien réappliquer.
+
+Une date de mouvement fournie par le client ne peut être ni future ni
+antérieure à la dernière clôture de stock (app/stock/history.py), qui ne
+serait pas recalculée.
+"""
+import hashlib
+import json
+import math
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import StockItem, StockMovement, StockRequest, StockSnapshot
+
+# Effet de chaque type de mouvement sur la quantité en stock
+MOVEMENT_SIGNS = {
+    'purchase': 1,
+    'return': 1,
+    'sale': -1,
+    'waste': -1,
+    'transfer': 0,
+    'adjustment': 0,
+    'correction': 1,  # quantité signée
+}
+
+# Types réservés à l'application (quantité signée, refusés des clients)
+INTERNAL_TYPES = ('correction',)
+
+MOVEMENT_FIELDS = ('unit_price', 'total_price', 'reference', 'notes', 'movement_date',
+                   'supplier_id', 'task_id', 'project_id')
+
+MAX_REFERENCE_LENGTH = 64
+
+MAX_BATCH_SIZE = 500
+MAX_KEY_LENGTH = 64
+REQUEST_RETENTION_DAYS = 7
+
+
+class StockLedgerError(ValueError):
+    """Mouvement refusé (article inconnu, quantité ou type invalide...)"""
+
+
+class InsufficientStockError(StockLedgerError):
+    """Stock insuffisant pour au moins une sortie"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        names = ', '.join(shortage['reference'] for shortage in shortages)
+        super().__init__(f'Quantité insuffisante en stock : {names}')
+
+
+def _number(value):
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(value)
+    return number
+
+
+def _text(value):
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        raise ValueError(value)
+    return str(value)
+
+
+def _reference(value):
+    value = _text(value)
+    if len(value) > MAX_REFERENCE_LENGTH:
+        raise ValueError(value)
+    return value
+
+
+def _identifier(value):
+    if isinstance(value, (bool, float)):
+        raise ValueError(value)
+    return int(value)
+
+
+def _moment(value):
+    """datetime UTC naïf (datetime ou chaîne ISO 8601)"""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(_text(value))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# Conversion des champs optionnels (ValueError / TypeError si invalide)
+FIELD_TYPES = {
+    'unit_price': _number,
+    'total_price': _number,
+    'reference': _reference,
+    'notes': _text,
+    'movement_date': _moment,
+    'supplier_id': _identifier,
+    'task_id': _identifier,
+    'project_id': _identifier,
+}
+
+
+def _normalize(movement, position, internal=False):
+    """Valide un mouvement (dict) et retourne une copie normalisée"""
+    try:
+        stock_item_id = _identifier(movement['stock_item_id'])
+        quantity = _number(movement['quantity'])
+    except (KeyError, TypeError, ValueError):
+        raise StockLedgerError(f'Mouvement {position} : article ou quantité invalide')
+    movement_type = movement.get('movement_type') or 'purchase'
+    if not isinstance(movement_type, str) or movement_type not in MOVEMENT_SIGNS:
+        raise StockLedgerError(f'Mouvement {position} : type inconnu ({movement_type})')
+    if movement_type in INTERNAL_TYPES:
+        if not internal:
+            raise StockLedgerError(f'Mouvement {position} : type réservé ({movement_type})')
+        if quantity == 0:
+            raise StockLedgerError(f'Mouvement {position} : variation nulle')
+    elif quantity <= 0:
+        raise StockLedgerError(f'Mouvement {position} : la quantité doit être positive')
+
+    normalized = {'stock_item_id': stock_item_id, 'movement_type': movement_type, 'quantity': quantity}
+    for field in MOVEMENT_FIELDS:
+        if movement.get(field) is None:
+            continue
+        try:
+            normalized[field] = FIELD_TYPES[field](movement[field])
+        except (TypeError, ValueError):
+            raise StockLedgerError(f'Mouvement {position} : {field} invalide')
+    return normalized
+
+
+def _check_dates(movements):
+    """Refuse les dates futures ou antérieures à la dernière clôture"""
+    dated = [(position, movement['movement_date'])
+             for position, movement in enumerate(movements, start=1) if 'movement_date' in movement]
+    if not dated:
+        return
+    now = datetime.utcnow()
+    last_close = db.session.execute(select(func.max(StockSnapshot.taken_at))).scalar()
+    for position, moment in dated:
+        if moment > now:
+            raise StockLedgerError(f'Mouvement {position} : date future')
+        if last_close is not None and moment <= last_close:
+            raise StockLedgerError(
+                f'Mouvement {position} : date antérieure à la clôture du {last_close:%d/%m/%Y %H:%M}'
+            )
+
+
+def _stored_response(user_id, idempotency_key, request_hash):
+    stored = db.session.execute(
+        select(StockRequest.request_hash, StockRequest.response).where(
+            StockRequest.user_id == user_id,
+            StockRequest.idempotency_key == idempotency_key
+        )
+    ).first()
+    if stored is None:
+        return None
+    if stored.request_hash != request_hash:
+        raise StockLedgerError("Clé d'idempotence déjà utilisée pour une autre requête")
+    response = json.loads(stored.response)
+    response['replayed'] = True
+    return response
+
+
+def _apply_deltas(deltas):
+    """
+    Applique les variations nettes de quantité en un seul UPDATE ensembliste
+
+    UPDATE ... SET quantity = quantity + CASE id ... END WHERE id IN (...) ;
+    les articles dont la variation est négative ne sont modifiés que si le
+    stock suffit. La valeur est assignée avant la quantité : MySQL évalue
+    les affectations de gauche à droite avec les valeurs déjà modifiées, les
+    autres bases avec les valeurs d'origine ; dans cet ordre le résultat est
+    le même partout.
+
+    Args:
+        deltas: {id article: variation non nulle}
+
+    Returns:
+        bool: False si une sortie dépasse le stock disponible (aucune ligne
+        n'est alors à conserver : l'appelant annule le point de sauvegarde)
+    """
+    delta = case(deltas, value=StockItem.id, else_=0.0)
+    statement = update(StockItem).where(
+        StockItem.id.in_(list(deltas)),
+        db.or_(delta >= 0, StockItem.quantity + delta >= 0)
+    ).ordered_values(
+        (StockItem.value, StockItem.price * (StockItem.quantity + delta)),
+        (StockItem.quantity, StockItem.quantity + delta),
+        (StockItem.updated_at, datetime.utcnow()),
+    )
+    result = db.session.execute(statement, execution_options={'synchronize_session': False})
+    return result.rowcount == len(deltas)
+
+
+def request_hash(payload):
+    """Empreinte d'une requête, comparée lors d'un rejeu avec la même clé"""
+    data = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def replayed_response(user_id, idempotency_key, payload):
+    """
+    Réponse enregistrée pour une clé d'idempotence déjà traitée
+
+    Returns:
+        dict: Réponse initiale (replayed=True) ou None si la clé est nouvelle
+
+    Raises:
+        StockLedgerError: Clé déjà utilisée pour une autre requête
+    """
+    idempotency_key = _clean_key(idempotency_key)
+    if not (user_id and idempotency_key):
+        return None
+    return _stored_response(user_id, idempotency_key, request_hash(payload))
+
+
+def _clean_key(idempotency_key):
+    if idempotency_key is None:
+        return None
+    return str(idempotency_key).strip()[:MAX_KEY_LENGTH] or None
+
+
+def apply_movements(movements, user_id=None, idempotency_key=None, commit=True,
+                    request=None, response_fields=None, internal=False):
+    """
+    Applique un lot de mouvements de stock dans une transaction
+
+    Args:
+        movements: Liste de dicts (stock_item_id, movement_type, quantity et
+            optionnellement unit_price, total_price, reference, notes,
+            movement_date, supplier_id, task_id, project_id)
+        user_id: Utilisateur qui enregistre les mouvements
+        idempotency_key: Clé fournie par le client ; une requête déjà
+            traitée avec la même clé renvoie le résultat enregistré.
+            Nécessite commit=True (un conflit annule la transaction).
+        commit: Valider la transaction (sinon l'appelant valide, avec ses
+            propres modifications, et vérifie les alertes)
+        request: Requête d'origine à comparer lors d'un rejeu (par défaut
+            les mouvements normalisés), quand les mouvements en sont dérivés
+        response_fields: Champs ajoutés à la réponse enregistrée
+        internal: Accepter les types internes (correction à quantité
+            signée) ; jamais pour des mouvements fournis par le client
+
+    Returns:
+        dict: movements (ids créés), quantities ({id article: nouvelle
+            quantité}), replayed (True pour une requête rejouée)
+
+    Raises:
+        InsufficientStockError: Une sortie dépasse le stock ; aucun
+            mouvement du lot n'est appliqué
+        StockLedgerError: Mouvement invalide (champ, date future ou antérieure
+            à la dernière clôture) ou article inconnu
+    """
+    from app.alerts import check_stock_alerts
+
+    if not movements:
+        raise StockLedgerError('Aucun mouvement')
+    if len(movements) > MAX_BATCH_SIZE:
+        raise StockLedgerError(f'{MAX_BATCH_SIZE} mouvements maximum par lot')
+    idempotency_key = _clean_key(idempotency_key)
+    if idempotency_key and not (user_id and commit):
+        raise StockLedgerError("Clé d'idempotence : utilisateur et commit requis")
+
+    movements = [_normalize(movement, position, internal)
+                 for position, movement in enumerate(movements, start=1)]
+    digest = request_hash(movements if request is None else request)
+    if idempotency_key:
+        stored = _stored_response(user_id, idempotency_key, digest)
+        if stored is not None:
+            return stored
+    _check_dates(movements)
+
+    # Articles concernés, en une requête
+    item_ids = sorted({movement['stock_item_id'] for movement in movements})
+    items = {row.id: row for row in db.session.execute(
+        select(StockItem.id, StockItem.reference, StockItem.libelle,
+               StockItem.price, StockItem.quantity).where(StockItem.id.in_(item_ids))
+    ).all()}
+    missing = [i for i in item_ids if i not in items]
+    if missing:
+        raise StockLedgerError(f'Article introuvable : {missing[0]}')
+
+    # Variation nette par article, appliquée en un UPDATE (les lignes sont
+    # verrouillées dans l'ordre de la clé primaire). En cas de stock
+    # insuffisant, seul le point de sauvegarde est annulé.
+    deltas = {}
+    for movement in movements:
+        delta = MOVEMENT_SIGNS[movement['movement_type']] * movement['quantity']
+        deltas[movement['stock_item_id']] = deltas.get(movement['stock_item_id'], 0.0) + delta
+    deltas = {item_id: delta for item_id, delta in deltas.items() if delta}
+
+    if deltas:
+        with db.session.begin_nested():
+            if not _apply_deltas(deltas):
+                available = dict(db.session.execute(
+                    select(StockItem.id, StockItem.quantity)
+                    .where(StockItem.id.in_([i for i, delta in deltas.items() if delta < 0]))
+                ).all())
+                raise InsufficientStockError([{
+                    'stock_item_id': item_id,
+                    'reference': items[item_id].reference,
+                    'name': items[item_id].libelle,
+                    'needed': -deltas[item_id],
+                    'available': quantity
+                } for item_id, quantity in sorted(available.items())
+                    if (quantity or 0.0) + deltas[item_id] < 0])
+
+    now = datetime.utcnow()
+    records = []
+    for movement in movements:
+        fields = dict(movement)
+        fields.setdefault('unit_price', items[movement['stock_item_id']].price or 0)
+        fields.setdefault('total_price', fields['quantity'] * (fields['unit_price'] or 0))
+        fields.setdefault('movement_date', now)
+        records.append(StockMovement(recorded_by=user_id, **fields))
+    db.session.add_all(records)
+    db.session.flush()
+
+    quantities = dict(db.session.execute(
+        select(StockItem.id, StockItem.quantity).where(StockItem.id.in_(item_ids))
+    ).all())
+    response = dict(response_fields or {})
+    response.update({
+        'movements': [record.id for record in records],
+        'quantities': {str(i): quantities[i] for i in item_ids},
+        'replayed': False
+    })
+
+    # Les instances déjà chargées relisent quantité et valeur
+    for instance in db.session.identity_map.values():
+        if isinstance(instance, StockItem) and instance.id in quantities:
+            db.session.expire(instance, ['quantity', 'value', 'updated_at'])
+
+    if idempotency_key:
+        db.session.add(StockRequest(
+            user_id=user_id,
+            idempotency_key=idempotency_key,
+            request_hash=digest,
+            response=json.dumps(response)
+        ))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # Même clé traitée en parallèle : la transaction gagnante fait foi
+            db.session.rollback()
+            stored = _stored_response(user_id, idempotency_key, digest)
+            if stored is None:
+                raise
+            return stored
+
+    if commit:
+        db.session.commit()
+        check_stock_alerts(item_ids)
+    return response
+
+
+def purge_requests(days=REQUEST_RETENTION_DAYS):
+    """Supprime les clés d'idempotence plus anciennes que `days` jours"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = db.session.execute(delete(StockRequest).where(StockRequest.created_at < cutoff))
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,363 @@
+"""
+Calcul des besoins en matériaux (MRP)
+
+Les besoins de toutes les tâches ouvertes (en attente ou en cours, avec
+utilisation du stock) sont lus en une requête groupée par article et par
+tâche, triée par date de début. Pour chaque article, le stock disponible
+est ensuite réparti chronologiquement entre les tâches ; les commandes
+ouvertes dont la date de livraison prévue précède le début d'une tâche
+viennent compléter le disponible. Le résultat est conservé dans
+`material_allocation` (une ligne par tâche et par article) : une tâche y
+apparaît en manque dès que les tâches qui la précèdent ont consommé le
+stock.
+
+Le calcul est incrémental : un flush qui touche un mouvement, une ligne
+de tâche, une tâche, un article ou une ligne de commande note les articles
+concernés, et seuls ceux-ci sont recalculés juste avant le commit (même
+principe que app/projects/costs.py). `flask rebuild-mrp` recalcule tout.
+
+Les propositions d'achat ramènent le stock projeté (stock + commandes
+ouvertes - besoins) au stock minimum de l'article, regroupées par
+fournisseur ; elles peuvent être enregistrées comme commandes en attente.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import case, delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from app import db
+
+OPEN_TASK_STATUSES = ('pending', 'in_progress')
+OPEN_ORDER_STATUSES = ('pending', 'ordered', 'partial')
+CHUNK_SIZE = 500
+DRAFT_NOTES = 'Proposition du calcul des besoins'
+
+
+def _required_quantity():
+    from app.models import TaskStockItem
+    return func.sum(func.coalesce(TaskStockItem.estimated_quantity, 0)
+                    + func.coalesce(TaskStockItem.additional_quantity, 0))
+
+
+def _outstanding_quantity():
+    from app.models import PurchaseOrderItem
+    return func.sum(PurchaseOrderItem.quantity_ordered
+                    - func.coalesce(PurchaseOrderItem.quantity_received, 0))
+
+
+# ==================== ALLOCATION ====================
+
+def _allocate(item_ids):
+    """Lignes d'allocation des articles donnés (trois requêtes)"""
+    from app.models import Task, TaskStockItem, StockItem, PurchaseOrder, PurchaseOrderItem
+
+    required = _required_quantity()
+    demand = db.session.execute(
+        select(TaskStockItem.stock_item_id, Task.id, Task.start_date, required.label('required'))
+        .join(Task, TaskStockItem.task_id == Task.id)
+        .where(TaskStockItem.stock_item_id.in_(item_ids),
+               Task.status.in_(OPEN_TASK_STATUSES),
+               Task.use_stock.is_(True))
+        .group_by(TaskStockItem.stock_item_id, Task.id, Task.start_date)
+        .having(required > 0)
+        .order_by(TaskStockItem.stock_item_id, Task.start_date, Task.id)
+    ).all()
+    if not demand:
+        return []
+
+    available = dict(db.session.execute(
+        select(StockItem.id, func.coalesce(StockItem.quantity, 0.0))
+        .where(StockItem.id.in_({row.stock_item_id for row in demand}))
+    ).all())
+
+    # Réceptions attendues datées, par article et par date croissante
+    receipts = defaultdict(list)
+    for item_id, delivery_date, quantity in db.session.execute(
+        select(PurchaseOrderItem.stock_item_id, PurchaseOrder.delivery_date, _outstanding_quantity())
+        .join(PurchaseOrder, PurchaseOrderItem.purchase_order_id == PurchaseOrder.id)
+        .where(PurchaseOrderItem.stock_item_id.in_(item_ids),
+               PurchaseOrder.status.in_(OPEN_ORDER_STATUSES),
+               PurchaseOrder.delivery_date.isnot(None))
+        .group_by(PurchaseOrderItem.stock_item_id, PurchaseOrder.delivery_date)
+        .order_by(PurchaseOrderItem.stock_item_id, PurchaseOrder.delivery_date)
+    ):
+        if quantity and quantity > 0:
+            receipts[item_id].append((delivery_date, quantity))
+
+    computed_at = datetime.utcnow()
+    rows = []
+    for row in demand:
+        if row.stock_item_id not in available:
+            continue
+        incoming = receipts[row.stock_item_id]
+        while incoming and incoming[0][0] <= row.start_date:
+            available[row.stock_item_id] += incoming.pop(0)[1]
+
+        allocated = min(row.required, max(available[row.stock_item_id], 0.0))
+        available[row.stock_item_id] -= allocated
+        rows.append({
+            'stock_item_id': row.stock_item_id,
+            'task_id': row.id,
+            'need_date': row.start_date,
+            'required': row.required,
+            'allocated': allocated,
+            'shortage': row.required - allocated,
+            'computed_at': computed_at
+        })
+    return rows
+
+
+def refresh_material_plan(item_ids=None):
+    """
+    Recalcule l'allocation du stock aux tâches
+
+    Args:
+        item_ids: Articles à recalculer ; None pour tout le plan
+            (utilisé par `flask rebuild-mrp`)
+
+    Returns:
+        int: Nombre de lignes d'allocation écrites
+    """
+    from app.models import MaterialAllocation, TaskStockItem
+
+    if item_ids is None:
+        db.session.execute(delete(MaterialAllocation))
+        item_ids = db.session.execute(
+            select(TaskStockItem.stock_item_id).where(TaskStockItem.stock_item_id.isnot(None)).distinct()
+        ).scalars().all()
+    else:
+        item_ids = {i for i in item_ids if i}
+        if not item_ids:
+            return 0
+        db.session.execute(delete(MaterialAllocation).where(MaterialAllocation.stock_item_id.in_(item_ids)))
+
+    item_ids = sorted(item_ids)
+    written = 0
+    for start in range(0, len(item_ids), CHUNK_SIZE):
+        rows = _allocate(item_ids[start:start + CHUNK_SIZE])
+        if rows:
+            db.session.execute(insert(MaterialAllocation), rows)
+            written += len(rows)
+    return written
+
+
+# ==================== RAPPORTS ====================
+
+def material_shortages(task_ids=None, item_ids=None, limit=None):
+    """
+    Tâches qui manqueront de matériaux, par date de début
+
+    Returns:
+        list: dicts task_id, task_name, project_id, need_date, stock_item_id,
+        reference, libelle, required, allocated, shortage
+    """
+    from app.models import MaterialAllocation, Task, StockItem
+
+    query = select(
+        MaterialAllocation.task_id, Task.name.label('task_name'), Task.project_id,
+        MaterialAllocation.need_date, MaterialAllocation.stock_item_id,
+        StockItem.reference, StockItem.libelle,
+        MaterialAllocation.required, MaterialAllocation.allocated, MaterialAllocation.shortage
+    ).join(Task, MaterialAllocation.task_id == Task.id) \
+        .join(StockItem, MaterialAllocation.stock_item_id == StockItem.id) \
+        .where(MaterialAllocation.shortage > 0) \
+        .order_by(MaterialAllocation.need_date, MaterialAllocation.task_id, MaterialAllocation.stock_item_id)
+    if task_ids is not None:
+        query = query.where(MaterialAllocation.task_id.in_(task_ids))
+    if item_ids is not None:
+        query = query.where(MaterialAllocation.stock_item_id.in_(item_ids))
+    if limit:
+        query = query.limit(limit)
+
+    return [dict(row._mapping, need_date=row.need_date.isoformat()) for row in db.session.execute(query)]
+
+
+def purchase_suggestions(supplier_ids=None):
+    """
+    Quantités à commander par fournisseur
+
+    Pour chaque article ayant des besoins : stock projeté = stock actuel +
+    commandes ouvertes (datées ou non) - besoins des tâches ouvertes ; la
+    quantité proposée ramène ce stock projeté au stock minimum.
+
+    Returns:
+        list: dicts supplier_id, supplier_name, total_amount, items (dicts
+        stock_item_id, reference, libelle, quantity, unit_price,
+        first_shortage_date)
+    """
+    from app.models import MaterialAllocation, StockItem, Supplier, PurchaseOrder, PurchaseOrderItem
+
+    needs = select(
+        MaterialAllocation.stock_item_id,
+        func.sum(MaterialAllocation.required).label('required'),
+        func.min(case((MaterialAllocation.shortage > 0, MaterialAllocation.need_date))).label('first_shortage')
+    ).group_by(MaterialAllocation.stock_item_id).subquery('needs')
+
+    on_order = select(
+        PurchaseOrderItem.stock_item_id,
+        _outstanding_quantity().label('quantity')
+    ).join(PurchaseOrder, PurchaseOrderItem.purchase_order_id == PurchaseOrder.id) \
+        .where(PurchaseOrder.status.in_(OPEN_ORDER_STATUSES)) \
+        .group_by(PurchaseOrderItem.stock_item_id).subquery('on_order')
+
+    query = select(
+        StockItem.id, StockItem.reference, StockItem.libelle, StockItem.quantity,
+        StockItem.min_quantity, StockItem.price, StockItem.supplier_id, Supplier.name.label('supplier_name'),
+        needs.c.required, needs.c.first_shortage, func.coalesce(on_order.c.quantity, 0.0).label('on_order')
+    ).join(needs, needs.c.stock_item_id == StockItem.id) \
+        .outerjoin(on_order, on_order.c.stock_item_id == StockItem.id) \
+        .outerjoin(Supplier, StockItem.supplier_id == Supplier.id) \
+        .order_by(Supplier.name, StockItem.reference)
+    if supplier_ids is not None:
+        query = query.where(StockItem.supplier_id.in_(supplier_ids))
+
+    groups = {}
+    for row in db.session.execute(query):
+        projected = (row.quantity or 0.0) + (row.on_order or 0.0) - (row.required or 0.0)
+        quantity = math.ceil((row.min_quantity or 0.0) - projected)
+        if quantity <= 0:
+            continue
+        group = groups.setdefault(row.supplier_id, {
+            'supplier_id': row.supplier_id,
+            'supplier_name': row.supplier_name,
+            'total_amount': 0.0,
+            'items': []
+        })
+        group['items'].append({
+            'stock_item_id': row.id,
+            'reference': row.reference,
+            'libelle': row.libelle,
+            'quantity': quantity,
+            'unit_price': row.price or 0.0,
+            'first_shortage_date': row.first_shortage.isoformat() if row.first_shortage else None
+        })
+        group['total_amount'] += quantity * (row.price or 0.0)
+    return list(groups.values())
+
+
+def create_purchase_order_drafts(user_id, supplier_ids=None, commit=True):
+    """
+    Enregistre les propositions d'achat comme commandes en attente
+
+    Une commande par fournisseur ; les articles sans fournisseur sont
+    ignorés. Les commandes créées sont comptées comme commandes ouvertes
+    dans les propositions suivantes.
+
+    Returns:
+        list: Commandes créées
+    """
+    from app.models import PurchaseOrder, PurchaseOrderItem
+
+    now = datetime.utcnow()
+    orders = []
+    for group in purchase_suggestions(supplier_ids):
+        if group['supplier_id'] is None:
+            continue
+        order = PurchaseOrder(
+            order_number=f"MRP-{now:%Y%m%d%H%M%S}-{group['supplier_id']}",
+            supplier_id=group['supplier_id'],
+            order_date=now.date(),
+            status='pending',
+            total_amount=group['total_amount'],
+            notes=DRAFT_NOTES,
+            created_by=user_id
+        )
+        for suggestion in group['items']:
+            item = PurchaseOrderItem(
+                stock_item_id=suggestion['stock_item_id'],
+                quantity_ordered=suggestion['quantity'],
+                unit_price=suggestion['unit_price']
+            )
+            item.calculate_total()
+            order.items.append(item)
+        db.session.add(order)
+        orders.append(order)
+
+    if commit:
+        db.session.commit()
+    return orders
+
+
+# ==================== MISE À JOUR INCRÉMENTALE ====================
+# Les articles touchés par un flush sont notés (directement ou via leurs
+# tâches et commandes), puis recalculés juste avant le commit.
+
+def _pending(session):
+    return session.info.setdefault('material_plan', {'items': set(), 'tasks': set(), 'orders': set()})
+
+
+def mark_stock_items(item_ids, session=None):
+    """Signale des articles modifiés hors ORM (UPDATE en masse) au prochain commit"""
+    _pending(session or db.session)['items'].update(item_ids)
+
+
+def _history_values(obj, attribute):
+    history = inspect(obj).attrs[attribute].history
+    return [value for value in history.sum() if value is not None]
+
+
+def _changed(obj, *attributes):
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_plan_changes(session, flush_context):
+    from app.models import (Task, TaskStockItem, StockItem, StockMovement,
+                            PurchaseOrder, PurchaseOrderItem)
+
+    pending = None
+    for obj in chain(session.new, session.deleted):
+        if isinstance(obj, (TaskStockItem, StockMovement, PurchaseOrderItem)) and obj.stock_item_id:
+            pending = pending or _pending(session)
+            pending['items'].add(obj.stock_item_id)
+
+    for obj in session.dirty:
+        if isinstance(obj, TaskStockItem) and _changed(obj, 'estimated_quantity', 'additional_quantity',
+                                                       'stock_item_id', 'task_id'):
+            pending = pending or _pending(session)
+            pending['items'].update(_history_values(obj, 'stock_item_id'))
+        elif isinstance(obj, PurchaseOrderItem) and _changed(obj, 'quantity_ordered', 'quantity_received',
+                                                             'stock_item_id'):
+            pending = pending or _pending(session)
+            pending['items'].update(_history_values(obj, 'stock_item_id'))
+        elif isinstance(obj, StockItem) and _changed(obj, 'quantity', 'min_quantity', 'supplier_id'):
+            pending = pending or _pending(session)
+            pending['items'].add(obj.id)
+        elif isinstance(obj, Task) and _changed(obj, 'status', 'start_date', 'use_stock'):
+            pending = pending or _pending(session)
+            pending['tasks'].add(obj.id)
+        elif isinstance(obj, PurchaseOrder) and _changed(obj, 'status', 'delivery_date'):
+            pending = pending or _pending(session)
+            pending['orders'].add(obj.id)
+
+
+@event.listens_for(Session, 'before_commit')
+def _apply_plan_changes(session):
+    from app.models import TaskStockItem, PurchaseOrderItem
+
+    # Les changements encore en attente doivent être vus par after_flush
+    session.flush()
+    pending = session.info.pop('material_plan', None)
+    if not pending:
+        return
+
+    item_ids = set(pending['items'])
+    if pending['tasks']:
+        item_ids.update(session.execute(
+            select(TaskStockItem.stock_item_id).where(TaskStockItem.task_id.in_(pending['tasks'])).distinct()
+        ).scalars())
+    if pending['orders']:
+        item_ids.update(session.execute(
+            select(PurchaseOrderItem.stock_item_id)
+            .where(PurchaseOrderItem.purchase_order_id.in_(pending['orders'])).distinct()
+        ).scalars())
+    refresh_material_plan(item_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_plan_changes(session):
+    session.info.pop('material_plan', None)
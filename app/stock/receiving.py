@@ -0,0 +1,169 @@
+"""
+Réception des commandes d'achat
+
+Une réception porte sur une ou plusieurs commandes, avec pour chaque ligne
+la quantité effectivement livrée (par défaut le reliquat de chaque ligne).
+Les commandes et leurs lignes sont verrouillées (SELECT ... FOR UPDATE)
+avant d'être lues ; les quantités reçues et les statuts sont écrits par
+UPDATE en executemany, et les entrées en stock passent par le registre
+(app/stock/ledger.py) : un UPDATE ensembliste des articles et les
+mouvements insérés en un lot, dans la même transaction.
+
+Une commande dont toutes les lignes sont soldées passe au statut
+`delivered`, sinon `partial`. Une clé d'idempotence porte sur la
+réception demandée : un rejeu renvoie la réponse initiale.
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect, select, update
+
+from app import db
+from app.models import PurchaseOrder, PurchaseOrderItem
+from app.stock.ledger import StockLedgerError, apply_movements, replayed_response
+
+RECEIVABLE_STATUSES = ('pending', 'ordered', 'partial')
+MAX_ORDERS = 100
+
+
+class ReceiptError(StockLedgerError):
+    """Réception refusée (commande close, ligne inconnue, quantité invalide...)"""
+
+
+def _normalize(receipts):
+    """{id commande: {id ligne: quantité} ou None (tout le reliquat)}"""
+    if not isinstance(receipts, list) or not receipts:
+        raise ReceiptError('Aucune commande à réceptionner')
+    if len(receipts) > MAX_ORDERS:
+        raise ReceiptError(f'{MAX_ORDERS} commandes maximum par réception')
+
+    orders = {}
+    for position, receipt in enumerate(receipts, start=1):
+        try:
+            order_id = int(receipt['order_id'])
+            lines = receipt.get('lines')
+            if lines is not None:
+                lines = {int(line['line_id']): float(line['quantity']) for line in lines}
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ReceiptError(f'Réception {position} : commande ou lignes invalides')
+        if order_id in orders:
+            raise ReceiptError(f'Commande {order_id} présente deux fois')
+        if lines is not None and any(quantity < 0 for quantity in lines.values()):
+            raise ReceiptError(f'Réception {position} : quantité négative')
+        orders[order_id] = lines
+    return orders
+
+
+def receive_orders(receipts, user_id, idempotency_key=None):
+    """
+    Réceptionne des commandes d'achat, totalement ou partiellement
+
+    Args:
+        receipts: Liste de dicts {'order_id', 'lines': [{'line_id',
+            'quantity'}]} ; sans 'lines', tout le reliquat de la commande
+            est reçu
+        user_id: Utilisateur qui enregistre la réception
+        idempotency_key: Clé fournie par le client
+
+    Returns:
+        dict: orders (id, order_number, status), movements, quantities
+        ({id article: nouvelle quantité}), replayed
+
+    Raises:
+        ReceiptError: Commande introuvable ou close, ligne inconnue,
+            quantité supérieure au reliquat ; rien n'est enregistré
+    """
+    orders = _normalize(receipts)
+    request = {str(order_id): lines for order_id, lines in orders.items()}
+    replayed = replayed_response(user_id, idempotency_key, request)
+    if replayed is not None:
+        return replayed
+
+    headers = {row.id: row for row in db.session.execute(
+        select(PurchaseOrder.id, PurchaseOrder.order_number, PurchaseOrder.status, PurchaseOrder.supplier_id)
+        .where(PurchaseOrder.id.in_(list(orders)))
+        .order_by(PurchaseOrder.id)
+        .with_for_update()
+    )}
+    for order_id in orders:
+        if order_id not in headers:
+            raise ReceiptError(f'Commande introuvable : {order_id}')
+        if headers[order_id].status not in RECEIVABLE_STATUSES:
+            raise ReceiptError(f'Commande {headers[order_id].order_number} déjà close '
+                               f'({headers[order_id].status})')
+
+    lines = db.session.execute(
+        select(PurchaseOrderItem.id, PurchaseOrderItem.purchase_order_id, PurchaseOrderItem.stock_item_id,
+               PurchaseOrderItem.quantity_ordered, PurchaseOrderItem.quantity_received,
+               PurchaseOrderItem.unit_price)
+        .where(PurchaseOrderItem.purchase_order_id.in_(list(orders)))
+        .order_by(PurchaseOrderItem.id)
+        .with_for_update()
+    ).all()
+
+    known = {(line.purchase_order_id, line.id) for line in lines}
+    for order_id, requested in orders.items():
+        for line_id in requested or ():
+            if (order_id, line_id) not in known:
+                raise ReceiptError(f'Ligne {line_id} absente de la commande '
+                                   f'{headers[order_id].order_number}')
+
+    movements, line_updates, open_orders = [], [], set()
+    for line in lines:
+        header = headers[line.purchase_order_id]
+        requested = orders[line.purchase_order_id]
+        received = line.quantity_received or 0.0
+        outstanding = max(line.quantity_ordered - received, 0.0)
+        quantity = outstanding if requested is None else requested.get(line.id, 0.0)
+        if quantity > outstanding + 1e-9:
+            raise ReceiptError(f'Ligne {line.id} ({header.order_number}) : {quantity} reçu(s) '
+                               f'pour un reliquat de {outstanding}')
+
+        if quantity > 0:
+            if line.stock_item_id:
+                movements.append({
+                    'stock_item_id': line.stock_item_id,
+                    'movement_type': 'purchase',
+                    'quantity': quantity,
+                    'unit_price': line.unit_price,
+                    'total_price': quantity * line.unit_price,
+                    'reference': header.order_number,
+                    'notes': f'Réception commande {header.order_number}',
+                    'supplier_id': header.supplier_id
+                })
+            line_updates.append({'id': line.id, 'quantity_received': received + quantity})
+        if received + quantity < line.quantity_ordered - 1e-9:
+            open_orders.add(line.purchase_order_id)
+
+    if not line_updates:
+        raise ReceiptError('Aucune quantité à réceptionner')
+
+    today = datetime.utcnow().date()
+    statuses = {order_id: 'partial' if order_id in open_orders else 'delivered' for order_id in orders}
+    db.session.execute(update(PurchaseOrderItem), line_updates)
+    db.session.execute(update(PurchaseOrder), [
+        dict({'id': order_id, 'status': status}, **({'delivery_date': today} if status == 'delivered' else {}))
+        for order_id, status in statuses.items()
+    ])
+
+    # Les instances déjà chargées relisent statuts et quantités reçues
+    # (lus dans l'état de l'instance, sans la recharger si elle a expiré)
+    for instance in db.session.identity_map.values():
+        state = inspect(instance)
+        if isinstance(instance, PurchaseOrder) and state.identity[0] in statuses:
+            db.session.expire(instance, ['status', 'delivery_date'])
+        elif isinstance(instance, PurchaseOrderItem) and state.dict.get('purchase_order_id') in statuses:
+            db.session.expire(instance, ['quantity_received'])
+
+    summary = {'orders': [{
+        'id': order_id,
+        'order_number': headers[order_id].order_number,
+        'status': status
+    } for order_id, status in statuses.items()]}
+
+    if not movements:
+        # Lignes sans article : rien à entrer en stock
+        db.session.commit()
+        return dict(summary, movements=[], quantities={}, replayed=False)
+
+    return apply_movements(movements, user_id=user_id, idempotency_key=idempotency_key,
+                           request=request, response_fields=summary)
@@ -1,13 +1,27 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify, send_from_directory, current_app
+from flask import render_template, redirect, url_for, flash, request, jsonify, send_from_directory, current_app, \
+    Response, send_file, stream_with_context
 from flask_login import login_required, current_user
 from app.stock import bp
-from app.stock.forms import StockItemForm, SupplierForm, StockCategoryForm, StockFileForm, DynamicAttributeForm
-from app.models import StockItem, Supplier, StockCategory, StockAttribute, StockFile, Notification
+from app.stock.forms import StockItemForm, SupplierForm, StockCategoryForm, StockFileForm, DynamicAttributeForm, \
+    StockMovementForm, PurchaseOrderForm, StockImportForm
+from app.models import StockItem, Supplier, StockCategory, StockAttribute, StockFile, Notification, \
+    StockMovement, PurchaseOrder
 from app import db
 from app.decorators import permission_required
-from app.utils import save_uploaded_file, delete_uploaded_file, generate_stock_alerts, sanitize_input
+from app.alerts import check_stock_alerts
+from app.pagination import parse_limit
+from app.stock.summary import get_stock_summary
+from app.stock.analytics import get_inventory_analytics
+from app.stock.bulk import StockImportError, iter_file_rows, import_stock_items, export_csv, export_xlsx
+from app.stock.history import levels_at, level_series
+from app.stock.ledger import StockLedgerError, InsufficientStockError, apply_movements
+from app.stock.mrp import material_shortages, purchase_suggestions, create_purchase_order_drafts
+from app.stock.receiving import ReceiptError, receive_orders
+from app.typeahead import remember_recent
+from app.utils import save_uploaded_file, delete_uploaded_file, sanitize_input
+import io
 import os
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import json
 
 
@@ -49,11 +63,8 @@ def index():
     categories = StockCategory.query.all()
     suppliers = Supplier.query.all()
     
-    # Vérifier les alertes de stock
-    generate_stock_alerts()
-    
-    # Calculer la valeur totale du stock
-    total_stock_value = sum(item.value or 0 for item in StockItem.query.all())
+    # Valeur totale du stock (agrégat SQL en cache)
+    total_stock_value = get_stock_summary()['total_value']
     
     return render_template('stock/index.html',
                          title='Gestion du Stock',
@@ -83,9 +94,11 @@ def add():
     form = StockItemForm()
     
     # Remplir les choix dynamiques
-    form.item_type.choices = [(c.id, c.name) for c in StockCategory.query.all()]
-    form.supplier_id.choices = [(0, '-- Sélectionner --')] + [(s.id, s.name) for s in Supplier.query.all()]
-    form.category_id.choices = [(0, '-- Sélectionner --')] + [(c.id, c.name) for c in StockCategory.query.all()]
+    categories = StockCategory.query.with_entities(StockCategory.id, StockCategory.name).all()
+    form.item_type.choices = [(c.id, c.name) for c in categories]
+    form.supplier_id.choices = [(0, '-- Sélectionner --')] + \
+        [(s.id, s.name) for s in Supplier.query.with_entities(Supplier.id, Supplier.name)]
+    form.category_id.choices = [(0, '-- Sélectionner --')] + [(c.id, c.name) for c in categories]
     
     if form.validate_on_submit():
         # Nettoyer les entrées
@@ -121,6 +134,7 @@ def add():
         
         db.session.add(item)
         db.session.commit()
+        check_stock_alerts([item.id])
         
         flash(f'Élément {reference} ajouté avec succès!', 'success')
         return redirect(url_for('stock.view', item_id=item.id))
@@ -147,7 +161,6 @@ def edit(item_id):
         item.reference = sanitize_input(form.reference.data)
         item.libelle = sanitize_input(form.libelle.data)
         item.item_type = form.item_type.data
-        item.quantity = form.quantity.data
         item.min_quantity = form.min_quantity.data
         item.price = form.price.data
         item.location = sanitize_input(form.location.data) if form.location.data else None
@@ -163,11 +176,27 @@ def edit(item_id):
         else:
             item.category_id = None
         
+        # Nouvelle quantité enregistrée comme correction dans le registre
+        delta = (form.quantity.data or 0) - (item.quantity or 0)
+        if delta:
+            try:
+                apply_movements([{
+                    'stock_item_id': item.id,
+                    'movement_type': 'correction',
+                    'quantity': delta,
+                    'notes': 'Modification de la fiche article'
+                }], user_id=current_user.id, commit=False, internal=True)
+            except StockLedgerError as e:
+                db.session.rollback()
+                flash(str(e), 'danger')
+                return redirect(url_for('stock.edit', item_id=item_id))
+        
         # Recalculer la valeur
         item.calculate_value()
         item.updated_at = datetime.utcnow()
         
         db.session.commit()
+        check_stock_alerts([item.id])
         
         flash(f'Élément {item.reference} mis à jour avec succès!', 'success')
         return redirect(url_for('stock.view', item_id=item.id))
@@ -340,51 +369,35 @@ def add_movement(item_id):
     
     # Remplir les choix dynamiques
     form.supplier_id.choices = [(0, '-- Aucun --')] + [(s.id, s.name) for s in Supplier.query.all()]
-    form.task_id.choices = [(0, '-- Aucun --')] + [(t.id, f"{t.name} (Projet: {t.project.name})") 
-                                                   for t in Task.query.all()]
-    form.project_id.choices = [(0, '-- Aucun --')] + [(p.id, p.name) for p in Project.query.all()]
     
     if form.validate_on_submit():
-        movement = StockMovement(
-            stock_item_id=item_id,
-            movement_type=form.movement_type.data,
-            quantity=form.quantity.data,
-            unit_price=form.unit_price.data or item.price,
-            total_price=(form.quantity.data * (form.unit_price.data or item.price)),
-            reference=sanitize_input(form.reference.data) if form.reference.data else None,
-            notes=sanitize_input(form.notes.data) if form.notes.data else None,
-            recorded_by=current_user.id,
-            movement_date=datetime.utcnow()
-        )
-        
-        if form.supplier_id.data and form.supplier_id.data > 0:
-            movement.supplier_id = form.supplier_id.data
-        
-        if form.task_id.data and form.task_id.data > 0:
-            movement.task_id = form.task_id.data
-        
-        if form.project_id.data and form.project_id.data > 0:
-            movement.project_id = form.project_id.data
-        
-        # Mettre à jour la quantité du stock
-        if form.movement_type.data in ['purchase', 'return']:
-            item.quantity += form.quantity.data
-        elif form.movement_type.data in ['sale', 'waste']:
-            if item.quantity >= form.quantity.data:
-                item.quantity -= form.quantity.data
-            else:
-                flash('Quantité insuffisante en stock!', 'danger')
-                return redirect(url_for('stock.add_movement', item_id=item_id))
-        
-        item.calculate_value()
-        item.updated_at = datetime.utcnow()
-        
-        db.session.add(movement)
-        db.session.commit()
-        
-        # Générer une notification si le stock est bas
-        if item.check_alert():
-            generate_stock_alerts()
+        movement = {
+            'stock_item_id': item_id,
+            'movement_type': form.movement_type.data,
+            'quantity': form.quantity.data,
+            'unit_price': form.unit_price.data or item.price,
+            'reference': sanitize_input(form.reference.data) if form.reference.data else None,
+            'notes': sanitize_input(form.notes.data) if form.notes.data else None,
+            'supplier_id': form.supplier_id.data or None,
+            'task_id': form.task_id.data,
+            'project_id': form.project_id.data
+        }
+        
+        # Mise à jour atomique de la quantité (sortie refusée si stock insuffisant)
+        try:
+            apply_movements([movement], user_id=current_user.id,
+                            idempotency_key=form.idempotency_key.data)
+        except InsufficientStockError:
+            db.session.rollback()
+            flash('Quantité insuffisante en stock!', 'danger')
+            return redirect(url_for('stock.add_movement', item_id=item_id))
+        except StockLedgerError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('stock.add_movement', item_id=item_id))
+        
+        remember_recent(current_user.id, 'task', [form.task_id.data], commit=False)
+        remember_recent(current_user.id, 'project', [form.project_id.data])
         
         flash(f'Mouvement enregistré! Nouvelle quantité: {item.quantity}', 'success')
         return redirect(url_for('stock.view', item_id=item_id))
@@ -462,91 +475,100 @@ def view_purchase_order(order_id):
 @login_required
 @permission_required('stock', 'update')
 def receive_purchase_order(order_id):
-    """Réceptionner une commande d'achat"""
+    """Réceptionner le reliquat d'une commande d'achat"""
     order = PurchaseOrder.query.get_or_404(order_id)
     
-    for item in order.items:
-        if item.quantity_received < item.quantity_ordered:
-            # Créer un mouvement de stock pour chaque article
-            movement = StockMovement(
-                stock_item_id=item.stock_item_id,
-                movement_type='purchase',
-                quantity=item.quantity_ordered - item.quantity_received,
-                unit_price=item.unit_price,
-                total_price=item.total_price,
-                reference=order.order_number,
-                notes=f'Réception commande {order.order_number}',
-                recorded_by=current_user.id,
-                supplier_id=order.supplier_id
-            )
-            
-            # Mettre à jour le stock
-            stock_item = item.stock_item
-            stock_item.quantity += (item.quantity_ordered - item.quantity_received)
-            stock_item.calculate_value()
-            
-            # Marquer comme reçu
-            item.quantity_received = item.quantity_ordered
-            
-            db.session.add(movement)
-    
-    order.status = 'delivered'
-    order.delivery_date = datetime.utcnow().date()
-    db.session.commit()
+    try:
+        receive_orders([{'order_id': order_id}], current_user.id)
+    except ReceiptError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+        return redirect(url_for('stock.view_purchase_order', order_id=order_id))
     
     flash(f'Commande {order.order_number} marquée comme livrée!', 'success')
     return redirect(url_for('stock.view_purchase_order', order_id=order_id))
 
 
+@bp.route('/api/purchase-orders/receive', methods=['POST'])
+@login_required
+@permission_required('stock', 'update')
+def receive_purchase_orders():
+    """API: réception d'une ou plusieurs commandes, éventuellement partielle
+    
+    Corps JSON : {"orders": [{"order_id": 1, "lines": [{"line_id": 3,
+    "quantity": 2}]}], "idempotency_key": "..."} (ou en-tête
+    Idempotency-Key). Sans "lines", tout le reliquat de la commande est reçu.
+    Renvoie le statut des commandes et les nouvelles quantités en stock.
+    """
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        result = receive_orders(data.get('orders'), current_user.id,
+                                idempotency_key=_idempotency_key(data))
+    except StockLedgerError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify(dict(result, success=True))
+
+
+def _idempotency_key(data):
+    """Clé d'idempotence : en-tête Idempotency-Key ou champ JSON"""
+    return request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+
+
 @bp.route('/api/quick-movement', methods=['POST'])
 @login_required
 @permission_required('stock', 'update')
 def quick_movement():
     """API pour les mouvements rapides (AJAX)"""
-    data = request.get_json()
-    
-    item = StockItem.query.get(data['item_id'])
-    if not item:
-        return jsonify({'success': False, 'message': 'Article non trouvé'})
+    data = request.get_json(silent=True) or {}
     
     try:
-        quantity = float(data['quantity'])
-        movement_type = data.get('type', 'purchase')
-        
-        movement = StockMovement(
-            stock_item_id=item.id,
-            movement_type=movement_type,
-            quantity=quantity,
-            unit_price=item.price,
-            total_price=quantity * item.price,
-            notes=data.get('reason', 'Mouvement rapide'),
-            recorded_by=current_user.id
-        )
-        
-        # Mettre à jour le stock
-        if movement_type in ['purchase', 'return']:
-            item.quantity += quantity
-        elif movement_type in ['sale', 'waste']:
-            if item.quantity >= quantity:
-                item.quantity -= quantity
-            else:
-                return jsonify({'success': False, 'message': 'Quantité insuffisante'})
-        
-        item.calculate_value()
-        
-        db.session.add(movement)
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'new_quantity': item.quantity,
-            'message': f'Stock mis à jour: {item.quantity}'
-        })
-        
-    except Exception as e:
+        result = apply_movements([{
+            'stock_item_id': data.get('item_id'),
+            'movement_type': data.get('type', 'purchase'),
+            'quantity': data.get('quantity'),
+            'notes': data.get('reason', 'Mouvement rapide')
+        }], user_id=current_user.id, idempotency_key=_idempotency_key(data))
+    except InsufficientStockError:
+        return jsonify({'success': False, 'message': 'Quantité insuffisante'})
+    except StockLedgerError as e:
         return jsonify({'success': False, 'message': str(e)})
+    
+    new_quantity = next(iter(result['quantities'].values()))
+    return jsonify({
+        'success': True,
+        'new_quantity': new_quantity,
+        'replayed': result['replayed'],
+        'message': f'Stock mis à jour: {new_quantity}'
+    })
 
 
+@bp.route('/api/movements', methods=['POST'])
+@login_required
+@permission_required('stock', 'update')
+def batch_movements():
+    """API: applique un lot de mouvements dans une seule transaction
+    
+    Corps JSON : {"movements": [{"stock_item_id", "movement_type", "quantity",
+    ...}], "idempotency_key": "..."} (ou en-tête Idempotency-Key).
+    Tout ou rien : une sortie en stock insuffisant annule le lot (409).
+    """
+    data = request.get_json(silent=True) or {}
+    movements = data.get('movements')
+    if not isinstance(movements, list) or not all(isinstance(m, dict) for m in movements):
+        return jsonify({'success': False, 'error': 'Liste de mouvements attendue'}), 400
+    
+    try:
+        result = apply_movements(movements, user_id=current_user.id,
+                                 idempotency_key=_idempotency_key(data))
+    except InsufficientStockError as e:
+        return jsonify({'success': False, 'error': str(e), 'insufficient_items': e.shortages}), 409
+    except StockLedgerError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify(dict(result, success=True))
 
 @bp.route('/categories')
 @login_required
@@ -696,9 +718,6 @@ def download_file(file_id):
 @permission_required('stock', 'read')
 def alerts():
     """Alertes de stock bas"""
-    # Générer les alertes
-    generate_stock_alerts()
-    
     # Récupérer les éléments avec stock bas
     alert_items = StockItem.query.filter(
         StockItem.quantity <= StockItem.min_quantity,
@@ -731,6 +750,70 @@ def check_alerts():
     
     return jsonify({'alerts': alerts, 'count': len(alerts)})
 
+@bp.route('/api/summary', methods=['GET'])
+@login_required
+@permission_required('stock', 'read')
+def summary():
+    """API de synthèse du stock (valeur, nombre d'articles, alertes, répartitions)"""
+    include_breakdown = request.args.get('breakdown', '1') != '0'
+    return jsonify(get_stock_summary(include_breakdown=include_breakdown))
+
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+@permission_required('stock', 'create')
+def import_items():
+    """Import en masse des éléments du stock (CSV / XLSX)"""
+    form = StockImportForm()
+    report = None
+    
+    if form.validate_on_submit():
+        upload = form.file.data
+        try:
+            report = import_stock_items(
+                iter_file_rows(upload.stream, upload.filename),
+                dry_run=form.dry_run.data,
+                update_existing=form.update_existing.data,
+                user_id=current_user.id
+            )
+        except StockImportError as e:
+            flash(str(e), 'danger')
+        else:
+            if report.aborted and not report.dry_run:
+                flash(f'{report.aborted}. Déjà enregistré : {report.created} création(s), '
+                      f'{report.updated} mise(s) à jour.', 'danger')
+            elif report.aborted:
+                flash(report.aborted, 'danger')
+            elif report.dry_run:
+                flash(f'Simulation : {report.created} création(s), {report.updated} mise(s) à jour, '
+                      f'{report.error_count} erreur(s).', 'info')
+            else:
+                flash(f'Import terminé : {report.created} création(s), {report.updated} mise(s) à jour, '
+                      f'{report.error_count} ligne(s) ignorée(s).',
+                      'success' if not report.error_count else 'warning')
+    
+    return render_template('stock/import.html',
+                         title='Importer le stock',
+                         form=form,
+                         report=report)
+
+@bp.route('/export')
+@login_required
+@permission_required('stock', 'read')
+def export_items():
+    """Export du stock (CSV en flux, ou XLSX)"""
+    filename = f"stock_{datetime.now().strftime('%Y%m%d_%H%M')}"
+    
+    if request.args.get('format') == 'xlsx':
+        buffer = io.BytesIO()
+        export_xlsx(buffer)
+        buffer.seek(0)
+        return send_file(buffer, as_attachment=True, download_name=f'{filename}.xlsx',
+                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    
+    return Response(stream_with_context(export_csv()),
+                    mimetype='text/csv; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename={filename}.csv'})
+
 @bp.route('/api/stock-levels', methods=['GET'])
 @login_required
 def stock_levels():
@@ -751,6 +834,114 @@ def stock_levels():
     
     return jsonify(data)
 
+@bp.route('/api/history/at', methods=['GET'])
+@login_required
+@permission_required('stock', 'read')
+def history_at():
+    """API: niveau du stock à un instant (?at=ISO, item_id répétable, detail=1)
+
+    Sans item_id, seuls les totaux sont renvoyés, sauf avec detail=1.
+    """
+    try:
+        at = datetime.fromisoformat(request.args['at']) if request.args.get('at') else datetime.utcnow()
+    except ValueError:
+        return jsonify({'error': 'Date invalide (format ISO attendu)'}), 400
+    item_ids = request.args.getlist('item_id', type=int) or None
+
+    levels = levels_at(at, item_ids)
+    data = {
+        'at': at.isoformat(),
+        'totals': {
+            'items': len(levels),
+            'value': round(sum(level['value'] for level in levels.values()), 2)
+        }
+    }
+    if item_ids or request.args.get('detail') == '1':
+        data['items'] = [dict(level, stock_item_id=item_id) for item_id, level in sorted(levels.items())]
+    return jsonify(data)
+
+@bp.route('/api/history/range', methods=['GET'])
+@login_required
+@permission_required('stock', 'read')
+def history_range():
+    """API: clôtures journalières sur une période (?start, end, item_id) pour graphiques"""
+    today = datetime.utcnow().date()
+    try:
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else today
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') \
+            else end - timedelta(days=29)
+        series = level_series(start, end, request.args.get('item_id', type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    datasets = [{'label': 'Valeur du stock (€)', 'data': [point['value'] for point in series]}]
+    if request.args.get('item_id'):
+        datasets.insert(0, {'label': 'Quantité', 'data': [point['quantity'] for point in series]})
+    return jsonify({'labels': [point['date'] for point in series], 'datasets': datasets})
+
+@bp.route('/api/analytics', methods=['GET'])
+@login_required
+@permission_required('stock', 'read')
+def analytics_api():
+    """API: analyse du jour (classes ABC, rotation, couverture, points de commande)
+
+    Filtres : abc=A|B|C, below_reorder=1 (quantité sous le point suggéré),
+    limit. Articles triés par valeur consommée décroissante.
+    """
+    analytics = get_inventory_analytics(refresh=request.args.get('refresh') == '1'
+                                        and current_user.has_permission('stock', 'update'))
+    items = analytics['items']
+    abc = request.args.get('abc', '').upper()
+    if abc:
+        items = [item for item in items if item['abc'] == abc]
+    if request.args.get('below_reorder') == '1':
+        items = [item for item in items if item['quantity'] < item['reorder_point']]
+    items = sorted(items, key=lambda item: -item['usage_value'])
+    limit = parse_limit(request.args.get('limit'), 100, maximum=1000)
+    
+    return jsonify(dict(analytics, items=items[:limit], total_items=len(items)))
+
+@bp.route('/api/mrp', methods=['GET'])
+@login_required
+@permission_required('stock', 'read')
+def mrp_api():
+    """API: calcul des besoins (tâches en manque par date, propositions d'achat)
+
+    Filtres : task_id et item_id (répétables), limit (tâches en manque).
+    """
+    task_ids = request.args.getlist('task_id', type=int) or None
+    item_ids = request.args.getlist('item_id', type=int) or None
+    limit = parse_limit(request.args.get('limit'), 100, maximum=1000)
+    
+    return jsonify({
+        'shortages': material_shortages(task_ids=task_ids, item_ids=item_ids, limit=limit),
+        'suggestions': purchase_suggestions()
+    })
+
+@bp.route('/api/mrp/drafts', methods=['POST'])
+@login_required
+@permission_required('stock', 'create')
+def mrp_drafts():
+    """API: enregistre les propositions d'achat comme commandes en attente
+
+    Corps JSON optionnel : {"supplier_ids": [...]} pour limiter les fournisseurs.
+    """
+    data = request.get_json(silent=True) or {}
+    supplier_ids = data.get('supplier_ids')
+    if supplier_ids is not None and not (isinstance(supplier_ids, list)
+                                         and all(isinstance(i, int) for i in supplier_ids)):
+        return jsonify({'success': False, 'error': 'Liste de fournisseurs invalide'}), 400
+    
+    orders = create_purchase_order_drafts(current_user.id, supplier_ids)
+    
+    return jsonify({'success': True, 'orders': [{
+        'id': order.id,
+        'order_number': order.order_number,
+        'supplier_id': order.supplier_id,
+        'total_amount': order.total_amount,
+        'url': url_for('stock.view_purchase_order', order_id=order.id)
+    } for order in orders]})
+
 @bp.route('/api/category-distribution', methods=['GET'])
 @login_required
 def category_distribution():
@@ -0,0 +1,103 @@
+"""
+Synthèse du stock calculée par agrégats SQL
+
+Valeur totale, nombre d'articles, nombre d'alertes et répartitions par
+catégorie / fournisseur. Les résultats sont mis en cache et indexés par la
+version des tables concernées : tout commit modifiant le stock produit une
+nouvelle clé, les lectures suivantes restent en O(1) jusqu'à la prochaine
+écriture. Ces versions sont propres au processus : une écriture faite par
+un autre worker n'est visible qu'à l'expiration de l'entrée
+(STOCK_SUMMARY_TTL, 30 s comme les compteurs de la barre de navigation).
+"""
+from flask import current_app
+from sqlalchemy import case, func, select
+
+from app import db
+from app.cache import TTLCache, get_data_version
+
+SUMMARY_TABLES = ('stock_item', 'stock_category', 'supplier')
+
+_cache = TTLCache(ttl=30, maxsize=16)
+
+
+def _ttl():
+    return current_app.config.get('STOCK_SUMMARY_TTL', 30)
+
+
+def _compute_totals():
+    from app.models import StockItem
+    from app.counters import stock_alert_condition
+
+    row = db.session.execute(
+        select(
+            func.coalesce(func.sum(StockItem.value), 0).label('total_value'),
+            func.count(StockItem.id).label('item_count'),
+            func.coalesce(func.sum(case((stock_alert_condition(), 1), else_=0)), 0).label('alert_count')
+        )
+    ).one()
+    return {
+        'total_value': float(row.total_value or 0),
+        'item_count': int(row.item_count or 0),
+        'alert_count': int(row.alert_count or 0)
+    }
+
+
+def _compute_breakdown(group_model, foreign_key):
+    """Nombre d'articles et valeur groupés par catégorie ou fournisseur"""
+    from app.models import StockItem
+
+    rows = db.session.execute(
+        select(
+            foreign_key.label('id'),
+            group_model.name.label('name'),
+            func.count(StockItem.id).label('item_count'),
+            func.coalesce(func.sum(StockItem.value), 0).label('total_value')
+        )
+        .select_from(StockItem)
+        .outerjoin(group_model, foreign_key == group_model.id)
+        .group_by(foreign_key, group_model.name)
+        .order_by(func.coalesce(func.sum(StockItem.value), 0).desc())
+    ).all()
+    return [
+        {
+            'id': row.id,
+            'name': row.name or 'Non classé',
+            'item_count': int(row.item_count),
+            'total_value': float(row.total_value or 0)
+        }
+        for row in rows
+    ]
+
+
+def get_stock_summary(include_breakdown=False):
+    """
+    Retourne la synthèse du stock
+
+    Args:
+        include_breakdown: Ajouter les répartitions 'by_category' et
+            'by_supplier' (deux requêtes groupées supplémentaires)
+
+    Returns:
+        dict: total_value, item_count, alert_count [, by_category, by_supplier]
+    """
+    from app.models import StockItem, StockCategory, Supplier
+
+    version = get_data_version(*SUMMARY_TABLES)
+
+    totals_key = ('totals', version)
+    summary = _cache.get(totals_key)
+    if summary is None:
+        summary = _cache.set(totals_key, _compute_totals(), _ttl())
+
+    if not include_breakdown:
+        return dict(summary)
+
+    breakdown_key = ('breakdown', version)
+    breakdown = _cache.get(breakdown_key)
+    if breakdown is None:
+        breakdown = _cache.set(breakdown_key, {
+            'by_category': _compute_breakdown(StockCategory, StockItem.category_id),
+            'by_supplier': _compute_breakdown(Supplier, StockItem.supplier_id)
+        }, _ttl())
+
+    return dict(summary, **breakdown)
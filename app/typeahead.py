@@ -0,0 +1,223 @@
+"""
+Autocomplétion des sélecteurs (stock, tâches, personnel, projets)
+
+Les listes déroulantes ne préchargent plus la table entière : le navigateur
+interroge /api/typeahead/<source> au fil de la saisie. La recherche est une
+lecture par préfixe (colonne LIKE 'abc%') sur des colonnes indexées, paginée
+par clé. En première page, les éléments récemment choisis par l'utilisateur
+et correspondant à la saisie sont placés en tête.
+
+Les formulaires valident l'identifiant soumis par une requête d'existence
+(voir TypeaheadSelectField dans app/forms.py).
+"""
+from datetime import datetime
+
+from sqlalchemy import delete, insert, or_, select
+
+from app import db
+from app.models import StockItem, Task, Project, Personnel, RecentItem
+from app.pagination import decode_cursor, encode_cursor, keyset_condition
+
+RECENT_ON_FIRST_PAGE = 5
+MAX_RECENT_PER_SOURCE = 20
+
+
+class TypeaheadSource:
+    """
+    Source d'autocomplétion
+
+    Args:
+        name: Identifiant de la source (URL et recent_item.entity_type)
+        model: Modèle interrogé
+        match: Colonnes comparées par préfixe à la saisie
+        order: Colonne de tri (la clé primaire départage les ex aequo)
+        module: Module de permissions requis en lecture
+        columns: Fonction retournant les colonnes chargées
+        describe: Fonction (ligne) -> (libellé, complément)
+        where: Fonction optionnelle retournant un filtre permanent
+    """
+
+    def __init__(self, name, model, match, order, module, columns, describe, where=None):
+        self.name = name
+        self.model = model
+        self.match = match
+        self.order = order
+        self.module = module
+        self.columns = columns
+        self.describe = describe
+        self.where = where
+
+    def base_query(self):
+        query = select(*self.columns())
+        if self.where is not None:
+            query = query.where(self.where())
+        return query
+
+    def item(self, row, recent=False):
+        label, sublabel = self.describe(row)
+        return {'id': row.id, 'label': label, 'sublabel': sublabel, 'recent': recent}
+
+
+def _task_columns():
+    return (Task.id, Task.name, Task.status,
+            select(Project.name).where(Project.id == Task.project_id)
+            .correlate(Task).scalar_subquery().label('project_name'))
+
+
+TYPEAHEAD_SOURCES = {
+    source.name: source for source in (
+        TypeaheadSource(
+            'stock', StockItem, (StockItem.reference, StockItem.libelle), StockItem.reference, 'stock',
+            lambda: (StockItem.id, StockItem.reference, StockItem.libelle, StockItem.quantity, StockItem.unit),
+            lambda row: (f'{row.reference} - {row.libelle}', f'Stock: {row.quantity or 0:g} {row.unit or ""}'.strip())
+        ),
+        TypeaheadSource(
+            'task', Task, (Task.name,), Task.name, 'projects',
+            _task_columns,
+            lambda row: (row.name, f'Projet: {row.project_name}' if row.project_name else None)
+        ),
+        TypeaheadSource(
+            'project', Project, (Project.name,), Project.name, 'projects',
+            lambda: (Project.id, Project.name, Project.status),
+            lambda row: (row.name, None)
+        ),
+        TypeaheadSource(
+            'personnel', Personnel,
+            (Personnel.last_name, Personnel.first_name, Personnel.employee_id), Personnel.last_name, 'personnel',
+            lambda: (Personnel.id, Personnel.first_name, Personnel.last_name, Personnel.employee_id),
+            lambda row: (f'{row.first_name} {row.last_name}', row.employee_id),
+            where=lambda: Personnel.is_active == True
+        ),
+    )
+}
+
+
+def get_source(name):
+    return TYPEAHEAD_SOURCES.get(name)
+
+
+def prefix_pattern(text):
+    """Motif LIKE 'texte%' (caractères spéciaux échappés par '\\')"""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+def _recent_ids(source, user_id):
+    return db.session.execute(
+        select(RecentItem.entity_id)
+        .where(RecentItem.user_id == user_id, RecentItem.entity_type == source.name)
+        .order_by(RecentItem.used_at.desc(), RecentItem.id.desc())
+        .limit(MAX_RECENT_PER_SOURCE)
+    ).scalars().all()
+
+
+def lookup(source, text='', user_id=None, cursor=None, limit=20):
+    """
+    Recherche par préfixe, paginée par clé
+
+    Args:
+        source: TypeaheadSource
+        text: Saisie (préfixe) ; vide pour parcourir la liste
+        user_id: Utilisateur dont les éléments récents sont mis en tête
+        cursor: Curseur renvoyé par la page précédente
+        limit: Taille de page
+
+    Returns:
+        dict: items (id, label, sublabel, recent), next_cursor
+
+    Raises:
+        ValueError: Curseur invalide
+    """
+    model = source.model
+    query = source.base_query()
+    text = (text or '').strip()
+    if text:
+        pattern = prefix_pattern(text)
+        query = query.where(or_(*[column.like(pattern, escape='\\') for column in source.match]))
+
+    # Éléments récents correspondant à la saisie : en tête de la première
+    # page, exclus de la liste alphabétique sur toutes les pages
+    recent = []
+    recent_ids = _recent_ids(source, user_id) if user_id else []
+    if recent_ids:
+        rows = {row.id: row for row in db.session.execute(
+            query.where(model.id.in_(recent_ids))
+        ).all()}
+        recent = [source.item(rows[i], recent=True) for i in recent_ids if i in rows]
+        recent = recent[:min(RECENT_ON_FIRST_PAGE, limit - 1)]
+        if recent:
+            query = query.where(model.id.notin_([item['id'] for item in recent]))
+        if cursor:
+            recent = []
+
+    if cursor:
+        key, last_id = decode_cursor(cursor, str, int)
+        query = query.where(keyset_condition([source.order, model.id], [key, last_id], descending=False))
+
+    page_size = limit - len(recent)
+    rows = db.session.execute(
+        query.add_columns(source.order.label('_order_key'))
+        .order_by(source.order, model.id)
+        .limit(page_size + 1)
+    ).all()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor([rows[-1]._order_key or '', rows[-1].id])
+
+    return {'items': recent + [source.item(row) for row in rows], 'next_cursor': next_cursor}
+
+
+def labels_for(source_name, ids):
+    """[(id, libellé)] des identifiants donnés, dans leur ordre"""
+    source = TYPEAHEAD_SOURCES[source_name]
+    ids = [i for i in ids if i]
+    if not ids:
+        return []
+    rows = {row.id: row for row in db.session.execute(
+        select(*source.columns()).where(source.model.id.in_(ids))
+    ).all()}
+    return [(i, source.describe(rows[i])[0]) for i in ids if i in rows]
+
+
+def existing_ids(source_name, ids):
+    """Sous-ensemble des identifiants qui existent en base"""
+    source = TYPEAHEAD_SOURCES[source_name]
+    ids = {i for i in ids if i}
+    if not ids:
+        return set()
+    return set(db.session.execute(
+        select(source.model.id).where(source.model.id.in_(ids))
+    ).scalars())
+
+
+def remember_recent(user_id, source_name, ids, commit=True):
+    """
+    Enregistre les éléments choisis par l'utilisateur
+
+    Les plus anciens au-delà de MAX_RECENT_PER_SOURCE sont supprimés.
+    """
+    ids = list(dict.fromkeys(i for i in ids if i))
+    if not user_id or not ids:
+        return
+    scope = (RecentItem.user_id == user_id, RecentItem.entity_type == source_name)
+    now = datetime.utcnow()
+
+    db.session.execute(delete(RecentItem).where(*scope, RecentItem.entity_id.in_(ids)))
+    db.session.execute(insert(RecentItem), [
+        {'user_id': user_id, 'entity_type': source_name, 'entity_id': i, 'used_at': now}
+        for i in ids
+    ])
+
+    # Les lignes d'un même appel partagent used_at : l'identifiant départage
+    kept = db.session.execute(
+        select(RecentItem.id).where(*scope)
+        .order_by(RecentItem.used_at.desc(), RecentItem.id.desc())
+        .limit(MAX_RECENT_PER_SOURCE)
+    ).scalars().all()
+    db.session.execute(delete(RecentItem).where(*scope, RecentItem.id.not_in(kept)))
+
+    if commit:
+        db.session.commit()
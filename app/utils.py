@@ -204,49 +204,15 @@ def format_currency(value, currency='€'):
 
 def get_notifications_count():
     """Retourne le nombre de notifications non lues pour l'utilisateur courant"""
-    from app.models import Notification
+    from app.counters import get_navbar_counters
     if current_user.is_authenticated:
-        return Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
+        return get_navbar_counters(current_user.id)['unread_notifications']
     return 0
 
-def generate_stock_alerts():
-    """Génère des alertes pour le stock bas"""
-    from app.models import StockItem, Notification, User
-    from app import db
-    
-    alert_items = StockItem.query.filter(
-        StockItem.quantity <= StockItem.min_quantity,
-        StockItem.min_quantity > 0
-    ).all()
-    
-    # Trouver les administrateurs
-    admins = User.query.join(User.role).filter_by(name='admin').all()
-    
-    alerts_created = 0
-    for item in alert_items:
-        for admin in admins:
-            # Vérifier si une notification existe déjà
-            existing = Notification.query.filter_by(
-                user_id=admin.id,
-                stock_item_id=item.id,
-                is_read=False
-            ).first()
-            
-            if not existing:
-                notification = Notification(
-                    user_id=admin.id,
-                    stock_item_id=item.id,
-                    title='Alerte Stock Bas',
-                    message=f'La quantité de {item.libelle} ({item.reference}) est basse: {item.quantity}/{item.min_quantity}',
-                    notification_type='stock_alert'
-                )
-                db.session.add(notification)
-                alerts_created += 1
-    
-    if alerts_created > 0:
-        db.session.commit()
-    
-    return alerts_created
+def generate_stock_alerts(item_ids=None):
+    """Génère des alertes pour le stock bas (tout le stock si item_ids est None)"""
+    from app.alerts import check_stock_alerts
+    return check_stock_alerts(item_ids)
 
 def check_stock_availability(task_items):
     """
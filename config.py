@@ -26,8 +26,9 @@ class Config:
             'read_timeout': 20,       # 20 second read timeout
             'write_timeout': 20,      # 20 second write timeout
             'charset': 'utf8mb4',
-            'use_unicode': True,
-            'autocommit': True        # Auto-commit for better reliability
+            'use_unicode': True
+            # Pas d'autocommit côté pilote : les transactions de la session
+            # (lots de mouvements de stock, rollback) doivent être réelles
         }
     }
     
@@ -61,7 +62,28 @@ class Config:
     
     # Application settings
     ITEMS_PER_PAGE = 20
+    LIST_COUNT_CAP = 10000  # count=approx de /api/list : comptage arrêté au-delà
     DASHBOARD_CHARTS_LIMIT = 6
+    CHART_DATA_TTL = 300  # secondes (invalidé à chaque écriture sur les tables sources)
+    DASHBOARD_STATS_TTL = 60  # secondes (invalidé à chaque écriture sur les tables sources)
+    NAVBAR_COUNTERS_TTL = 30  # secondes
+    STOCK_SUMMARY_TTL = 30  # secondes (invalidé par les écritures du même processus seulement)
+    TEMPLATES_AUTO_RELOAD = False  # activé en développement seulement
+    TEMPLATE_CACHE_SIZE = 400  # templates compilés gardés en mémoire (LRU)
+    TEMPLATE_BYTECODE_CACHE = True  # bytecode des templates conservé sur disque
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR')  # défaut : dossier temporaire
+    CALENDAR_FEED_TTL = 30  # secondes (invalidé par les écritures du même processus seulement)
+    STOCK_ANALYTICS_WINDOW_DAYS = 90  # historique de consommation analysé
+    STOCK_LEAD_TIME_DAYS = 14  # délai de réapprovisionnement pour les points de commande
+    STOCK_SERVICE_LEVEL_Z = 1.65  # facteur de sécurité (≈ 95 % de taux de service)
+    JOB_QUEUE_EAGER = False  # True : tâches de fond exécutées immédiatement (sans worker)
+    JOB_MAX_ATTEMPTS = 5
+    JOB_RETRY_BASE_SECONDS = 30  # délai doublé à chaque nouvelle tentative
+    JOB_RETRY_MAX_SECONDS = 3600
+    JOB_LOCK_TIMEOUT = 600  # secondes avant de libérer une tâche d'un worker arrêté
+    NOTIFICATION_DIGEST_MINUTES = 15  # regroupement des notifications envoyées par email
+    NOTIFICATION_EMAIL_TYPES = ('stock_alert', 'stock_shortage', 'additional_request')
+    NOTIFICATION_RETENTION_DAYS = 90  # notifications lues archivées au-delà (flask archive-notifications)
     APP_NAME = 'Invento'
     APP_VERSION = '1.0.0'
     
@@ -85,6 +107,8 @@ class Config:
 class DevelopmentConfig(Config):
     DEBUG = True
     SQLALCHEMY_ECHO = False
+    TEMPLATES_AUTO_RELOAD = True
+    TEMPLATE_BYTECODE_CACHE = False
 
 class ProductionConfig(Config):
     DEBUG = False
@@ -105,6 +129,8 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
     SQLALCHEMY_ENGINE_OPTIONS = {}
+    JOB_QUEUE_EAGER = True
+    TEMPLATE_BYTECODE_CACHE = False
 
 config = {
     'development': DevelopmentConfig,
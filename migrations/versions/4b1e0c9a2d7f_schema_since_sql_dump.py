@@ -0,0 +1,164 @@
+"""Tables et colonnes ajoutées depuis invento_db.sql
+
+Première révision : les bases existantes ont été créées par invento_db.sql,
+fix_db.py ou db.create_all(). Chaque table et colonne n'est créée que si
+elle est absente, la révision s'applique donc aussi bien à une base à jour.
+
+Revision ID: 4b1e0c9a2d7f
+Revises:
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1e0c9a2d7f'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _has_column(table, column):
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    if not _has_column('notification', 'emailed_at'):
+        op.add_column('notification', sa.Column('emailed_at', sa.DateTime(), nullable=True))
+    if not _has_column('task_stock_item', 'version'):
+        op.add_column('task_stock_item', sa.Column('version', sa.Integer(), nullable=False,
+                                                   server_default='1'))
+
+    if not _has_table('stock_snapshot'):
+        op.create_table(
+            'stock_snapshot',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('stock_item_id', sa.Integer(), nullable=False),
+            sa.Column('snapshot_date', sa.Date(), nullable=False),
+            sa.Column('taken_at', sa.DateTime(), nullable=False),
+            sa.Column('quantity', sa.Float(), nullable=False),
+            sa.Column('price', sa.Float(), nullable=False),
+            sa.Column('value', sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(['stock_item_id'], ['stock_item.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('stock_item_id', 'snapshot_date', name='uq_stock_snapshot_item_date')
+        )
+        op.create_index('ix_stock_snapshot_snapshot_date', 'stock_snapshot', ['snapshot_date'])
+        op.create_index('ix_stock_snapshot_taken_at', 'stock_snapshot', ['taken_at'])
+
+    if not _has_table('stock_request'):
+        op.create_table(
+            'stock_request',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('idempotency_key', sa.String(length=64), nullable=False),
+            sa.Column('request_hash', sa.String(length=64), nullable=False),
+            sa.Column('response', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'idempotency_key', name='uq_stock_request_key')
+        )
+        op.create_index('ix_stock_request_created_at', 'stock_request', ['created_at'])
+
+    if not _has_table('material_allocation'):
+        op.create_table(
+            'material_allocation',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('stock_item_id', sa.Integer(), nullable=False),
+            sa.Column('task_id', sa.Integer(), nullable=False),
+            sa.Column('need_date', sa.Date(), nullable=False),
+            sa.Column('required', sa.Float(), nullable=False),
+            sa.Column('allocated', sa.Float(), nullable=False),
+            sa.Column('shortage', sa.Float(), nullable=False),
+            sa.Column('computed_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['stock_item_id'], ['stock_item.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['task_id'], ['task.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_material_allocation_item_date', 'material_allocation',
+                        ['stock_item_id', 'need_date'])
+        op.create_index('ix_material_allocation_task_id', 'material_allocation', ['task_id'])
+
+    if not _has_table('notification_archive'):
+        op.create_table(
+            'notification_archive',
+            sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('title', sa.String(length=255), nullable=False),
+            sa.Column('message', sa.Text(), nullable=False),
+            sa.Column('notification_type', sa.String(length=32), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('archived_at', sa.DateTime(), nullable=True),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('stock_item_id', sa.Integer(), nullable=True),
+            sa.Column('task_id', sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_notification_archive_created_at', 'notification_archive', ['created_at'])
+        op.create_index('ix_notification_archive_user_id', 'notification_archive', ['user_id'])
+
+    if not _has_table('job'):
+        op.create_table(
+            'job',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(length=64), nullable=False),
+            sa.Column('payload', sa.Text(), nullable=False),
+            sa.Column('status', sa.String(length=16), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('max_attempts', sa.Integer(), nullable=False),
+            sa.Column('run_at', sa.DateTime(), nullable=False),
+            sa.Column('dedup_key', sa.String(length=128), nullable=True),
+            sa.Column('locked_by', sa.String(length=64), nullable=True),
+            sa.Column('locked_at', sa.DateTime(), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_job_status_run_at', 'job', ['status', 'run_at'])
+        op.create_index('ix_job_dedup_key', 'job', ['dedup_key'])
+        op.create_index('ix_job_finished_at', 'job', ['finished_at'])
+
+    if not _has_table('search_token'):
+        op.create_table(
+            'search_token',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('token', sa.String(length=64), nullable=False),
+            sa.Column('entity_type', sa.String(length=32), nullable=False),
+            sa.Column('entity_id', sa.Integer(), nullable=False),
+            sa.Column('weight', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_search_token_token', 'search_token', ['token', 'entity_type', 'entity_id'])
+        op.create_index('ix_search_token_entity', 'search_token', ['entity_type', 'entity_id'])
+
+    if not _has_table('recent_item'):
+        op.create_table(
+            'recent_item',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('entity_type', sa.String(length=32), nullable=False),
+            sa.Column('entity_id', sa.Integer(), nullable=False),
+            sa.Column('used_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'entity_type', 'entity_id', name='uq_recent_item_entity')
+        )
+        op.create_index('ix_recent_item_user_type_used', 'recent_item', ['user_id', 'entity_type', 'used_at'])
+
+
+def downgrade():
+    for table in ('recent_item', 'search_token', 'job', 'notification_archive',
+                  'material_allocation', 'stock_request', 'stock_snapshot'):
+        if _has_table(table):
+            op.drop_table(table)
+    if _has_column('task_stock_item', 'version'):
+        op.drop_column('task_stock_item', 'version')
+    if _has_column('notification', 'emailed_at'):
+        op.drop_column('notification', 'emailed_at')
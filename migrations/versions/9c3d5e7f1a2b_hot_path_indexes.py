@@ -0,0 +1,87 @@
+"""Index des filtres et tris fréquents
+
+Index composites et couvrants des listes paginées par clé, du calendrier,
+du centre de notifications, du MRP et des compteurs de stock. Un index
+n'est créé que si aucun index existant ne commence par les mêmes colonnes
+(les index de invento_db.sql, nommés idx_*, sont réutilisés).
+
+Revision ID: 9c3d5e7f1a2b
+Revises: 4b1e0c9a2d7f
+Create Date: 2026-10-17 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3d5e7f1a2b'
+down_revision = '4b1e0c9a2d7f'
+branch_labels = None
+depends_on = None
+
+
+# Les composites précèdent les index sur leur première colonne seule, qui
+# deviennent alors inutiles
+INDEXES = (
+    ('stock_item', 'ix_stock_item_category_libelle', ['category_id', 'libelle']),
+    ('stock_item', 'ix_stock_item_supplier_libelle', ['supplier_id', 'libelle']),
+    ('stock_item', 'ix_stock_item_min_quantity', ['min_quantity', 'quantity']),
+    ('stock_item', 'ix_stock_item_libelle', ['libelle']),
+    ('stock_movement', 'ix_stock_movement_item_date', ['stock_item_id', 'movement_date']),
+    ('stock_movement', 'ix_stock_movement_movement_date', ['movement_date']),
+    ('personnel', 'ix_personnel_name', ['last_name', 'first_name']),
+    ('personnel', 'ix_personnel_department_last_name', ['department', 'last_name']),
+    ('personnel', 'ix_personnel_active_last_name', ['is_active', 'last_name']),
+    ('personnel', 'ix_personnel_first_name', ['first_name']),
+    ('client', 'ix_client_active_name', ['is_active', 'name']),
+    ('client', 'ix_client_name', ['name']),
+    ('project', 'ix_project_status_start', ['status', 'start_date']),
+    ('project', 'ix_project_priority', ['priority']),
+    ('project', 'ix_project_start_date', ['start_date']),
+    ('project', 'ix_project_client_id', ['client_id']),
+    ('project', 'ix_project_name', ['name']),
+    ('task', 'ix_task_project_id_status', ['project_id', 'status']),
+    ('task', 'ix_task_start_end', ['start_date', 'end_date']),
+    ('task', 'ix_task_status_start', ['status', 'start_date']),
+    ('task', 'ix_task_status_end', ['status', 'end_date']),
+    ('task', 'ix_task_name', ['name']),
+    ('notification', 'ix_notification_user_read_created', ['user_id', 'is_read', 'created_at', 'id']),
+    ('notification', 'ix_notification_user_created', ['user_id', 'created_at', 'id']),
+    ('notification', 'ix_notification_read_created', ['is_read', 'created_at']),
+    ('intervention', 'ix_intervention_status_date', ['status', 'intervention_date']),
+    ('intervention', 'ix_intervention_type_date', ['type_id', 'intervention_date']),
+    ('intervention', 'ix_intervention_intervention_date', ['intervention_date']),
+    ('equipment', 'ix_equipment_status_reference', ['status', 'reference']),
+    ('equipment', 'ix_equipment_category_reference', ['category_id', 'reference']),
+    ('equipment', 'ix_equipment_name', ['name']),
+)
+
+
+def _existing(table):
+    """Listes de colonnes des index, contraintes uniques et clé primaire"""
+    inspector = sa.inspect(op.get_bind())
+    existing = [index['column_names'] for index in inspector.get_indexes(table)]
+    existing += [unique['column_names'] for unique in inspector.get_unique_constraints(table)]
+    existing.append(inspector.get_pk_constraint(table)['constrained_columns'])
+    return existing
+
+
+def _covered(table, columns):
+    return any(found[:len(columns)] == columns for found in _existing(table))
+
+
+def _index_names(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    for table, name, columns in INDEXES:
+        if not _covered(table, columns):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for table, name, columns in reversed(INDEXES):
+        if name in _index_names(table):
+            op.drop_index(name, table_name=table)
@@ -80,9 +80,48 @@ $(document).ready(function() {
         setInterval(checkStockAlerts, 300000); // Every 5 minutes
     }
     
+    // Sélecteurs avec autocomplétion (/api/typeahead/<source>)
+    if ($.fn.select2) {
+        $('select[data-typeahead]').each(function() {
+            var $select = $(this);
+            var cursors = {};
+            $select.select2({
+                theme: 'bootstrap-5',
+                width: '100%',
+                placeholder: $select.data('placeholder') || 'Rechercher...',
+                allowClear: !$select.prop('multiple'),
+                ajax: {
+                    url: '/api/typeahead/' + $select.data('typeahead'),
+                    dataType: 'json',
+                    delay: 250,
+                    data: function(params) {
+                        var term = params.term || '';
+                        var query = { q: term };
+                        if ((params.page || 1) > 1 && cursors[term]) {
+                            query.cursor = cursors[term];
+                        }
+                        return query;
+                    },
+                    processResults: function(data, params) {
+                        cursors[params.term || ''] = data.next_cursor;
+                        return {
+                            results: data.items.map(function(item) {
+                                return {
+                                    id: item.id,
+                                    text: item.label + (item.sublabel ? ' — ' + item.sublabel : '')
+                                };
+                            }),
+                            pagination: { more: !!data.next_cursor }
+                        };
+                    }
+                }
+            });
+        });
+    }
+    
     // Initialize Select2
     if ($.fn.select2) {
-        $('.select2').select2({
+        $('.select2').not('[data-typeahead]').select2({
             theme: 'bootstrap-5',
             width: '100%',
             placeholder: 'Sélectionner...',
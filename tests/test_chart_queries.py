@@ -0,0 +1,12 @@
+from app.dashboard.benchmark import measure_providers, seed_benchmark_data
+from app.dashboard.charts import CHART_PROVIDERS
+
+
+def test_chart_providers_stay_within_their_query_budget(db):
+    seed_benchmark_data(db, rows=40)
+
+    results = measure_providers(db)
+
+    assert results
+    assert {result['source'] for result in results} == set(CHART_PROVIDERS)
+    assert [(r['source'], r['queries'], r['budget']) for r in results if not r['ok']] == []
@@ -0,0 +1,82 @@
+from datetime import datetime, time, timedelta
+
+from app.models import StockItem, StockMovement, StockSnapshot
+from app.stock.history import end_of_day, level_series, levels_at
+
+
+def _item(db, reference, quantity, created_at, price=1.0):
+    item = StockItem(reference=reference, libelle=reference, item_type='piece',
+                     quantity=quantity, price=price, value=quantity * price, created_at=created_at)
+    db.session.add(item)
+    db.session.commit()
+    return item
+
+
+def _expected(start, days):
+    return [round(sum(level['value'] for level in levels_at(end_of_day(start + timedelta(days=k))).values()), 2)
+            for k in range(days)]
+
+
+def test_level_series_includes_items_created_in_range(db):
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=7)
+    _item(db, 'A', 10, datetime.combine(start - timedelta(days=30), time(8)))
+    _item(db, 'B', 10, datetime.combine(start + timedelta(days=3), time(9)))
+
+    series = level_series(start, today - timedelta(days=1))
+
+    assert [point['value'] for point in series] == [10.0, 10.0, 10.0, 20.0, 20.0, 20.0, 20.0]
+    assert [point['value'] for point in series] == _expected(start, 7)
+
+
+def test_level_series_opening_level_excludes_same_day_movements(db):
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=5)
+    created = datetime.combine(start + timedelta(days=2), time(9))
+    item = _item(db, 'C', 6, created)
+    db.session.add(StockMovement(stock_item_id=item.id, movement_type='sale', quantity=4,
+                                 movement_date=created + timedelta(hours=2)))
+    db.session.add(StockMovement(stock_item_id=item.id, movement_type='purchase', quantity=3,
+                                 movement_date=created + timedelta(days=1)))
+    db.session.commit()
+
+    series = level_series(start, today - timedelta(days=1), item_id=item.id)
+
+    assert [point['quantity'] for point in series] == [0.0, 0.0, 3.0, 6.0, 6.0]
+
+
+def test_level_series_includes_items_created_after_the_days_snapshot(db):
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=4)
+    _item(db, 'A', 10, datetime.combine(start - timedelta(days=30), time(8)))
+    taken_at = datetime.combine(start + timedelta(days=1), time(12))
+    for item_id, level in levels_at(taken_at).items():
+        db.session.add(StockSnapshot(stock_item_id=item_id, snapshot_date=taken_at.date(), taken_at=taken_at,
+                                     quantity=level['quantity'], price=level['price'], value=level['value']))
+    db.session.commit()
+    _item(db, 'B', 5, taken_at + timedelta(hours=2))
+
+    series = level_series(start, today - timedelta(days=1))
+
+    assert [point['value'] for point in series] == [10.0, 15.0, 15.0, 15.0]
+    assert [point['value'] for point in series] == _expected(start, 4)
+
+
+def test_levels_ignore_adjustments_and_replay_corrections(db):
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=3)
+    created = datetime.combine(start - timedelta(days=10), time(8))
+    item = _item(db, 'D', 7, created)
+    # Ajustement saisi avant les corrections signées : sans effet sur la quantité
+    db.session.add(StockMovement(stock_item_id=item.id, movement_type='adjustment', quantity=5,
+                                 movement_date=datetime.combine(start, time(10))))
+    db.session.add(StockMovement(stock_item_id=item.id, movement_type='correction', quantity=-3,
+                                 movement_date=datetime.combine(start + timedelta(days=1), time(10))))
+    db.session.commit()
+
+    assert levels_at(datetime.combine(start, time(12)))[item.id]['quantity'] == 10.0
+    assert levels_at(end_of_day(start + timedelta(days=1)))[item.id]['quantity'] == 7.0
+
+    series = level_series(start, today - timedelta(days=1), item_id=item.id)
+
+    assert [point['quantity'] for point in series] == [10.0, 7.0, 7.0]
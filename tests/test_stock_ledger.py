@@ -0,0 +1,112 @@
+import pytest
+
+from app.models import StockItem, StockMovement, StockRequest
+from app.stock.ledger import InsufficientStockError, StockLedgerError, _apply_deltas, apply_movements
+
+
+def _item(db, reference, quantity, price=2.0):
+    item = StockItem(reference=reference, libelle=reference, item_type='piece',
+                     quantity=quantity, price=price, value=quantity * price)
+    db.session.add(item)
+    db.session.commit()
+    return item
+
+
+def _quantity(db, item_id):
+    return db.session.get(StockItem, item_id).quantity
+
+
+def _movement_count(db):
+    return db.session.query(StockMovement).count()
+
+
+def test_conditional_update_refuses_outflow_beyond_stock(db):
+    item = _item(db, 'A', 2)
+
+    assert _apply_deltas({item.id: -5.0}) is False
+    db.session.expire_all()
+    assert _quantity(db, item.id) == 2
+
+    assert _apply_deltas({item.id: -2.0}) is True
+    db.session.expire_all()
+    item = db.session.get(StockItem, item.id)
+    assert item.quantity == 0
+    assert item.value == 0
+
+
+def test_movements_on_one_item_are_netted(db):
+    item = _item(db, 'A', 2)
+
+    result = apply_movements([
+        {'stock_item_id': item.id, 'movement_type': 'purchase', 'quantity': 3},
+        {'stock_item_id': item.id, 'movement_type': 'sale', 'quantity': 4},
+    ])
+
+    assert result['quantities'] == {str(item.id): 1.0}
+    assert len(result['movements']) == 2
+    assert _quantity(db, item.id) == 1
+    assert db.session.get(StockItem, item.id).value == 2.0
+
+
+def test_insufficient_stock_rolls_back_the_whole_batch(db):
+    plenty = _item(db, 'A', 10)
+    scarce = _item(db, 'B', 1)
+    other = _item(db, 'C', 5)
+    other.notes = 'modifié avant le lot'
+
+    with pytest.raises(InsufficientStockError) as excinfo:
+        apply_movements([
+            {'stock_item_id': plenty.id, 'movement_type': 'sale', 'quantity': 3},
+            {'stock_item_id': scarce.id, 'movement_type': 'sale', 'quantity': 2},
+        ], commit=False)
+
+    assert [(s['stock_item_id'], s['needed'], s['available']) for s in excinfo.value.shortages] == \
+        [(scarce.id, 2.0, 1.0)]
+    # Seul le point de sauvegarde est annulé : la transaction de l'appelant reste utilisable
+    db.session.commit()
+    db.session.expire_all()
+    assert _quantity(db, plenty.id) == 10
+    assert _quantity(db, scarce.id) == 1
+    assert db.session.get(StockItem, other.id).notes == 'modifié avant le lot'
+    assert _movement_count(db) == 0
+
+
+def test_idempotent_replay_returns_the_stored_result(db):
+    item = _item(db, 'A', 5)
+    movement = {'stock_item_id': item.id, 'movement_type': 'sale', 'quantity': 2}
+
+    first = apply_movements([movement], user_id=1, idempotency_key='k-1')
+    replay = apply_movements([movement], user_id=1, idempotency_key='k-1')
+
+    assert first['replayed'] is False
+    assert replay['replayed'] is True
+    assert replay['movements'] == first['movements']
+    assert _quantity(db, item.id) == 3
+    assert _movement_count(db) == 1
+    assert db.session.query(StockRequest).count() == 1
+
+
+def test_idempotency_key_reused_for_another_request_is_refused(db):
+    item = _item(db, 'A', 5)
+    apply_movements([{'stock_item_id': item.id, 'movement_type': 'sale', 'quantity': 2}],
+                    user_id=1, idempotency_key='k-1')
+
+    with pytest.raises(StockLedgerError):
+        apply_movements([{'stock_item_id': item.id, 'movement_type': 'sale', 'quantity': 1}],
+                        user_id=1, idempotency_key='k-1')
+
+    assert _quantity(db, item.id) == 3
+    assert _movement_count(db) == 1
+
+
+def test_corrections_are_signed_and_internal_only(db):
+    item = _item(db, 'A', 5)
+    correction = {'stock_item_id': item.id, 'movement_type': 'correction', 'quantity': -2}
+
+    with pytest.raises(StockLedgerError):
+        apply_movements([correction])
+    apply_movements([correction], internal=True)
+    apply_movements([{'stock_item_id': item.id, 'movement_type': 'adjustment', 'quantity': 4}])
+
+    assert _quantity(db, item.id) == 3
+    assert _movement_count(db) == 2